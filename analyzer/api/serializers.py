@@ -63,6 +63,8 @@ class AnalysisHistoryDetailSerializer(serializers.ModelSerializer):
     share_url = serializers.CharField(source='get_share_url', read_only=True)
     age_in_days = serializers.IntegerField(read_only=True)
     is_recent = serializers.BooleanField(read_only=True)
+    # La descripción puede estar en el snapshot compartido del producto
+    product_description = serializers.CharField(source='get_product_description', read_only=True)
     
     class Meta:
         model = AnalysisHistory
@@ -210,7 +212,7 @@ class AnalysisHistoryViewSet(viewsets.ReadOnlyModelViewSet):
     
     # Filtros disponibles
     filterset_fields = ['platform', 'analysis_type', 'success', 'is_public']
-    search_fields = ['product_title', 'product_description', 'target_audience']
+    search_fields = ['product_title', 'product_description', 'product_snapshot__description', 'target_audience']
     ordering_fields = ['created_at', 'views_count', 'quality_score']
     ordering = ['-created_at']
     
@@ -336,35 +338,20 @@ class AnalysisCreateAPIView(APIView):
             )
         
         try:
-            # Procesar análisis
-            from analyzer.views import AffiliateStrategistView
-            from django.http import HttpRequest
-            
-            # Simular request POST
-            analysis_request = HttpRequest()
-            analysis_request.method = 'POST'
-            analysis_request.user = request.user
-            analysis_request.POST = serializer.validated_data
-            
-            # Usar la vista existente para procesar
-            view = AffiliateStrategistView()
-            
-            if serializer.validated_data['analysis_type'] == 'competitive':
-                response = view.competitive_analysis(analysis_request)
-            else:
-                response = view.basic_analysis(analysis_request)
-            
-            # Convertir JsonResponse a Response de DRF
-            response_data = json.loads(response.content)
-            
-            if response_data.get('success'):
-                return Response(response_data, status=status.HTTP_201_CREATED)
-            else:
-                return Response(
-                    response_data, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-                
+            # Mismo pipeline que la web: cache de resultados, single-flight y cola justa
+            from analyzer.pipeline import build_analysis_params, run_analysis_pipeline
+
+            data = serializer.validated_data
+            params = build_analysis_params(data)
+            # La API recibe competitor_urls como lista (el formulario usa competitor_N)
+            params['competitor_urls'] = data.get('competitor_urls', [])
+
+            result = run_analysis_pipeline(params, user_id=request.user.id)
+            http_status = result.pop('status', status.HTTP_500_INTERNAL_SERVER_ERROR)
+            if result.get('success'):
+                return Response(result, status=status.HTTP_201_CREATED)
+            return Response(result, status=http_status)
+
         except Exception as e:
             logger.error(f"API analysis error: {str(e)}")
             return Response(
@@ -0,0 +1,42 @@
+# analyzer/benchmarks/legacy.py
+
+import re
+
+from bs4 import BeautifulSoup
+
+# Extractor anterior (árbol completo + búsqueda de texto), conservado solo
+# como referencia para los benchmarks.
+PRICE_PATTERN = re.compile(r'\$[\d,]+\.?\d*')
+
+
+def legacy_extract_product_data(content):
+    soup = BeautifulSoup(content, 'html.parser')
+
+    product_data = {
+        'title': '',
+        'description': '',
+        'price': ''
+    }
+
+    # Buscar titulo
+    title = soup.find('h1')
+    if title:
+        product_data['title'] = title.text.strip()
+    else:
+        meta_title = soup.find('meta', {'property': 'og:title'})
+        if meta_title:
+            product_data['title'] = meta_title.get('content', '')
+
+    # Buscar precio
+    price_text = soup.find(text=PRICE_PATTERN)
+    if price_text:
+        match = PRICE_PATTERN.search(price_text)
+        if match:
+            product_data['price'] = match.group()
+
+    # Buscar descripcion
+    meta_desc = soup.find('meta', {'name': 'description'})
+    if meta_desc:
+        product_data['description'] = meta_desc.get('content', '')
+
+    return product_data
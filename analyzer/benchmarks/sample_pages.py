@@ -0,0 +1,86 @@
+# analyzer/benchmarks/sample_pages.py
+
+import json
+
+_FILLER = '<div class="review"><p>Muy buen producto, llegó a tiempo y funciona bien.</p></div>\n'
+_NAV = '<li><a href="/cat/{i}">Categoría {i}</a></li>\n'
+
+
+def _page(head='', body='', filler=0):
+    nav = ''.join(_NAV.format(i=i) for i in range(40))
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8">'
+        f'<title>Tienda</title>{head}</head><body><nav><ul>{nav}</ul></nav>'
+        f'{body}{_FILLER * filler}</body></html>'
+    )
+
+
+def _json_ld(name, price, currency, description=''):
+    data = {
+        '@context': 'https://schema.org',
+        '@type': 'Product',
+        'name': name,
+        'description': description,
+        'offers': {'@type': 'Offer', 'price': price, 'priceCurrency': currency},
+    }
+    return f'<script type="application/ld+json">{json.dumps(data)}</script>'
+
+
+def build_sample_pages():
+    """
+    Páginas sintéticas con las estructuras más comunes de tiendas reales.
+    Cada entrada: (nombre, html, datos esperados).
+    """
+    script_noise = '<script>var promo = "$9.99"; ' + 'var x = 1;' * 2000 + '</script>'
+    return [
+        (
+            'json_ld',
+            _page(
+                head='<meta name="description" content="Auriculares inalámbricos">'
+                + _json_ld('Auriculares X', '59.90', 'USD'),
+                body='<h1>Auriculares X</h1><p>Envío gratis</p>',
+                filler=200,
+            ),
+            {'title': 'Auriculares X', 'description': 'Auriculares inalámbricos', 'price': '$59.90'},
+        ),
+        (
+            'open_graph',
+            _page(
+                head='<meta property="og:title" content="Cafetera Pro">'
+                '<meta property="og:price:amount" content="129.00">'
+                '<meta property="og:price:currency" content="EUR">'
+                '<meta name="description" content="Cafetera espresso">',
+                body='<h1>Cafetera Pro</h1>',
+                filler=200,
+            ),
+            {'title': 'Cafetera Pro', 'description': 'Cafetera espresso', 'price': '€129.00'},
+        ),
+        (
+            'microdata',
+            _page(
+                head='<meta name="description" content="Zapatillas running">',
+                body='<div itemscope itemtype="https://schema.org/Product"><h1 itemprop="name">Zapatillas Run</h1>'
+                '<span itemprop="price" content="89.99">$89.99</span>'
+                '<meta itemprop="priceCurrency" content="USD"></div>',
+                filler=200,
+            ),
+            {'title': 'Zapatillas Run', 'description': 'Zapatillas running', 'price': '$89.99'},
+        ),
+        (
+            'text_price_large',
+            _page(
+                head='<meta name="description" content="Monitor 27 pulgadas">' + script_noise,
+                body='<h1>Monitor 27"</h1>' + _FILLER * 3000 + '<p class="price">$1,299.50</p>',
+            ),
+            {'title': 'Monitor 27"', 'description': 'Monitor 27 pulgadas', 'price': '$1,299.50'},
+        ),
+        (
+            'text_price_euro',
+            _page(
+                head='<meta name="description" content="Lámpara LED">',
+                body='<h1>Lámpara LED</h1><p>Precio: 24,95 €</p>',
+                filler=200,
+            ),
+            {'title': 'Lámpara LED', 'description': 'Lámpara LED', 'price': '24,95 €'},
+        ),
+    ]
@@ -0,0 +1,134 @@
+# analyzer/benchmarks/scraping.py
+
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from analyzer.conf import app_setting
+from analyzer.utils.page_cache import product_page_cache
+from analyzer.utils.scraping import scrape_product_info
+from analyzer.utils.timing import percentile
+
+from .server import CorpusServer, load_corpus
+
+FIELDS = ('title', 'price', 'description')
+
+# Métricas comparables con un baseline: True = más alto es mejor
+COMPARED_METRICS = {
+    'pages_per_sec': True,
+    'p50_ms': False,
+    'p99_ms': False,
+    'peak_rss_mb': False,
+    'accuracy': True,
+}
+
+# Diferencias de latencia menores a esto se consideran ruido
+LATENCY_NOISE_MS = 5
+
+
+def _peak_rss_mb():
+    """Pico de memoria residente del proceso (ru_maxrss es KB en Linux y bytes en macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _latency_summary(latencies_ms):
+    values = sorted(latencies_ms)
+    return {
+        'p50_ms': round(percentile(values, 0.50), 2),
+        'p99_ms': round(percentile(values, 0.99), 2),
+    }
+
+
+def run_scraping_benchmark(corpus_dir=None, iterations=5, concurrency=4):
+    """
+    Scrapea el corpus `iterations` veces contra el servidor local y retorna
+    throughput, latencias, pico de RSS y precisión por campo.
+    """
+    pages = load_corpus(corpus_dir)
+    latencies = {page['name']: [] for page in pages}
+    results = {}
+    errors = 0
+
+    def scrape(page, url):
+        started = time.perf_counter()
+        result = scrape_product_info(url)
+        return page, result, (time.perf_counter() - started) * 1000
+
+    with CorpusServer(pages) as server:
+        # Sin validadores HTTP el cache de páginas no aplica, pero se limpia por si acaso
+        product_page_cache.clear()
+        jobs = [(page, server.url_for(page['name'])) for _ in range(iterations) for page in pages]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for page, result, elapsed_ms in executor.map(lambda job: scrape(*job), jobs):
+                latencies[page['name']].append(elapsed_ms)
+                if not result.get('success'):
+                    errors += 1
+                results.setdefault(page['name'], result)
+        wall_seconds = time.perf_counter() - started
+
+    field_hits = {field: 0 for field in FIELDS}
+    page_reports = {}
+    for page in pages:
+        result = results[page['name']]
+        data = result.get('data', {})
+        correct = [field for field in FIELDS if data.get(field) == page['expected'].get(field)]
+        for field in correct:
+            field_hits[field] += 1
+        page_reports[page['name']] = {
+            'bytes': len(page['body']),
+            'bytes_read': result.get('bytes_read'),
+            **_latency_summary(latencies[page['name']]),
+            'correct_fields': correct,
+            'data': data,
+        }
+
+    all_latencies = [ms for values in latencies.values() for ms in values]
+    field_accuracy = {field: round(hits / len(pages), 4) for field, hits in field_hits.items()}
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'streaming': app_setting('SCRAPING_STREAMING', True),
+            'max_bytes': app_setting('SCRAPING_MAX_BYTES', 512 * 1024),
+        },
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'requests': len(all_latencies),
+        'errors': errors,
+        'pages_per_sec': round(len(all_latencies) / wall_seconds, 2) if wall_seconds else None,
+        **_latency_summary(all_latencies),
+        'peak_rss_mb': _peak_rss_mb(),
+        'accuracy': round(sum(field_accuracy.values()) / len(FIELDS), 4),
+        'field_accuracy': field_accuracy,
+        'pages': page_reports,
+    }
+
+
+def compare_with_baseline(report, baseline, tolerance=0.3):
+    """
+    Diferencias contra un baseline. Una métrica es regresión si empeora más
+    que `tolerance` (fracción); la precisión no admite ninguna caída y en
+    latencia se ignoran diferencias menores a LATENCY_NOISE_MS.
+    """
+    comparison = {}
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        current, previous = report.get(metric), baseline.get(metric)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        allowed = 0 if metric == 'accuracy' else tolerance
+        regression = worse > allowed
+        if metric.endswith('_ms') and abs(current - previous) < LATENCY_NOISE_MS:
+            regression = False
+        comparison[metric] = {
+            'baseline': previous,
+            'current': current,
+            'change': round(change, 4),
+            'regression': regression,
+        }
+    return comparison
@@ -0,0 +1,105 @@
+# analyzer/benchmarks/server.py
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+CORPUS_DIR = Path(__file__).resolve().parent / 'corpus'
+
+FILLER_MARKER = '<!--filler-->'
+FILLER_BLOCK = (
+    '<div class="review"><span class="stars">4/5</span>'
+    '<p>Buen producto, llegó a tiempo. Lo recomiendo para uso diario.</p></div>\n'
+)
+TRICKLE_CHUNK_SIZE = 4 * 1024
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # El scraper en modo streaming cierra la conexión al tener los campos
+        pass
+
+
+def load_corpus(corpus_dir=None):
+    """
+    Páginas del corpus según manifest.json, con el HTML ya expandido.
+    Cada página: {'name', 'body', 'expected', 'delay_ms', 'chunk_delay_ms'}.
+    """
+    corpus_dir = Path(corpus_dir or CORPUS_DIR)
+    manifest = json.loads((corpus_dir / 'manifest.json').read_text(encoding='utf-8'))
+    pages = []
+    for entry in manifest['pages']:
+        html = (corpus_dir / entry['file']).read_text(encoding='utf-8')
+        filler_kb = entry.get('filler_kb', 0)
+        filler = FILLER_BLOCK * (filler_kb * 1024 // len(FILLER_BLOCK)) if filler_kb else ''
+        pages.append({
+            'name': entry['name'],
+            'body': html.replace(FILLER_MARKER, filler).encode('utf-8'),
+            'expected': entry.get('expected', {}),
+            'delay_ms': entry.get('delay_ms', 0),
+            'chunk_delay_ms': entry.get('chunk_delay_ms', 0),
+        })
+    return pages
+
+
+class CorpusServer:
+    """
+    Servidor HTTP local que sirve el corpus en /<nombre>. Las páginas lentas
+    esperan `delay_ms` antes de responder y envían el cuerpo en fragmentos
+    de 4 KB separados por `chunk_delay_ms`.
+    """
+
+    def __init__(self, pages):
+        self.pages = {page['name']: page for page in pages}
+        pages_by_path = {f"/{name}": page for name, page in self.pages.items()}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                page = pages_by_path.get(self.path)
+                if page is None:
+                    self.send_error(404)
+                    return
+                if page['delay_ms']:
+                    time.sleep(page['delay_ms'] / 1000)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(page['body'])))
+                self.end_headers()
+                try:
+                    for start in range(0, len(page['body']), TRICKLE_CHUNK_SIZE):
+                        self.wfile.write(page['body'][start:start + TRICKLE_CHUNK_SIZE])
+                        if page['chunk_delay_ms']:
+                            self.wfile.flush()
+                            time.sleep(page['chunk_delay_ms'] / 1000)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = _QuietHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url_for(self, name):
+        return f"{self.base_url}/{name}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -8,6 +8,17 @@ from datetime import timedelta
 import hashlib
 import json
 import logging
+import math
+import random
+import time
+import uuid
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from .conf import app_setting
+from .utils.cache_tags import get_generations, invalidate_tag, tagged_key
+from .utils.near_cache import near_cache
+from .utils.url_normalization import normalize_product_url
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +33,18 @@ class CacheManager:
         'platform_stats': 7200,       # 2 horas
         'templates': 21600,            # 6 horas
         'similar_analysis': 43200,     # 12 horas
+        'product_summary': 259200,     # 72 horas
+    }
+    
+    # ✅ TTL DEL CACHE NEGATIVO DE SCRAPING POR TIPO DE ERROR (segundos)
+    SCRAPE_FAILURE_TIMEOUTS = {
+        'timeout': 120,
+        'dns': 600,
+        'connection': 60,
+        'rate_limited': 120,
+        'http_4xx': 600,    # 404/410: la URL no existe, no cambia pronto
+        'http_5xx': 60,
+        'other': 30,
     }
     
     # ✅ PREFIJOS PARA ORGANIZAR KEYS
@@ -48,9 +71,21 @@ class CacheManager:
         
         return ':'.join(key_parts)
     
+    @classmethod
+    def get_analysis_timeout(cls):
+        """TTL del cache de análisis (CACHE_ANALYSIS_HOURS en settings)"""
+        hours = app_setting('CACHE_ANALYSIS_HOURS')
+        if hours is None:
+            return cls.CACHE_TIMEOUTS['analysis_result']
+        return int(float(hours) * 3600)
+    
     @classmethod
     def cache_analysis_result(cls, analysis_params, result):
         """Cachea resultado de análisis para evitar duplicados"""
+        timeout = cls.get_analysis_timeout()
+        if timeout <= 0:
+            return None
+        
         # Crear hash único de los parámetros de análisis
         cache_key = cls._generate_analysis_hash(analysis_params)
         full_key = cls.get_cache_key('analysis', cache_key)
@@ -58,48 +93,146 @@ class CacheManager:
         cache_data = {
             'result': result,
             'cached_at': timezone.now().isoformat(),
-            'params': analysis_params
+            # Solo los parámetros que definen el análisis (nunca la API key)
+            'params': cls._analysis_key_params(analysis_params)
         }
         
-        cache.set(
-            full_key, 
-            cache_data, 
-            cls.CACHE_TIMEOUTS['analysis_result']
-        )
+        cache.set(full_key, cache_data, timeout)
         
         logger.info(f"🔄 Cached analysis result: {full_key}")
         return full_key
     
     @classmethod
-    def get_cached_analysis(cls, analysis_params):
+    def get_cached_analysis(cls, analysis_params, record_stats=True):
         """Busca análisis similar en cache"""
+        if cls.get_analysis_timeout() <= 0:
+            return None
+        
         cache_key = cls._generate_analysis_hash(analysis_params)
         full_key = cls.get_cache_key('analysis', cache_key)
         
         cached_data = cache.get(full_key)
         if cached_data:
             logger.info(f"✅ Cache hit for analysis: {full_key}")
+            if record_stats:
+                saved = (cached_data.get('result') or {}).get('generation_seconds') or 0
+                cls.record_analysis_cache_event('hit', saved_seconds=saved)
             return cached_data
         
+        if record_stats:
+            cls.record_analysis_cache_event('miss')
         return None
     
     @classmethod
-    def _generate_analysis_hash(cls, params):
-        """Genera hash único para parámetros de análisis"""
-        # Extraer parámetros clave que definen un análisis único
-        key_params = {
-            'product_url': params.get('product_url', ''),
-            'platform': params.get('platform', ''),
-            'target_audience': params.get('target_audience', ''),
+    def _analysis_key_params(cls, params):
+        """Parámetros clave que definen un análisis único"""
+        return {
+            'product_url': normalize_product_url(params.get('product_url', '')),
+            'platform': (params.get('platform') or '').lower(),
+            'target_audience': (params.get('target_audience') or '').strip().lower(),
             'analysis_type': params.get('analysis_type', 'basic'),
             'campaign_goal': params.get('campaign_goal', ''),
             'tone': params.get('tone', ''),
+            # Solo si hay competidores: no cambia la clave de los demás análisis
+            **({'competitor_urls': [normalize_product_url(url) for url in params['competitor_urls']]}
+               if params.get('competitor_urls') else {}),
         }
+    
+    @classmethod
+    def _generate_analysis_hash(cls, params):
+        """Genera hash único para parámetros de análisis"""
+        key_params = cls._analysis_key_params(params)
         
         # Crear hash MD5 de los parámetros clave
         params_str = json.dumps(key_params, sort_keys=True)
         return hashlib.md5(params_str.encode()).hexdigest()
     
+    # ✅ CONTADORES COMPARTIDOS (visibles desde todos los workers)
+    ANALYSIS_CACHE_COUNTERS = {
+        'hits': 'stats:analysis_cache:hits',
+        'misses': 'stats:analysis_cache:misses',
+        'coalesced': 'stats:analysis_cache:coalesced',
+        'saved_ms': 'stats:analysis_cache:saved_ms',
+        'summary_hits': 'stats:analysis_cache:summary_hits',
+        'summary_misses': 'stats:analysis_cache:summary_misses',
+    }
+    
+    SCRAPE_FAILURE_COUNTERS = {
+        'negative_hits': 'stats:scraping:negative_hits',
+        'backoff_rejections': 'stats:scraping:backoff_rejections',
+    }
+    
+    @classmethod
+    def incr_counter(cls, key, delta=1):
+        """Incrementa un contador en el cache compartido (sin expiración)"""
+        try:
+            cache.add(key, 0, None)
+            return cache.incr(key, delta)
+        except Exception as e:
+            logger.debug(f"No se pudo incrementar {key}: {str(e)}")
+            return None
+    
+    @classmethod
+    def record_analysis_cache_event(cls, event, saved_seconds=0):
+        """Registra hit/miss/coalesced del cache de análisis y la latencia de IA ahorrada"""
+        counter = {'hit': 'hits', 'miss': 'misses'}.get(event, event)
+        cls.incr_counter(cls.ANALYSIS_CACHE_COUNTERS[counter])
+        if event in ('hit', 'coalesced') and saved_seconds:
+            cls.incr_counter(cls.ANALYSIS_CACHE_COUNTERS['saved_ms'], int(saved_seconds * 1000))
+    
+    @classmethod
+    def get_analysis_cache_stats(cls):
+        """Hits, misses y llamadas/latencia de proveedor ahorradas"""
+        values = cache.get_many(list(cls.ANALYSIS_CACHE_COUNTERS.values()))
+        hits = values.get(cls.ANALYSIS_CACHE_COUNTERS['hits'], 0)
+        misses = values.get(cls.ANALYSIS_CACHE_COUNTERS['misses'], 0)
+        lookups = hits + misses
+        coalesced = values.get(cls.ANALYSIS_CACHE_COUNTERS['coalesced'], 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'coalesced': coalesced,
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0,
+            'provider_calls_saved': hits + coalesced,
+            'provider_seconds_saved': round(values.get(cls.ANALYSIS_CACHE_COUNTERS['saved_ms'], 0) / 1000, 2),
+            'summary_hits': values.get(cls.ANALYSIS_CACHE_COUNTERS['summary_hits'], 0),
+            'summary_misses': values.get(cls.ANALYSIS_CACHE_COUNTERS['summary_misses'], 0),
+        }
+    
+    # ✅ RESUMEN DEL PRODUCTO (etapa 1 del modo staged), compartido entre audiencias y plataformas
+    @classmethod
+    def get_product_summary_timeout(cls):
+        """TTL del resumen de producto (PRODUCT_SUMMARY_CACHE_HOURS en settings)"""
+        hours = app_setting('PRODUCT_SUMMARY_CACHE_HOURS')
+        if hours is None:
+            return cls.CACHE_TIMEOUTS['product_summary']
+        return int(hours * 3600)
+    
+    @classmethod
+    def get_product_summary_key(cls, url):
+        """Clave por URL normalizada: variantes con tracking comparten resumen"""
+        url_hash = hashlib.sha256(normalize_product_url(url).encode()).hexdigest()[:32]
+        return cls.get_cache_key('product_summary', url_hash)
+    
+    @classmethod
+    def cache_product_summary(cls, url, summary):
+        """Cachea el resumen del producto; el backend lo desaloja al expirar o al llenarse"""
+        timeout = cls.get_product_summary_timeout()
+        if timeout <= 0:
+            return None
+        cache_key = cls.get_product_summary_key(url)
+        cache.set(cache_key, summary, timeout)
+        logger.info(f"🔄 Cached product summary: {url}")
+        return cache_key
+    
+    @classmethod
+    def get_cached_product_summary(cls, url, record_stats=True):
+        """Obtiene el resumen del producto del cache"""
+        summary = cache.get(cls.get_product_summary_key(url))
+        if record_stats:
+            cls.incr_counter(cls.ANALYSIS_CACHE_COUNTERS['summary_hits' if summary else 'summary_misses'])
+        return summary
+    
     @classmethod
     def cache_product_info(cls, url, product_data):
         """Cachea información de producto"""
@@ -127,15 +260,96 @@ class CacheManager:
         
         return cached_data
     
+    # ✅ CACHE NEGATIVO: fallos recientes de scraping por URL
+    @classmethod
+    def get_scrape_failure_timeout(cls, error_type):
+        """TTL del fallo (SCRAPING_NEGATIVE_CACHE_SECONDS en settings sobrescribe por tipo)"""
+        timeouts = {**cls.SCRAPE_FAILURE_TIMEOUTS, **(app_setting('SCRAPING_NEGATIVE_CACHE_SECONDS') or {})}
+        return timeouts.get(error_type, timeouts['other'])
+    
+    @classmethod
+    def cache_product_failure(cls, url, result):
+        """Guarda un scraping fallido unos segundos para no repetir la descarga"""
+        error_type = result.get('error_type') or 'other'
+        timeout = cls.get_scrape_failure_timeout(error_type)
+        if timeout <= 0:
+            return None
+        url_hash = hashlib.md5(url.encode()).hexdigest()
+        cache_key = cls.get_cache_key('product_failure', url_hash)
+        cache.set(cache_key, {**result, 'failed_at': time.time()}, timeout)
+        logger.info(f"🚫 Cached scraping failure ({error_type}, {timeout}s): {url}")
+        return cache_key
+    
+    @classmethod
+    def get_cached_product_failure(cls, url):
+        """Fallo reciente de la URL (con 'negative_cached': True) o None"""
+        url_hash = hashlib.md5(url.encode()).hexdigest()
+        failure = cache.get(cls.get_cache_key('product_failure', url_hash))
+        if not failure:
+            return None
+        cls.incr_counter(cls.SCRAPE_FAILURE_COUNTERS['negative_hits'])
+        return {**failure, 'negative_cached': True}
+    
+    @classmethod
+    def get_scrape_failure_stats(cls):
+        """Descargas evitadas por el cache negativo y por el backoff de hosts"""
+        values = cache.get_many(list(cls.SCRAPE_FAILURE_COUNTERS.values()))
+        return {
+            name: values.get(key, 0)
+            for name, key in cls.SCRAPE_FAILURE_COUNTERS.items()
+        }
+    
+    @classmethod
+    def get_product_page_stats(cls):
+        """Revalidaciones (304) vs. descargas completas del scraping (por proceso)"""
+        from .utils.page_cache import product_page_cache
+        return product_page_cache.get_stats()
+    
+    @classmethod
+    def get_extraction_rule_stats(cls):
+        """Aciertos de las reglas por dominio vs. fallback al extractor genérico"""
+        from .utils.extraction_rules import get_extraction_rule_stats
+        return get_extraction_rule_stats()
+    
+    @classmethod
+    def get_recompute_stats(cls):
+        """Recálculos anticipados (XFetch), al expirar y valores viejos servidos durante un recálculo"""
+        values = cache.get_many(list(RECOMPUTE_COUNTERS.values()))
+        return {name: values.get(key, 0) for name, key in RECOMPUTE_COUNTERS.items()}
+    
+    @classmethod
+    def get_response_cache_stats(cls):
+        """Respuestas HTTP servidas desde cache, 304 y respuestas que no se pudieron guardar"""
+        from .response_cache import get_response_cache_stats
+        return get_response_cache_stats()
+    
+    @classmethod
+    def get_backend_metrics(cls):
+        """Accesos al cache compartido por prefijo de clave, sumados entre workers"""
+        from .cache_backends import get_cache_metrics
+        return get_cache_metrics()
+    
+    @classmethod
+    def get_near_cache_stats(cls):
+        """Aciertos por tier: memoria del proceso (con y sin revalidar versión) y cache compartido"""
+        return near_cache.get_stats()
+    
+    @classmethod
+    def get_fetch_scheduler_stats(cls):
+        """Turnos de descarga de este proceso: concedidos, demorados y sin lugar"""
+        from .utils.fetch_scheduler import fetch_scheduler
+        return fetch_scheduler.get_stats()
+    
     @classmethod
     def cache_user_stats(cls, user_id, stats_data):
         """Cachea estadísticas de usuario"""
         cache_key = cls.get_cache_key('user_stats', user_id)
         
-        cache.set(
+        near_cache.set(
             cache_key,
             stats_data,
-            cls.CACHE_TIMEOUTS['user_stats']
+            cls.CACHE_TIMEOUTS['user_stats'],
+            tags=[cls.user_tag(user_id)]
         )
         
         return cache_key
@@ -144,30 +358,59 @@ class CacheManager:
     def get_cached_user_stats(cls, user_id):
         """Obtiene estadísticas de usuario del cache"""
         cache_key = cls.get_cache_key('user_stats', user_id)
-        return cache.get(cache_key)
+        return near_cache.get(cache_key, tags=[cls.user_tag(user_id)])
     
     @classmethod
     def invalidate_user_cache(cls, user_id):
-        """Invalida cache relacionado con usuario"""
-        patterns = [
-            cls.get_cache_key('user_stats', user_id),
-            cls.get_cache_key('user', f"{user_id}_*"),
-        ]
-        
-        for pattern in patterns:
-            cache.delete(pattern)
+        """Invalida todo lo cacheado con el tag del usuario (un solo incremento)"""
+        cls.invalidate_tag(cls.user_tag(user_id))
         
         logger.info(f"🗑️ Invalidated cache for user: {user_id}")
     
+    # ✅ TAGS: INVALIDACIÓN EN BLOQUE SIN RECORRER CLAVES
+    TEMPLATES_TAG = 'templates'
+    
+    @staticmethod
+    def user_tag(user_id):
+        return f"user:{user_id}"
+    
+    @classmethod
+    def get_tag_generation(cls, tag):
+        return get_generations([tag])[tag]
+    
+    @classmethod
+    def tagged_key(cls, key, tags):
+        """Clave con la generación actual de cada tag; al invalidar un tag deja de usarse"""
+        return tagged_key(key, get_generations(tags))
+    
+    @classmethod
+    def invalidate_tag(cls, tag):
+        """
+        Invalida todas las claves del tag en todos los workers incrementando
+        su generación. Las entradas viejas no se borran: expiran por su TTL.
+        """
+        generation = invalidate_tag(tag)
+        near_cache.forget_tag(tag)
+        logger.debug(f"🗑️ Invalidated tag: {tag} (generación {generation})")
+        return generation
+    
+    PUBLIC_HISTORY_TAG = 'public_history'
+    
+    @classmethod
+    def invalidate_templates(cls):
+        """Todas las listas de plantillas, de todas las plataformas"""
+        return cls.invalidate_tag(cls.TEMPLATES_TAG)
+    
     @classmethod
     def cache_platform_stats(cls, stats_data):
         """Cachea estadísticas generales de plataformas"""
         cache_key = cls.get_cache_key('stats', 'platforms')
+        timeout = cls.CACHE_TIMEOUTS['platform_stats']
         
-        cache.set(
+        near_cache.set(
             cache_key,
-            stats_data,
-            cls.CACHE_TIMEOUTS['platform_stats']
+            CachedValue.wrap(stats_data, timeout),
+            timeout + get_stale_seconds()
         )
         
         return cache_key
@@ -176,17 +419,37 @@ class CacheManager:
     def get_cached_platform_stats(cls):
         """Obtiene estadísticas de plataformas del cache"""
         cache_key = cls.get_cache_key('stats', 'platforms')
-        return cache.get(cache_key)
+        return CachedValue.fresh_value(near_cache.get(cache_key))
+    
+    @classmethod
+    def get_platform_stats(cls):
+        """Estadísticas de plataformas; al expirar las recalcula un solo worker"""
+        cache_key = cls.get_cache_key('stats', 'platforms')
+        return get_or_recompute(
+            cache_key, cls._compute_platform_stats, cls.CACHE_TIMEOUTS['platform_stats'],
+            recompute_lock=True, getter=near_cache.get, setter=near_cache.set
+        )
+    
+    @classmethod
+    def _compute_platform_stats(cls):
+        from .models import AnalysisHistory
+        return list(AnalysisHistory.objects.filter(
+            success=True
+        ).values('platform').annotate(
+            count=Count('id')
+        ).order_by('-count')[:10])
     
     @classmethod
     def cache_templates(cls, platform, templates_data):
         """Cachea plantillas por plataforma"""
         cache_key = cls.get_cache_key('template', platform)
+        timeout = cls.CACHE_TIMEOUTS['templates']
         
-        cache.set(
+        near_cache.set(
             cache_key,
-            templates_data,
-            cls.CACHE_TIMEOUTS['templates']
+            CachedValue.wrap(templates_data, timeout),
+            timeout + get_stale_seconds(),
+            tags=[cls.TEMPLATES_TAG]
         )
         
         return cache_key
@@ -195,7 +458,26 @@ class CacheManager:
     def get_cached_templates(cls, platform):
         """Obtiene plantillas del cache"""
         cache_key = cls.get_cache_key('template', platform)
-        return cache.get(cache_key)
+        return CachedValue.fresh_value(near_cache.get(cache_key, tags=[cls.TEMPLATES_TAG]))
+    
+    @classmethod
+    def get_templates(cls, platform):
+        """Plantillas activas de la plataforma; al expirar las recalcula un solo worker"""
+        cache_key = cls.get_cache_key('template', platform)
+        return get_or_recompute(
+            cache_key, lambda: cls._compute_templates(platform), cls.CACHE_TIMEOUTS['templates'],
+            recompute_lock=True,
+            getter=lambda key: near_cache.get(key, tags=[cls.TEMPLATES_TAG]),
+            setter=lambda key, value, timeout: near_cache.set(key, value, timeout, tags=[cls.TEMPLATES_TAG])
+        )
+    
+    @classmethod
+    def _compute_templates(cls, platform):
+        from .models import MarketingTemplate
+        return list(MarketingTemplate.objects.filter(
+            platform=platform,
+            is_active=True
+        ).order_by('-success_rate')[:10].values())
     
     @classmethod
     def warm_cache(cls):
@@ -205,24 +487,12 @@ class CacheManager:
         try:
             # Precargar estadísticas de plataformas
             from .models import AnalysisHistory
-            platform_stats = AnalysisHistory.objects.filter(
-                success=True
-            ).values('platform').annotate(
-                count=Count('id')
-            ).order_by('-count')[:10]
-            
-            cls.cache_platform_stats(list(platform_stats))
+            cls.cache_platform_stats(cls._compute_platform_stats())
             
             # Precargar plantillas populares
-            from .models import MarketingTemplate
             for platform_choice in AnalysisHistory.PLATFORM_CHOICES:
                 platform = platform_choice[0]
-                templates = MarketingTemplate.objects.filter(
-                    platform=platform,
-                    is_active=True
-                ).order_by('-success_rate')[:10]
-                
-                cls.cache_templates(platform, list(templates.values()))
+                cls.cache_templates(platform, cls._compute_templates(platform))
             
             logger.info("✅ Cache warmed successfully")
             
@@ -233,22 +503,27 @@ class CacheManager:
     def clear_all_cache(cls):
         """Limpia todo el cache de la aplicación"""
         cache.clear()
+        near_cache.clear()
         logger.warning("🗑️ All cache cleared")
     
     @classmethod
     def get_cache_stats(cls):
-        """Obtiene estadísticas del cache"""
-        # Esta función depende del backend de cache usado
+        """
+        Estadísticas del cache: accesos medidos por prefijo de clave (hits,
+        misses, latencias, tamaños, desalojos) más las de cada tier/feature
+        """
         try:
-            # Para memcached o redis
-            if hasattr(cache, '_cache'):
-                if hasattr(cache._cache, 'get_stats'):
-                    return cache._cache.get_stats()
-            
-            # Estadísticas básicas simuladas
             return {
                 'status': 'active',
-                'backend': str(cache.__class__),
+                **cls.get_backend_metrics(),
+                'analysis_cache': cls.get_analysis_cache_stats(),
+                'near_cache': cls.get_near_cache_stats(),
+                'recompute': cls.get_recompute_stats(),
+                'responses': cls.get_response_cache_stats(),
+                'product_pages': cls.get_product_page_stats(),
+                'extraction_rules': cls.get_extraction_rule_stats(),
+                'scrape_failures': cls.get_scrape_failure_stats(),
+                'fetch_scheduler': cls.get_fetch_scheduler_stats(),
                 'timestamp': timezone.now().isoformat()
             }
             
@@ -257,11 +532,243 @@ class CacheManager:
             return {'status': 'error', 'error': str(e)}
 
 
+# ✅ SINGLE-FLIGHT: UN SOLO CÁLCULO POR CLAVE ENTRE TODOS LOS WORKERS
+class SingleFlight:
+    """
+    Coalescing de trabajos idénticos usando un lease en el cache compartido.
+
+    El primero que obtiene el lease (cache.add atómico) hace el trabajo; los
+    demás esperan a que el resultado aparezca. El lease expira solo, así que
+    si el worker líder muere los que esperan pueden tomar el relevo.
+    """
+    
+    def __init__(self, key, lease_seconds=None, wait_seconds=None, poll_interval=0.25):
+        self.key = f"singleflight:{key}"
+        self.lease_seconds = lease_seconds or app_setting('SINGLE_FLIGHT_LEASE_SECONDS', 90)
+        self.wait_seconds = wait_seconds or app_setting('SINGLE_FLIGHT_WAIT_SECONDS', 55)
+        self.poll_interval = poll_interval
+        self.token = None
+    
+    def acquire(self):
+        """Intenta tomar el lease. Retorna True si este proceso es el líder."""
+        token = uuid.uuid4().hex
+        if cache.add(self.key, token, self.lease_seconds):
+            self.token = token
+            return True
+        return False
+    
+    def release(self):
+        """Libera el lease solo si sigue siendo nuestro"""
+        if self.token and cache.get(self.key) == self.token:
+            cache.delete(self.key)
+        self.token = None
+    
+    def is_held(self):
+        """Hay un líder trabajando (lease vigente)"""
+        return cache.get(self.key) is not None
+    
+    def wait(self, check, deadline):
+        """
+        Espera hasta que check() retorne algo distinto de None, el lease
+        desaparezca (líder terminó o murió) o se alcance el deadline (monotonic).
+        """
+        while time.monotonic() < deadline:
+            result = check()
+            if result is not None:
+                return result
+            if not self.is_held():
+                return check()
+            time.sleep(self.poll_interval)
+        return None
+
+
+# ✅ BACKOFF POR HOST: HOSTS QUE FALLAN SEGUIDO SE DEJAN ENFRIAR
+class HostBackoff:
+    """
+    Backoff exponencial por host compartido entre workers.
+
+    Cada fallo atribuible al host (timeout, DNS, conexión, 5xx, 429) suma
+    a un contador con ventana; al llegar a SCRAPING_HOST_BACKOFF_THRESHOLD
+    el host entra en enfriamiento por BASE * 2^(fallos - umbral) segundos
+    (tope SCRAPING_HOST_BACKOFF_MAX_SECONDS). Mientras dura, el scraping de
+    ese host falla de inmediato. Un éxito reinicia el contador.
+    """
+    
+    HOST_ERRORS = ('timeout', 'dns', 'connection', 'rate_limited', 'http_5xx')
+    
+    @staticmethod
+    def host_of(url):
+        return (urlsplit(url).hostname or '').lower()
+    
+    @staticmethod
+    def _failures_key(host):
+        return f"scrape_backoff:failures:{host}"
+    
+    @staticmethod
+    def _cooldown_key(host):
+        return f"scrape_backoff:until:{host}"
+    
+    @classmethod
+    def get_cooldown(cls, host):
+        """Segundos que le quedan al enfriamiento del host (0 si no hay)"""
+        if not host:
+            return 0
+        until = cache.get(cls._cooldown_key(host))
+        return max(0, until - time.time()) if until else 0
+    
+    @classmethod
+    def record_failure(cls, host, error_type):
+        """Registra un fallo; retorna los segundos de enfriamiento aplicados (0 si ninguno)"""
+        if not host or error_type not in cls.HOST_ERRORS:
+            return 0
+        key = cls._failures_key(host)
+        try:
+            cache.add(key, 0, app_setting('SCRAPING_HOST_BACKOFF_WINDOW_SECONDS', 600))
+            failures = cache.incr(key)
+        except ValueError:
+            # La ventana expiró entre add e incr
+            cache.set(key, 1, app_setting('SCRAPING_HOST_BACKOFF_WINDOW_SECONDS', 600))
+            failures = 1
+        
+        threshold = app_setting('SCRAPING_HOST_BACKOFF_THRESHOLD', 3)
+        if failures < threshold:
+            return 0
+        cooldown = min(
+            app_setting('SCRAPING_HOST_BACKOFF_BASE_SECONDS', 30) * 2 ** (failures - threshold),
+            app_setting('SCRAPING_HOST_BACKOFF_MAX_SECONDS', 900)
+        )
+        cache.set(cls._cooldown_key(host), time.time() + cooldown, cooldown)
+        logger.warning(f"🧊 {host}: {failures} fallos seguidos ({error_type}), enfriando {cooldown}s")
+        return cooldown
+    
+    @classmethod
+    def record_success(cls, host):
+        if host:
+            cache.delete(cls._failures_key(host))
+    
+    @classmethod
+    def fail_fast_result(cls, host, retry_after):
+        return {
+            'success': False,
+            'error_type': 'host_backoff',
+            'retry_after': int(retry_after) + 1,
+            'error': f"{host} no responde; se reintentará en {int(retry_after) + 1}s"
+        }
+
+
+# ✅ PROTECCIÓN CONTRA STAMPEDE: RECÁLCULO ANTICIPADO (XFetch) Y LOCK DE RECÁLCULO
+class CachedValue(namedtuple('CachedValue', ['value', 'delta', 'expires_at'])):
+    """
+    Valor cacheado con lo que tardó en calcularse (delta, segundos) y su
+    expiración lógica. En el backend vive stale_seconds más, para poder
+    servirlo mientras otro worker lo recalcula.
+    """
+    
+    __slots__ = ()
+    
+    @classmethod
+    def wrap(cls, value, timeout, delta=0):
+        return cls(value, delta, time.time() + timeout)
+    
+    @classmethod
+    def fresh_value(cls, entry):
+        """El valor si no pasó su expiración lógica (acepta valores sin envolver)"""
+        if isinstance(entry, cls):
+            return entry.value if time.time() < entry.expires_at else None
+        return entry
+    
+    def should_recompute(self, beta):
+        """XFetch: cuanto más cerca de expirar y más caro el cálculo, más probable adelantarlo"""
+        now = time.time()
+        if beta <= 0 or not self.delta:
+            return now >= self.expires_at
+        return now - self.delta * beta * math.log(1 - random.random()) >= self.expires_at
+
+
+RECOMPUTE_COUNTERS = {
+    'early': 'stats:recompute:early',
+    'expired': 'stats:recompute:expired',
+    'stale_served': 'stats:recompute:stale_served',
+}
+
+
+def get_stale_seconds():
+    return app_setting('CACHE_STALE_SECONDS', 300)
+
+
+def get_or_recompute(key, compute, timeout, beta=None, recompute_lock=False, stale_seconds=None,
+                     getter=None, setter=None):
+    """
+    Lee key del cache o la calcula con compute() evitando el stampede:
+
+    - Recálculo anticipado (XFetch): antes de expirar, cada lectura tiene una
+      probabilidad creciente de recalcular, así los workers no llegan todos
+      juntos al vencimiento. beta (CACHE_XFETCH_BETA) > 1 adelanta más; 0 lo
+      desactiva.
+    - recompute_lock: solo quien toma el lease recalcula; los demás siguen
+      sirviendo el valor anterior (hasta stale_seconds después de expirar)
+      o, si no hay ninguno, esperan al que recalcula.
+
+    Un resultado None no se cachea.
+    """
+    beta = app_setting('CACHE_XFETCH_BETA', 1.0) if beta is None else beta
+    stale_seconds = get_stale_seconds() if stale_seconds is None else stale_seconds
+    getter = getter or cache.get
+    setter = setter or cache.set
+    
+    entry = getter(key)
+    if entry is not None and not isinstance(entry, CachedValue):
+        return entry  # Valor guardado sin metadatos
+    if entry is not None and not entry.should_recompute(beta):
+        return entry.value
+    
+    flight = None
+    if recompute_lock:
+        flight = SingleFlight(f"recompute:{key}", wait_seconds=app_setting('CACHE_RECOMPUTE_WAIT_SECONDS', 10))
+        if not flight.acquire():
+            if entry is not None and time.time() < entry.expires_at + stale_seconds:
+                CacheManager.incr_counter(RECOMPUTE_COUNTERS['stale_served'])
+                return entry.value
+            
+            def recomputed():
+                current = getter(key)
+                return current if current is not None and current != entry else None
+            
+            fresh = flight.wait(recomputed, time.monotonic() + flight.wait_seconds)
+            if fresh is not None:
+                return fresh.value if isinstance(fresh, CachedValue) else fresh
+            flight = None  # El que recalculaba tardó demasiado o falló: calcular por cuenta propia
+    
+    try:
+        started = time.monotonic()
+        value = compute()
+        delta = time.monotonic() - started
+        if value is not None:
+            setter(key, CachedValue.wrap(value, timeout, delta), timeout + stale_seconds)
+            logger.debug(f"💾 Cached result: {key} ({delta * 1000:.0f} ms)")
+        if entry is not None:
+            early = time.time() < entry.expires_at
+            CacheManager.incr_counter(RECOMPUTE_COUNTERS['early' if early else 'expired'])
+        return value
+    finally:
+        if flight is not None:
+            flight.release()
+
+
 # ✅ DECORADORES PARA CACHE AUTOMÁTICO
 from functools import wraps
 
-def cache_result(timeout=None, key_prefix='auto'):
-    """Decorador para cachear resultados de funciones"""
+def cache_result(timeout=None, key_prefix='auto', beta=None, recompute_lock=False, stale_seconds=None,
+                 tags=None):
+    """
+    Decorador para cachear resultados de funciones.
+
+    beta, recompute_lock y stale_seconds controlan la protección contra
+    stampede (ver get_or_recompute); por defecto solo el recálculo anticipado.
+    tags: lista de tags o función que los recibe de los mismos argumentos
+    (p. ej. lambda user_id: [CacheManager.user_tag(user_id)]); invalidar
+    cualquiera de ellos invalida el resultado.
+    """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
@@ -269,27 +776,26 @@ def cache_result(timeout=None, key_prefix='auto'):
             func_name = f"{func.__module__}.{func.__name__}"
             args_str = str(args) + str(sorted(kwargs.items()))
             cache_key = f"{key_prefix}:{func_name}:{hashlib.md5(args_str.encode()).hexdigest()[:12]}"
+            if tags:
+                cache_key = CacheManager.tagged_key(
+                    cache_key, tags(*args, **kwargs) if callable(tags) else tags
+                )
             
-            # Intentar obtener del cache
-            cached_result = cache.get(cache_key)
-            if cached_result is not None:
-                logger.debug(f"📋 Cache hit: {cache_key}")
-                return cached_result
-            
-            # Ejecutar función y cachear resultado
-            result = func(*args, **kwargs)
-            
-            cache_timeout = timeout or 3600  # 1 hora por defecto
-            cache.set(cache_key, result, cache_timeout)
-            
-            logger.debug(f"💾 Cached result: {cache_key}")
-            return result
+            return get_or_recompute(
+                cache_key, lambda: func(*args, **kwargs), timeout or 3600,  # 1 hora por defecto
+                beta=beta, recompute_lock=recompute_lock, stale_seconds=stale_seconds
+            )
         
         return wrapper
     return decorator
 
-def invalidate_cache_on_save(cache_pattern):
-    """Decorador para invalidar cache cuando se guarda un modelo"""
+def invalidate_cache_on_save(cache_pattern=None, tags=()):
+    """
+    Decorador para invalidar cache cuando se guarda un modelo.
+
+    cache_pattern borra una clave ('obj:{pk}'); tags invalida tags completos,
+    formateados con pk y el propio objeto ('user:{obj.user_id}').
+    """
     def decorator(func):
         @wraps(func)
         def wrapper(self, *args, **kwargs):
@@ -297,9 +803,12 @@ def invalidate_cache_on_save(cache_pattern):
             
             # Invalidar cache relacionado
             if hasattr(self, 'pk') and self.pk:
-                cache_key = cache_pattern.format(pk=self.pk)
-                cache.delete(cache_key)
-                logger.debug(f"🗑️ Invalidated cache: {cache_key}")
+                if cache_pattern:
+                    cache_key = cache_pattern.format(pk=self.pk)
+                    cache.delete(cache_key)
+                    logger.debug(f"🗑️ Invalidated cache: {cache_key}")
+                for tag in tags:
+                    CacheManager.invalidate_tag(tag.format(pk=self.pk, obj=self))
             
             return result
         return wrapper
@@ -307,21 +816,45 @@ def invalidate_cache_on_save(cache_pattern):
 
 
 # ✅ IMPLEMENTACIÓN EN UTILS DE SCRAPING
-def cached_scrape_product_info(url):
-    """Versión con cache del scraping de productos"""
+def cached_scrape_product_info(url, timeout=None):
+    """Versión con cache del scraping de productos (los fallos se cachean poco tiempo)"""
     # Buscar en cache primero
     cached_data = CacheManager.get_cached_product_info(url)
     if cached_data:
         return cached_data
     
-    # Si no está en cache, hacer scraping
+    # Falló hace poco: mismo resultado sin volver a esperar el timeout
+    failure = CacheManager.get_cached_product_failure(url)
+    if failure:
+        return failure
+    
+    host = HostBackoff.host_of(url)
+    retry_after = HostBackoff.get_cooldown(host)
+    if retry_after:
+        CacheManager.incr_counter(CacheManager.SCRAPE_FAILURE_COUNTERS['backoff_rejections'])
+        return HostBackoff.fail_fast_result(host, retry_after)
+    
+    # Si no está en cache, hacer scraping cuando el scheduler dé turno (ritmo por host y límite global)
+    from .utils.fetch_scheduler import fetch_scheduler
     from .utils.scraping import scrape_product_info
-    result = scrape_product_info(url)
+    permit = fetch_scheduler.acquire(url, timeout=timeout)
+    if permit is None:
+        return fetch_scheduler.saturated_result()
+    with permit:
+        if timeout:
+            timeout = max(0.1, timeout - permit.waited)
+        result = scrape_product_info(url, timeout=timeout)
     
-    # Cachear solo si es exitoso
     if result.get('success'):
         CacheManager.cache_product_info(url, result)
+        HostBackoff.record_success(host)
+        return result
     
+    # Un timeout por presupuesto recortado (deadline del request) no es culpa del host
+    if result.get('error_type') == 'timeout' and timeout and timeout < app_setting('SCRAPING_TIMEOUT_SECONDS', 10):
+        return result
+    CacheManager.cache_product_failure(url, result)
+    HostBackoff.record_failure(host, result.get('error_type'))
     return result
 
 
@@ -391,58 +924,3 @@ class Command(BaseCommand):
             stats = CacheManager.get_cache_stats()
             self.stdout.write(f"📊 Cache stats: {stats}")
 """
-
-
-# ✅ MIDDLEWARE DE CACHE INTELIGENTE
-class SmartCacheMiddleware:
-    """Middleware para cache inteligente de respuestas"""
-    
-    def __init__(self, get_response):
-        self.get_response = get_response
-    
-    def __call__(self, request):
-        # Solo cachear GET requests para usuarios anónimos en ciertas URLs
-        if (request.method == 'GET' and 
-            not request.user.is_authenticated and 
-            self.should_cache_request(request)):
-            
-            # Buscar en cache
-            cache_key = self.get_request_cache_key(request)
-            cached_response = cache.get(cache_key)
-            
-            if cached_response:
-                logger.debug(f"📋 Served from cache: {request.path}")
-                return cached_response
-        
-        response = self.get_response(request)
-        
-        # Cachear respuesta si es apropiado
-        if (response.status_code == 200 and 
-            request.method == 'GET' and 
-            not request.user.is_authenticated and
-            self.should_cache_request(request)):
-            
-            cache_key = self.get_request_cache_key(request)
-            cache.set(cache_key, response, 300)  # 5 minutos
-        
-        return response
-    
-    def should_cache_request(self, request):
-        """Determina si debe cachear la request"""
-        cacheable_paths = [
-            '/public-history/',
-            '/upgrade/',
-        ]
-        
-        return any(request.path.startswith(path) for path in cacheable_paths)
-    
-    def get_request_cache_key(self, request):
-        """Genera clave de cache para request"""
-        key_parts = [
-            'middleware',
-            request.path,
-            str(sorted(request.GET.items()))
-        ]
-        
-        key_str = ':'.join(key_parts)
-        return hashlib.md5(key_str.encode()).hexdigest()
\ No newline at end of file
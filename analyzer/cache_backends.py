@@ -0,0 +1,471 @@
+# analyzer/cache_backends.py - BACKENDS DE CACHE INSTRUMENTADOS (métricas por prefijo de clave)
+
+import bisect
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache, RedisCacheClient
+
+from .conf import app_setting
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = 'cachemetrics'
+PREFIX_REGISTRY_KEY = f"{METRICS_PREFIX}:prefixes"
+BACKEND_PREFIX = '_backend'
+
+COUNTERS = ('gets', 'hits', 'misses', 'sets', 'deletes', 'incrs', 'bytes_set', 'get_us', 'set_us')
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+SIZE_BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+HISTOGRAMS = {
+    'get_ms': LATENCY_BUCKETS_MS,
+    'set_ms': LATENCY_BUCKETS_MS,
+    'value_bytes': SIZE_BUCKETS_BYTES,
+}
+
+_MISSING = object()
+_local = threading.local()
+
+
+def key_prefix(key):
+    """
+    Familia de la clave: 'user_stats:42' → 'user', 'stats:analysis_cache:hits'
+    → 'stats'. Las claves sin ':' (sesiones, hashes sueltos) van a 'session'
+    u 'other' para que la cantidad de prefijos quede acotada.
+    """
+    if not isinstance(key, str) or ':' not in key:
+        if isinstance(key, str) and key.startswith('django.contrib.sessions'):
+            return 'session'
+        return 'other'
+    return key.split(':', 1)[0].split('_', 1)[0] or 'other'
+
+
+def _record_payload_size(size):
+    """
+    Tamaño del valor ya serializado por el backend (lo llama cada backend al
+    escribir): medir no cuesta una segunda serialización.
+    """
+    sizes = getattr(_local, 'payload_sizes', None)
+    if sizes is not None:
+        sizes.append(size)
+
+
+@contextmanager
+def uninstrumented():
+    """Operaciones de cache que no cuentan en las métricas (las propias métricas)"""
+    _local.depth = getattr(_local, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _local.depth -= 1
+
+
+def _nested():
+    return getattr(_local, 'depth', 0) > 0
+
+
+class CacheMetricsRecorder:
+    """
+    Acumula las métricas del proceso en memoria y cada
+    CACHE_METRICS_FLUSH_SECONDS las suma a contadores del cache compartido,
+    así los totales incluyen a todos los workers sin pagar una escritura
+    extra por operación.
+
+    El flush periódico corre en un hilo aparte: el request que cruza el
+    intervalo no espera las escrituras. Se publican todas juntas con
+    backend.incr_many (en Redis, un pipeline de INCRBY: un solo viaje y
+    atómico entre workers).
+
+    Los contadores son claves normales sin expiración: con el cache lleno
+    el backend puede desalojarlos igual que a los datos, y esas métricas
+    vuelven a empezar de cero. En FileBasedCache incr lee y reescribe el
+    archivo sin lock entre procesos, así que dos workers que publican a la
+    vez pueden perder incrementos: ahí las métricas son aproximadas.
+    """
+
+    def __init__(self):
+        self._pending = defaultdict(int)  # (prefijo, métrica) -> delta
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def add(self, prefix, metric, value=1):
+        with self._lock:
+            self._pending[(prefix, metric)] += value
+
+    def observe(self, prefix, histogram, value):
+        buckets = HISTOGRAMS[histogram]
+        index = bisect.bisect_left(buckets, value)
+        self.add(prefix, f"{histogram}:{index}")
+
+    def maybe_flush(self, backend):
+        if time.monotonic() - self._last_flush < app_setting('CACHE_METRICS_FLUSH_SECONDS', 10):
+            return
+        if not self._flush_lock.acquire(blocking=False):
+            return  # Ya hay un flush en curso
+        self._last_flush = time.monotonic()
+        thread = threading.Thread(
+            target=self._flush_and_release, args=(backend,), name='cache-metrics-flush', daemon=True
+        )
+        try:
+            thread.start()
+        except RuntimeError:
+            # Sin hilos disponibles (p. ej. al cerrar el intérprete): queda para el próximo
+            self._flush_lock.release()
+
+    def _flush_and_release(self, backend):
+        try:
+            self._flush(backend)
+        finally:
+            self._flush_lock.release()
+
+    def flush(self, backend):
+        """Publica ya lo pendiente (espera a un flush en segundo plano en curso)"""
+        with self._flush_lock:
+            self._flush(backend)
+
+    def _flush(self, backend):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            with uninstrumented():
+                backend.incr_many({
+                    f"{METRICS_PREFIX}:{prefix}:{metric}": delta
+                    for (prefix, metric), delta in pending.items()
+                })
+                # Se relee en cada flush (ya fuera del request): si el registro
+                # se desaloja, los prefijos vuelven a anotarse
+                prefixes = {prefix for prefix, _ in pending}
+                registry = set(backend.get(PREFIX_REGISTRY_KEY) or ())
+                if not prefixes.issubset(registry):
+                    backend.set(PREFIX_REGISTRY_KEY, sorted(registry | prefixes), None)
+        except Exception as e:
+            logger.debug(f"No se pudieron publicar las métricas de cache: {str(e)}")
+
+
+recorder = CacheMetricsRecorder()
+
+
+class InstrumentedCacheMixin:
+    """
+    Cuenta hits, misses, sets, deletes e incrs, latencia de get/set y
+    tamaño de los valores por prefijo de clave. Las llamadas internas del
+    backend (get_many que llama a get, incr que llama a set...) solo cuentan
+    una vez.
+    """
+
+    def _timed(self, func, *args, **kwargs):
+        _local.depth = getattr(_local, 'depth', 0) + 1
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs), (time.perf_counter() - started) * 1000
+        finally:
+            _local.depth -= 1
+
+    def _record_read(self, keys, hits, ms):
+        prefixes = defaultdict(lambda: [0, 0])
+        for key in keys:
+            prefixes[key_prefix(key)][0 if key in hits else 1] += 1
+        for prefix, (hit_count, miss_count) in prefixes.items():
+            recorder.add(prefix, 'gets', hit_count + miss_count)
+            recorder.add(prefix, 'hits', hit_count)
+            recorder.add(prefix, 'misses', miss_count)
+            recorder.add(prefix, 'get_us', int(ms * 1000))
+            recorder.observe(prefix, 'get_ms', ms)
+        recorder.maybe_flush(self)
+
+    def _timed_write(self, func, *args):
+        """Como _timed, más los tamaños serializados que reportó el backend (en orden)"""
+        _local.payload_sizes = []
+        try:
+            result, ms = self._timed(func, *args)
+            return result, ms, _local.payload_sizes
+        finally:
+            _local.payload_sizes = None
+
+    def _record_write(self, keys, sizes, ms):
+        prefixes = defaultdict(lambda: [0, []])
+        for index, key in enumerate(keys):
+            entry = prefixes[key_prefix(key)]
+            entry[0] += 1
+            if index < len(sizes):
+                entry[1].append(sizes[index])
+        for prefix, (count, prefix_sizes) in prefixes.items():
+            recorder.add(prefix, 'sets', count)
+            recorder.add(prefix, 'bytes_set', sum(prefix_sizes))
+            recorder.add(prefix, 'set_us', int(ms * 1000))
+            recorder.observe(prefix, 'set_ms', ms)
+            for size in prefix_sizes:
+                recorder.observe(prefix, 'value_bytes', size)
+        recorder.maybe_flush(self)
+
+    def _record_count(self, keys, metric):
+        for key in keys:
+            recorder.add(key_prefix(key), metric)
+        recorder.maybe_flush(self)
+
+    def get(self, key, default=None, version=None):
+        if _nested():
+            return super().get(key, default, version)
+        value, ms = self._timed(super().get, key, _MISSING, version)
+        hit = value is not _MISSING
+        self._record_read([key], {key} if hit else set(), ms)
+        return value if hit else default
+
+    def get_many(self, keys, version=None):
+        if _nested():
+            return super().get_many(keys, version)
+        keys = list(keys)
+        values, ms = self._timed(super().get_many, keys, version)
+        if keys:
+            self._record_read(keys, set(values), ms)
+        return values
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if _nested():
+            return super().set(key, value, timeout, version)
+        result, ms, sizes = self._timed_write(super().set, key, value, timeout, version)
+        self._record_write([key], sizes, ms)
+        return result
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if _nested():
+            return super().add(key, value, timeout, version)
+        added, ms, sizes = self._timed_write(super().add, key, value, timeout, version)
+        if added:
+            self._record_write([key], sizes, ms)
+        return added
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if _nested():
+            return super().set_many(data, timeout, version)
+        failed, ms, sizes = self._timed_write(super().set_many, data, timeout, version)
+        if not failed:
+            self._record_write(list(data), sizes, ms)
+        else:
+            # Sin saber qué tamaño corresponde a cada clave: solo se cuentan
+            self._record_write([key for key in data if key not in failed], [], ms)
+        return failed
+
+    def delete(self, key, version=None):
+        if _nested():
+            return super().delete(key, version)
+        result, _ = self._timed(super().delete, key, version)
+        self._record_count([key], 'deletes')
+        return result
+
+    def delete_many(self, keys, version=None):
+        if _nested():
+            return super().delete_many(keys, version)
+        keys = list(keys)
+        result, _ = self._timed(super().delete_many, keys, version)
+        self._record_count(keys, 'deletes')
+        return result
+
+    def incr(self, key, delta=1, version=None):
+        if _nested():
+            return super().incr(key, delta, version)
+        result, _ = self._timed(super().incr, key, delta, version)
+        self._record_count([key], 'incrs')
+        return result
+
+    def incr_many(self, deltas):
+        """
+        Suma cada delta a su contador, creándolo sin expiración si no existe.
+        Aquí es add + incr por clave; InstrumentedRedisCache lo hace en un
+        pipeline.
+        """
+        for key, delta in deltas.items():
+            self.add(key, 0, None)
+            self.incr(key, delta)
+
+    def flush_metrics(self):
+        recorder.flush(self)
+
+    def get_backend_evictions(self):
+        """Entradas desalojadas por falta de espacio (no por expirar), o None si no se sabe"""
+        values = self.get_many([f"{METRICS_PREFIX}:{BACKEND_PREFIX}:evictions"])
+        return values.get(f"{METRICS_PREFIX}:{BACKEND_PREFIX}:evictions", 0)
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+
+    def _set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        # value ya viene serializado por set/add
+        _record_payload_size(len(value))
+        super()._set(key, value, timeout)
+
+    def _cull(self):
+        before = len(self._cache)
+        super()._cull()
+        recorder.add(BACKEND_PREFIX, 'evictions', before - len(self._cache))
+
+
+class InstrumentedFileBasedCache(InstrumentedCacheMixin, FileBasedCache):
+
+    def _write_content(self, file, timeout, value):
+        # Bytes en disco: expiración + valor serializado y comprimido
+        start = file.tell()
+        super()._write_content(file, timeout, value)
+        _record_payload_size(file.tell() - start)
+
+    def _cull(self):
+        self._culled = 0
+        self._culling = True
+        try:
+            super()._cull()
+        finally:
+            self._culling = False
+        if self._culled:
+            recorder.add(BACKEND_PREFIX, 'evictions', self._culled)
+
+    def _delete(self, fname):
+        deleted = super()._delete(fname)
+        if deleted and getattr(self, '_culling', False):
+            self._culled += 1
+        return deleted
+
+
+class _SizeRecordingSerializer:
+    """Envuelve el serializer del cliente de Redis para medir lo que se envía"""
+
+    def __init__(self, serializer):
+        self._serializer = serializer
+
+    def dumps(self, obj):
+        data = self._serializer.dumps(obj)
+        # Los enteros viajan sin serializar (para incr atómico)
+        _record_payload_size(len(data) if isinstance(data, (bytes, bytearray)) else len(str(data)))
+        return data
+
+    def loads(self, data):
+        return self._serializer.loads(data)
+
+
+class InstrumentedRedisCacheClient(RedisCacheClient):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._serializer = _SizeRecordingSerializer(self._serializer)
+
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        self._class = InstrumentedRedisCacheClient
+
+    def incr_many(self, deltas):
+        # Los enteros se guardan sin serializar: INCRBY crea la clave si falta
+        client = self._cache.get_client(write=True)
+        pipeline = client.pipeline(transaction=False)
+        for key, delta in deltas.items():
+            pipeline.incrby(self.make_and_validate_key(key), delta)
+        pipeline.execute()
+
+    def get_backend_evictions(self):
+        # Redis desaloja por su cuenta (maxmemory-policy): el contador es del servidor
+        try:
+            return self._cache.get_client().info('stats').get('evicted_keys', 0)
+        except Exception as e:
+            logger.debug(f"No se pudo leer INFO de Redis: {str(e)}")
+            return None
+
+
+# ✅ LECTURA DE MÉTRICAS (agregadas de todos los workers)
+
+def _histogram(values, prefix, name):
+    bounds = HISTOGRAMS[name]
+    counts = [values.get(f"{METRICS_PREFIX}:{prefix}:{name}:{index}", 0) for index in range(len(bounds) + 1)]
+    labels = [f"<={bound}" for bound in bounds] + [f">{bounds[-1]}"]
+    total = sum(counts)
+
+    def percentile(q):
+        # Cota superior del bucket donde cae el percentil
+        if not total:
+            return None
+        threshold, running = q * total, 0
+        for label, count in zip(labels, counts):
+            running += count
+            if running >= threshold:
+                return label
+        return labels[-1]
+
+    return {
+        'buckets': dict(zip(labels, counts)),
+        'p50': percentile(0.5),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+    }
+
+
+def get_cache_metrics(alias='default'):
+    """
+    Métricas por prefijo de clave: hits, misses, sets, deletes, incrs,
+    bytes escritos, histogramas de latencia (ms) y de tamaño de valor
+    (bytes) y los desalojos del backend. Incluye lo pendiente de este
+    proceso; lo de los demás workers aparece tras su próximo flush
+    (CACHE_METRICS_FLUSH_SECONDS).
+    """
+    backend = caches[alias]
+    if not isinstance(backend, InstrumentedCacheMixin):
+        return {'instrumented': False, 'backend': f"{backend.__class__.__module__}.{backend.__class__.__name__}"}
+
+    backend.flush_metrics()
+    with uninstrumented():
+        prefixes = [prefix for prefix in backend.get(PREFIX_REGISTRY_KEY) or () if prefix != BACKEND_PREFIX]
+        keys = [
+            f"{METRICS_PREFIX}:{prefix}:{metric}"
+            for prefix in prefixes
+            for metric in (
+                *COUNTERS,
+                *(f"{name}:{index}" for name, bounds in HISTOGRAMS.items() for index in range(len(bounds) + 1)),
+            )
+        ]
+        values = backend.get_many(keys) if keys else {}
+        evictions = backend.get_backend_evictions()
+
+    per_prefix = {}
+    for prefix in sorted(prefixes):
+        counter = {metric: values.get(f"{METRICS_PREFIX}:{prefix}:{metric}", 0) for metric in COUNTERS}
+        gets, sets = counter['gets'], counter['sets']
+        per_prefix[prefix] = {
+            'gets': gets,
+            'hits': counter['hits'],
+            'misses': counter['misses'],
+            'hit_ratio': round(counter['hits'] / gets, 4) if gets else 0,
+            'sets': sets,
+            'deletes': counter['deletes'],
+            'incrs': counter['incrs'],
+            'bytes_set': counter['bytes_set'],
+            'avg_value_bytes': round(counter['bytes_set'] / sets) if sets else 0,
+            'avg_get_ms': round(counter['get_us'] / gets / 1000, 3) if gets else 0,
+            'avg_set_ms': round(counter['set_us'] / sets / 1000, 3) if sets else 0,
+            'get_latency_ms': _histogram(values, prefix, 'get_ms'),
+            'set_latency_ms': _histogram(values, prefix, 'set_ms'),
+            'value_size_bytes': _histogram(values, prefix, 'value_bytes'),
+        }
+
+    gets = sum(stats['gets'] for stats in per_prefix.values())
+    hits = sum(stats['hits'] for stats in per_prefix.values())
+    return {
+        'instrumented': True,
+        'backend': f"{backend.__class__.__module__}.{backend.__class__.__name__}",
+        'gets': gets,
+        'hits': hits,
+        'hit_ratio': round(hits / gets, 4) if gets else 0,
+        'sets': sum(stats['sets'] for stats in per_prefix.values()),
+        'bytes_set': sum(stats['bytes_set'] for stats in per_prefix.values()),
+        'evictions': evictions,
+        'prefixes': per_prefix,
+    }
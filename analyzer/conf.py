@@ -0,0 +1,8 @@
+# analyzer/conf.py - ACCESO A LA CONFIGURACIÓN DE LA APP
+
+from django.conf import settings
+
+
+def app_setting(name, default=None):
+    """Lee un valor de AFFILIATE_STRATEGIST_SETTINGS con valor por defecto"""
+    return getattr(settings, 'AFFILIATE_STRATEGIST_SETTINGS', {}).get(name, default)
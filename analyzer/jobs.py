@@ -0,0 +1,138 @@
+# analyzer/jobs.py - COLA DE ANÁLISIS ASÍNCRONOS
+
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .conf import app_setting
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisJobQueue:
+    """
+    Cola de análisis en segundo plano.
+
+    El POST encola el trabajo y responde de inmediato con un job_id; un pool de
+    hilos ejecuta el pipeline y deja el estado en el cache compartido para que
+    cualquier worker pueda responder al endpoint de estado.
+    """
+
+    JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+    _executor = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_executor(cls):
+        """Crea el pool de hilos de forma perezosa (uno por proceso)"""
+        if cls._executor is None:
+            with cls._lock:
+                if cls._executor is None:
+                    cls._executor = ThreadPoolExecutor(
+                        max_workers=app_setting('ANALYSIS_JOB_WORKERS', 4),
+                        thread_name_prefix='analysis-job'
+                    )
+        return cls._executor
+
+    @classmethod
+    def get_job_key(cls, job_id):
+        return f"analysis_job:{job_id}"
+
+    @classmethod
+    def get_job(cls, job_id):
+        """Obtiene el estado de un job (o None si expiró o no existe)"""
+        return cache.get(cls.get_job_key(job_id))
+
+    @classmethod
+    def update_job(cls, job_id, **fields):
+        """Actualiza el estado de un job en el cache compartido"""
+        job = cls.get_job(job_id) or {'job_id': job_id}
+        job.update(fields)
+        job['updated_at'] = timezone.now().isoformat()
+        cache.set(cls.get_job_key(job_id), job, app_setting('ANALYSIS_JOB_TTL_SECONDS', 3600))
+        return job
+
+    @classmethod
+    def enqueue(cls, params, user_id=None, owner=None, dedupe_key=None, timer=None):
+        """Encola un análisis y retorna su job_id"""
+        from .pipeline import run_analysis_job
+
+        job_id = cls._create_job(owner, params.get('analysis_type', 'basic'))
+        cls.get_executor().submit(
+            cls._run, job_id, run_analysis_job, params, user_id=user_id, dedupe_key=dedupe_key, timer=timer,
+            owner=owner
+        )
+        logger.info(f"📥 Job de análisis encolado: {job_id}")
+        return job_id
+
+    @classmethod
+    def enqueue_batch(cls, params, product_urls, user_id=None, owner=None):
+        """Encola un análisis en lote; el estado incluye el progreso de cada producto"""
+        from .pipeline import run_batch_pipeline
+
+        job_id = cls._create_job(
+            owner, 'batch',
+            progress={'total': len(product_urls), 'completed': 0, 'failed': 0},
+            items=[{'index': index, 'product_url': url, 'status': 'pending'}
+                   for index, url in enumerate(product_urls)],
+        )
+
+        def progress(index, item):
+            # Solo lo llama el hilo coordinador del lote: sin carreras al actualizar
+            job = cls.get_job(job_id) or {}
+            items = job.get('items') or []
+            if index < len(items):
+                items[index] = dict(item)
+            counters = dict(job.get('progress') or {})
+            counters['completed'] = counters.get('completed', 0) + 1
+            counters['failed'] = counters.get('failed', 0) + (item['status'] == 'failed')
+            cls.update_job(job_id, items=items, progress=counters)
+
+        cls.get_executor().submit(
+            cls._run, job_id, run_batch_pipeline, params, product_urls,
+            user_id=user_id, batch_id=job_id, progress=progress, owner=owner
+        )
+        logger.info(f"📥 Lote encolado: {job_id} ({len(product_urls)} productos)")
+        return job_id
+
+    @classmethod
+    def _create_job(cls, owner, analysis_type, **fields):
+        job_id = str(uuid.uuid4())
+        cls.update_job(
+            job_id,
+            status='queued',
+            owner=owner,
+            analysis_type=analysis_type,
+            created_at=timezone.now().isoformat(),
+            **fields
+        )
+        return job_id
+
+    @classmethod
+    def _run(cls, job_id, runner, *args, **kwargs):
+        """Ejecuta el pipeline dentro del pool"""
+        close_old_connections()
+        try:
+            cls.update_job(job_id, status='running')
+            result = runner(*args, **kwargs)
+            cls.update_job(
+                job_id,
+                status='done' if result.get('success') else 'failed',
+                result=result,
+            )
+            logger.info(f"✅ Job {job_id} terminado: {result.get('success')}")
+        except Exception as e:
+            logger.error(f"❌ Job {job_id} falló: {str(e)}")
+            cls.update_job(job_id, status='failed', result={
+                'success': False,
+                'status': 500,
+                'error': f'Error interno procesando el análisis: {str(e)}'
+            })
+        finally:
+            close_old_connections()
@@ -0,0 +1,97 @@
+# analyzer/management/commands/analysis_latency_report.py
+# COMANDO: python manage.py analysis_latency_report
+
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from analyzer.models import AnalysisHistory
+from analyzer.utils.timing import StageTimer, percentile
+
+
+class Command(BaseCommand):
+    help = 'Reporta p50/p95/p99 por etapa y por proveedor a partir del desglose de tiempos de cada análisis'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='Días hacia atrás a considerar (default: 7)'
+        )
+        parser.add_argument(
+            '--analysis-type',
+            type=str,
+            help='Filtrar por tipo de análisis (basic, competitive, batch...)'
+        )
+        parser.add_argument(
+            '--format',
+            choices=['table', 'json'],
+            default='table',
+            help='Formato de salida'
+        )
+
+    def handle(self, *args, **options):
+        analyses = AnalysisHistory.objects.filter(
+            success=True,
+            created_at__gte=timezone.now() - timedelta(days=options['days'])
+        )
+        if options['analysis_type']:
+            analyses = analyses.filter(analysis_type=options['analysis_type'])
+
+        groups = {'todos': {}}
+        for data, processing_time in analyses.values_list('additional_data', 'processing_time').iterator():
+            timings = (data or {}).get('timings_ms')
+            if not timings:
+                continue  # Análisis anteriores al desglose
+            # Los resultados servidos desde cache se agrupan aparte del proveedor
+            provider = 'cache' if data.get('cached') else (data.get('provider') or 'desconocido')
+            for group in ('todos', provider):
+                stages = groups.setdefault(group, {})
+                for stage, ms in timings.items():
+                    stages.setdefault(stage, []).append(ms)
+                if processing_time is not None:
+                    stages.setdefault('total', []).append(processing_time * 1000)
+
+        report = {
+            group: {
+                stage: self.summarize(values)
+                for stage, values in sorted(stages.items(), key=lambda item: self.stage_order(item[0]))
+            }
+            for group, stages in groups.items()
+        }
+
+        if options['format'] == 'json':
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+            return
+
+        if not report['todos']:
+            self.stdout.write("ℹ️ No hay análisis con desglose de tiempos en el periodo")
+            return
+
+        for group, stages in report.items():
+            self.stdout.write(self.style.SUCCESS(f"\n⏱️ {group}"))
+            self.stdout.write(f"  {'etapa':<16}{'n':>6}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}")
+            for stage, summary in stages.items():
+                self.stdout.write(
+                    f"  {stage:<16}{summary['count']:>6}{summary['p50']:>11.1f}"
+                    f"{summary['p95']:>11.1f}{summary['p99']:>11.1f}"
+                )
+
+    @staticmethod
+    def stage_order(stage):
+        if stage in StageTimer.STAGES:
+            return StageTimer.STAGES.index(stage)
+        return len(StageTimer.STAGES)
+
+    @staticmethod
+    def summarize(values):
+        values = sorted(values)
+        return {
+            'count': len(values),
+            'p50': percentile(values, 0.50),
+            'p95': percentile(values, 0.95),
+            'p99': percentile(values, 0.99),
+        }
@@ -0,0 +1,101 @@
+# analyzer/management/commands/benchmark_extraction.py
+# COMANDO: python manage.py benchmark_extraction
+
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from analyzer.benchmarks.legacy import legacy_extract_product_data
+from analyzer.benchmarks.sample_pages import build_sample_pages
+from analyzer.utils.extraction import extract_product_data
+
+FIELDS = ('title', 'description', 'price')
+
+
+class Command(BaseCommand):
+    help = 'Compara el extractor de metadatos actual con el anterior (BeautifulSoup + búsqueda de texto)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20,
+            help='Repeticiones por página (default: 20)'
+        )
+        parser.add_argument(
+            '--corpus',
+            type=str,
+            help='Directorio con páginas .html guardadas (por defecto: páginas sintéticas)'
+        )
+        parser.add_argument(
+            '--format',
+            choices=['table', 'json'],
+            default='table',
+            help='Formato de salida'
+        )
+
+    def handle(self, *args, **options):
+        pages = self.load_pages(options['corpus'])
+        iterations = max(1, options['iterations'])
+
+        report = {}
+        for name, html, expected in pages:
+            legacy_ms, legacy_data = self.measure(legacy_extract_product_data, html, iterations)
+            fast_ms, fast_data = self.measure(extract_product_data, html, iterations)
+            report[name] = {
+                'bytes': len(html.encode('utf-8')),
+                'legacy_ms': round(legacy_ms, 3),
+                'fast_ms': round(fast_ms, 3),
+                'speedup': round(legacy_ms / fast_ms, 1) if fast_ms else None,
+                'legacy': legacy_data,
+                'fast': fast_data,
+                'legacy_correct': self.correct_fields(legacy_data, expected),
+                'fast_correct': self.correct_fields(fast_data, expected),
+            }
+
+        if options['format'] == 'json':
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+            return
+
+        self.stdout.write(
+            f"  {'página':<20}{'KB':>8}{'anterior ms':>13}{'actual ms':>11}{'x':>7}{'campos ok':>12}"
+        )
+        for name, row in report.items():
+            correct = f"{row['legacy_correct']}→{row['fast_correct']}" if row['fast_correct'] is not None else '-'
+            self.stdout.write(
+                f"  {name:<20}{row['bytes'] / 1024:>8.1f}{row['legacy_ms']:>13.2f}"
+                f"{row['fast_ms']:>11.2f}{row['speedup'] or 0:>7.1f}{correct:>12}"
+            )
+            for field in FIELDS:
+                if row['legacy'][field] != row['fast'][field]:
+                    self.stdout.write(
+                        f"      {field}: {row['legacy'][field]!r} → {row['fast'][field]!r}"
+                    )
+
+    @staticmethod
+    def load_pages(corpus):
+        """(nombre, html, esperado) desde el corpus o las páginas sintéticas"""
+        if not corpus:
+            return build_sample_pages()
+        pages = []
+        for path in sorted(Path(corpus).glob('*.html')):
+            expected_path = path.with_suffix('.json')
+            expected = json.loads(expected_path.read_text()) if expected_path.exists() else None
+            pages.append((path.stem, path.read_text(encoding='utf-8', errors='replace'), expected))
+        return pages
+
+    @staticmethod
+    def measure(extract, html, iterations):
+        """Tiempo medio por página en ms y el resultado de la última extracción"""
+        started = time.perf_counter()
+        for _ in range(iterations):
+            data = extract(html)
+        return (time.perf_counter() - started) * 1000 / iterations, data
+
+    @staticmethod
+    def correct_fields(data, expected):
+        if not expected:
+            return None
+        return sum(1 for field in FIELDS if field in expected and data.get(field) == expected[field])
@@ -0,0 +1,124 @@
+# analyzer/management/commands/benchmark_scraping.py
+# COMANDO: python manage.py benchmark_scraping [--save-baseline nombre] [--compare nombre]
+
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from analyzer.benchmarks.scraping import compare_with_baseline, run_scraping_benchmark
+
+BASELINES_DIR = Path(__file__).resolve().parents[2] / 'benchmarks' / 'baselines'
+
+
+class Command(BaseCommand):
+    help = 'Mide throughput, latencia, memoria y precisión del scraping sobre el corpus local'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=10,
+            help='Veces que se scrapea cada página del corpus (default: 10)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Descargas simultáneas (default: 4)'
+        )
+        parser.add_argument(
+            '--corpus',
+            type=str,
+            help='Directorio con manifest.json (default: analyzer/benchmarks/corpus)'
+        )
+        parser.add_argument(
+            '--save-baseline',
+            type=str,
+            metavar='NOMBRE',
+            help='Guarda el resultado en benchmarks/baselines/NOMBRE.json'
+        )
+        parser.add_argument(
+            '--compare',
+            type=str,
+            metavar='NOMBRE',
+            help='Compara contra benchmarks/baselines/NOMBRE.json'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.3,
+            help='Empeoramiento relativo admitido antes de marcar regresión (default: 0.3)'
+        )
+        parser.add_argument(
+            '--fail-on-regression',
+            action='store_true',
+            help='Termina con error si hay regresiones contra el baseline'
+        )
+        parser.add_argument(
+            '--format',
+            choices=['table', 'json'],
+            default='table',
+            help='Formato de salida'
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            baseline_path = BASELINES_DIR / f"{options['compare']}.json"
+            if not baseline_path.exists():
+                raise CommandError(f"No existe el baseline {baseline_path}")
+            baseline = json.loads(baseline_path.read_text(encoding='utf-8'))
+
+        report = run_scraping_benchmark(
+            corpus_dir=options['corpus'],
+            iterations=max(1, options['iterations']),
+            concurrency=max(1, options['concurrency']),
+        )
+        comparison = compare_with_baseline(report, baseline, options['tolerance']) if baseline else {}
+
+        if options['save_baseline']:
+            BASELINES_DIR.mkdir(parents=True, exist_ok=True)
+            baseline_path = BASELINES_DIR / f"{options['save_baseline']}.json"
+            baseline_path.write_text(json.dumps(report, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+
+        if options['format'] == 'json':
+            self.stdout.write(json.dumps({**report, 'comparison': comparison}, indent=2, ensure_ascii=False))
+        else:
+            self.print_report(report, comparison)
+            if options['save_baseline']:
+                self.stdout.write(self.style.SUCCESS(f"💾 Baseline guardado en {baseline_path}"))
+
+        regressions = [metric for metric, row in comparison.items() if row['regression']]
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"Regresiones contra el baseline: {', '.join(regressions)}")
+
+    def print_report(self, report, comparison):
+        self.stdout.write(
+            f"📊 {report['requests']} requests ({report['iterations']} iteraciones, "
+            f"concurrencia {report['concurrency']}, errores {report['errors']})"
+        )
+        self.stdout.write(
+            f"  pages/sec {report['pages_per_sec']}  p50 {report['p50_ms']} ms  "
+            f"p99 {report['p99_ms']} ms  pico RSS {report['peak_rss_mb']} MB  "
+            f"precisión {report['accuracy']:.0%}"
+        )
+        self.stdout.write(
+            '  ' + '  '.join(f"{field} {value:.0%}" for field, value in report['field_accuracy'].items())
+        )
+
+        self.stdout.write(f"\n  {'página':<14}{'KB':>8}{'KB leídos':>11}{'p50 ms':>9}{'p99 ms':>9}  campos ok")
+        for name, page in report['pages'].items():
+            bytes_read = page['bytes_read'] / 1024 if page['bytes_read'] is not None else 0
+            self.stdout.write(
+                f"  {name:<14}{page['bytes'] / 1024:>8.1f}{bytes_read:>11.1f}"
+                f"{page['p50_ms']:>9.1f}{page['p99_ms']:>9.1f}  {', '.join(page['correct_fields']) or '-'}"
+            )
+
+        if comparison:
+            self.stdout.write("\n  métrica         baseline      actual    cambio")
+            for metric, row in comparison.items():
+                flag = self.style.ERROR(' ⚠️ regresión') if row['regression'] else ''
+                self.stdout.write(
+                    f"  {metric:<14}{row['baseline']:>10}{row['current']:>12}{row['change']:>+10.1%}{flag}"
+                )
@@ -0,0 +1,53 @@
+# analyzer/management/commands/extraction_rule_stats.py
+# COMANDO: python manage.py extraction_rule_stats
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from analyzer.utils.extraction_rules import GENERIC_RULE, extraction_rules
+
+
+class Command(BaseCommand):
+    help = 'Muestra el hit rate de las reglas de extracción por dominio y cuántas páginas usan el extractor genérico'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=['table', 'json'],
+            default='table',
+            help='Formato de salida'
+        )
+
+    def handle(self, *args, **options):
+        stats = extraction_rules.get_stats()
+
+        if options['format'] == 'json':
+            self.stdout.write(json.dumps(stats, indent=2, ensure_ascii=False))
+            return
+
+        self.stdout.write(f"  {'regla':<16}{'páginas':>9}{'hit rate':>10}  campos (hit rate)")
+        # Primero las reglas que más caen al extractor genérico
+        ordered = sorted(
+            stats.items(),
+            key=lambda item: (item[0] == GENERIC_RULE, item[1]['hit_rate'] if item[1]['hit_rate'] is not None else 2)
+        )
+        for name, rule_stats in ordered:
+            hit_rate = f"{rule_stats['hit_rate']:.0%}" if rule_stats['hit_rate'] is not None else '-'
+            fields = '  '.join(
+                f"{field} {values['hit_rate']:.0%}"
+                for field, values in rule_stats['fields'].items()
+                if values['hit_rate'] is not None
+            )
+            if name == GENERIC_RULE:
+                fields = 'sin regla: extractor genérico'
+            self.stdout.write(f"  {name:<16}{rule_stats['pages']:>9}{hit_rate:>10}  {fields}")
+
+        generic_hosts = stats.get(GENERIC_RULE, {}).get('hosts') or []
+        if generic_hosts:
+            self.stdout.write("\n  Dominios sin regla con más páginas (candidatos a una regla):")
+            for item in generic_hosts:
+                self.stdout.write(f"  {item['host']:<40}{item['pages']:>9}")
+
+        hosts = sorted(host for rule in extraction_rules.rules.values() for host in rule.hosts)
+        self.stdout.write(f"\nℹ️ {len(extraction_rules.rules)} reglas para {len(hosts)} dominios")
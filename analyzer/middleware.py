@@ -16,6 +16,9 @@ class StrictRateLimitMiddleware:
     Middleware que SÍ bloquea usuarios anónimos usando el sistema existente
     """
     
+    # Endpoints que crean análisis (POST)
+    ANALYSIS_PATHS = ('/', '/api/analyze-stream/')
+    
     def __init__(self, get_response):
         self.get_response = get_response
     
@@ -27,9 +30,9 @@ class StrictRateLimitMiddleware:
             is_auth = False
         logger.info(f"🔍 STRICT MIDDLEWARE: {request.method} {request.path} - Auth: {is_auth}")
         
-        # SOLO aplicar a análisis POST en home
-        if request.path == '/' and request.method.upper() == 'POST':
-            logger.info("🎯 STRICT MIDDLEWARE: Es POST en /")
+        # SOLO aplicar a POST en endpoints de análisis
+        if request.path in self.ANALYSIS_PATHS and request.method.upper() == 'POST':
+            logger.info(f"🎯 STRICT MIDDLEWARE: Es POST en {request.path}")
             
             # VERIFICAR si es usuario anónimo
             if not is_auth:
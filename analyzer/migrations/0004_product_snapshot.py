@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0003_add_anonymous_tracker'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_hash', models.CharField(max_length=64)),
+                ('normalized_url', models.CharField(max_length=500)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('title', models.CharField(blank=True, max_length=300, null=True)),
+                ('price', models.CharField(blank=True, max_length=100, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('scraped_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Snapshot de producto',
+                'verbose_name_plural': 'Snapshots de producto',
+                'ordering': ['-version'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productsnapshot',
+            index=models.Index(fields=['url_hash', '-version'], name='analyzer_pr_url_has_d509f3_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productsnapshot',
+            unique_together={('url_hash', 'version')},
+        ),
+        migrations.AddField(
+            model_name='analysishistory',
+            name='product_snapshot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='analyses', to='analyzer.productsnapshot'),
+        ),
+    ]
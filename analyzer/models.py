@@ -5,6 +5,7 @@ from django.contrib.auth.models import User
 from django.utils import timezone as django_timezone  # 👈 ALIAS PARA EVITAR CONFLICTO
 from django.core.validators import MinValueValidator, MaxValueValidator
 from datetime import datetime, timedelta
+import hashlib
 import json
 import uuid
 
@@ -67,6 +68,10 @@ class AnalysisHistory(models.Model):
     product_category = models.CharField(max_length=100, blank=True, null=True)
     product_brand = models.CharField(max_length=100, blank=True, null=True)
     product_rating = models.FloatField(null=True, blank=True, validators=[MinValueValidator(0), MaxValueValidator(5)])
+    # Datos scrapeados compartidos (la descripción vive en el snapshot, no en cada fila)
+    product_snapshot = models.ForeignKey(
+        'ProductSnapshot', on_delete=models.SET_NULL, null=True, blank=True, related_name='analyses'
+    )
     
     # ✅ CONFIGURACIÓN DE CAMPAÑA
     platform = models.CharField(max_length=20, choices=PLATFORM_CHOICES)
@@ -134,6 +139,127 @@ class AnalysisHistory(models.Model):
     def get_share_url(self):
         """URL para compartir el análisis"""
         return f"/share/{self.share_token}/"
+    
+    def get_product_description(self):
+        """Descripción propia o la del snapshot del producto"""
+        if self.product_description:
+            return self.product_description
+        return self.product_snapshot.description if self.product_snapshot_id else None
+
+
+# ✅ SNAPSHOTS DE PRODUCTO COMPARTIDOS ENTRE ANÁLISIS
+class ProductSnapshot(models.Model):
+    """
+    Datos scrapeados de un producto, por URL normalizada y versionados.
+
+    Todos los usuarios reutilizan el último snapshot mientras esté fresco
+    (PRODUCT_SNAPSHOT_FRESH_HOURS); un producto popular se scrapea una vez
+    para todos. Si un nuevo scraping trae los mismos datos solo se renueva
+    `scraped_at`; si cambian se crea la versión siguiente.
+    """
+    
+    url_hash = models.CharField(max_length=64)  # sha256 de la URL normalizada
+    normalized_url = models.CharField(max_length=500)
+    version = models.PositiveIntegerField(default=1)
+    
+    title = models.CharField(max_length=300, blank=True, null=True)
+    price = models.CharField(max_length=100, blank=True, null=True)
+    description = models.TextField(blank=True, null=True)
+    content_hash = models.CharField(max_length=64)
+    
+    scraped_at = models.DateTimeField(default=django_timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-version']
+        unique_together = ['url_hash', 'version']
+        indexes = [
+            models.Index(fields=['url_hash', '-version']),
+        ]
+        verbose_name = 'Snapshot de producto'
+        verbose_name_plural = 'Snapshots de producto'
+    
+    def __str__(self):
+        return f"{self.title or self.normalized_url} (v{self.version})"
+    
+    @staticmethod
+    def hash_url(url):
+        from .utils.url_normalization import normalize_product_url
+        normalized = normalize_product_url(url)
+        return hashlib.sha256(normalized.encode()).hexdigest(), normalized
+    
+    @staticmethod
+    def hash_content(fields):
+        return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+    
+    @classmethod
+    def get_fresh_timedelta(cls):
+        from .conf import app_setting
+        return timedelta(hours=app_setting('PRODUCT_SNAPSHOT_FRESH_HOURS', 6))
+    
+    @classmethod
+    def get_fresh_many(cls, urls):
+        """{url: último snapshot fresco} para las URLs que lo tengan (una sola consulta)"""
+        max_age = cls.get_fresh_timedelta()
+        if not urls or max_age <= timedelta(0):
+            return {}
+        hashes = {url: cls.hash_url(url)[0] for url in urls}
+        latest = {}
+        snapshots = cls.objects.filter(
+            url_hash__in=set(hashes.values()),
+            scraped_at__gte=django_timezone.now() - max_age,
+        ).order_by('url_hash', '-version')
+        for snapshot in snapshots:
+            latest.setdefault(snapshot.url_hash, snapshot)
+        return {url: latest[url_hash] for url, url_hash in hashes.items() if url_hash in latest}
+    
+    @classmethod
+    def get_fresh(cls, url):
+        return cls.get_fresh_many([url]).get(url)
+    
+    @classmethod
+    def record(cls, url, product_data):
+        """Guarda el resultado de un scraping y retorna el snapshot vigente"""
+        from django.db import IntegrityError, transaction
+        
+        url_hash, normalized = cls.hash_url(url)
+        fields = {
+            'title': product_data.get('title'),
+            'price': product_data.get('price'),
+            'description': product_data.get('description'),
+        }
+        content_hash = cls.hash_content(fields)
+        now = django_timezone.now()
+        
+        latest = cls.objects.filter(url_hash=url_hash).order_by('-version').first()
+        if latest and latest.content_hash == content_hash:
+            # Mismos datos: solo se renueva la frescura
+            cls.objects.filter(pk=latest.pk).update(scraped_at=now)
+            latest.scraped_at = now
+            return latest
+        
+        try:
+            with transaction.atomic():
+                return cls.objects.create(
+                    url_hash=url_hash,
+                    normalized_url=normalized[:500],
+                    version=latest.version + 1 if latest else 1,
+                    content_hash=content_hash,
+                    scraped_at=now,
+                    **fields,
+                )
+        except IntegrityError:
+            # Otro worker guardó la misma versión al mismo tiempo
+            return cls.objects.filter(url_hash=url_hash).order_by('-version').first()
+    
+    def as_product_data(self):
+        """Mismo formato que pipeline.scrape_product"""
+        return {
+            'title': self.title,
+            'price': self.price,
+            'description': self.description,
+            'snapshot_id': self.pk,
+        }
 
 
 # ✅ PLANTILLAS DE MARKETING MEJORADAS
@@ -406,6 +532,38 @@ class UserProfile(models.Model):
             logger.info(f"✅ {profile.user.username}: análisis incrementado {old_count} → {profile.analyses_this_month}")
             return True
     
+    def add_analysis_count_bulk_atomic(self, count):
+        """Cobra varios análisis (lote) en una sola actualización atómica.
+        Nunca supera el límite del plan; retorna cuántos se cobraron.
+        """
+        from django.db import transaction
+        import logging
+        logger = logging.getLogger(__name__)
+        
+        with transaction.atomic():
+            profile = UserProfile.objects.select_for_update().get(pk=self.pk)
+            profile.reset_monthly_counter_if_needed()
+            
+            charged = count
+            if profile.plan != 'premium':
+                charged = max(0, min(count, profile.analyses_limit_monthly - profile.analyses_this_month))
+            if charged <= 0:
+                logger.warning(f"🚫 Límite alcanzado (lote) para {profile.user.username}")
+                return 0
+            
+            old_count = profile.analyses_this_month
+            profile.analyses_this_month += charged
+            profile.total_analyses += charged
+            profile.successful_analyses += charged
+            profile.points += 10 * charged  # Mismos puntos que un análisis individual
+            profile.level = max(profile.level, min(100, (profile.points // 1000) + 1))
+            profile.save(update_fields=[
+                'analyses_this_month', 'total_analyses', 'successful_analyses', 'points', 'level'
+            ])
+            
+            logger.info(f"✅ {profile.user.username}: lote de {charged} análisis {old_count} → {profile.analyses_this_month}")
+            return charged
+    
     def get_plan_details(self):
         """Retorna detalles completos del plan"""
         plans = {
@@ -679,4 +837,27 @@ def update_user_stats(sender, instance, created, **kwargs):
             profile.successful_analyses += 1
             profile.add_points(10)  # 10 puntos por análisis exitoso
         
-        profile.save()
\ No newline at end of file
+        profile.save()
+
+@receiver(post_save, sender=AnalysisHistory)
+@receiver(post_delete, sender=AnalysisHistory)
+def invalidate_user_analysis_cache(sender, instance, **kwargs):
+    """Lo cacheado del usuario (y el historial público) deja de valer al crear o borrar análisis"""
+    from .cache import CacheManager
+    if instance.user_id:
+        CacheManager.invalidate_user_cache(instance.user_id)
+    if instance.is_public:
+        CacheManager.invalidate_tag(CacheManager.PUBLIC_HISTORY_TAG)
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_profile_cache(sender, instance, **kwargs):
+    """Cambios de plan o de uso: las páginas cacheadas del usuario se vuelven a renderizar"""
+    from .cache import CacheManager
+    CacheManager.invalidate_user_cache(instance.user_id)
+
+@receiver(post_save, sender=MarketingTemplate)
+@receiver(post_delete, sender=MarketingTemplate)
+def invalidate_template_cache(sender, instance, **kwargs):
+    """Cualquier cambio en una plantilla invalida todas las listas cacheadas"""
+    from .cache import CacheManager
+    CacheManager.invalidate_templates()
@@ -6,6 +6,7 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.views.decorators.http import require_http_methods
 from .models import UserProfile, AnalysisHistory
+from .response_cache import cached_response
 from datetime import datetime, timedelta
 import logging
 
@@ -118,6 +119,7 @@ class MonetizationEngine:
 
 # Views de monetización
 @login_required
+@cached_response(timeout=60, per_user=True)
 def upgrade_page(request):
     """Página de upgrade personalizada"""
     user_status = MonetizationEngine.get_user_monetization_status(request.user)
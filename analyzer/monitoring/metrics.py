@@ -5,7 +5,6 @@ import time
 import psutil
 import threading
 from datetime import datetime, timedelta
-from django.core.cache import cache
 from django.db.models import Count, Avg, Q
 from django.utils import timezone
 from django.conf import settings
@@ -135,13 +134,10 @@ class MetricsCollector:
         }
     
     def get_cache_metrics(self):
-        """Obtiene métricas del cache"""
+        """Obtiene métricas del cache (hits/misses, latencias y tamaños por prefijo de clave)"""
         try:
-            # Esto depende del backend de cache usado
-            return {
-                'status': 'active',
-                'backend': str(cache.__class__.__name__),
-            }
+            from analyzer.cache import CacheManager
+            return CacheManager.get_cache_stats()
         except Exception as e:
             return {'error': str(e)}
 
@@ -0,0 +1,701 @@
+# analyzer/pipeline.py - PIPELINE DE ANÁLISIS (scraping → prompt → IA → guardado)
+
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .cache import CacheManager, SingleFlight
+from .conf import app_setting
+from .models import AnalysisHistory, ProductSnapshot
+from .utils.ai_integration import detect_and_generate
+from .utils.concurrent_scraping import scrape_many
+from .utils.fetch_scheduler import fetch_owner, owner_for_user
+from .utils.timing import StageTimer
+from .utils.url_normalization import normalize_product_url
+
+logger = logging.getLogger(__name__)
+
+# Ventana de idempotencia para doble envío del mismo solicitante
+DEDUPE_SECONDS = 20
+
+# Valores por defecto que devuelve scrape_product_info cuando no encuentra datos
+SCRAPING_PLACEHOLDERS = {
+    'Titulo no encontrado',
+    'Descripcion no disponible',
+    'Precio no disponible',
+}
+
+
+def build_analysis_params(data):
+    """Extrae los parámetros del análisis desde request.POST (o un dict)"""
+    analysis_type = data.get('analysis_type', 'basic')
+    competitor_urls = []
+    if analysis_type == 'competitive':
+        # Campos competitor_1..competitor_N del formulario competitivo
+        max_competitors = app_setting('MAX_COMPETITORS', 5)
+        competitor_urls = [
+            data.get(f'competitor_{i}', '').strip()
+            for i in range(1, max_competitors + 1)
+            if data.get(f'competitor_{i}', '').strip()
+        ]
+    return {
+        'analysis_type': analysis_type,
+        'product_url': data.get('product_url') or data.get('main_product_url'),
+        'platform': (data.get('platform') or 'tiktok').lower(),
+        'target_audience': data.get('target_audience', ''),
+        'campaign_goal': data.get('campaign_goal', 'conversions'),
+        'tone': data.get('tone', 'professional'),
+        'api_key': data.get('api_key', '').strip(),
+        'competitor_urls': competitor_urls,
+    }
+
+
+def _clean_scraped_value(value):
+    """Descarta los placeholders del scraper"""
+    if not value or value in SCRAPING_PLACEHOLDERS:
+        return None
+    return value
+
+
+def _product_fields(product_url, result):
+    """Campos útiles de un resultado de scraping ({} si falló)"""
+    if not result or not result.get('success'):
+        logger.info(f"ℹ️ Sin datos de producto para {product_url}: {(result or {}).get('error')}")
+        return {}
+
+    data = result.get('data', {})
+    return {
+        'title': _clean_scraped_value(data.get('title')),
+        'price': _clean_scraped_value(data.get('price')),
+        'description': _clean_scraped_value(data.get('description')),
+    }
+
+
+def _fresh_snapshots(urls):
+    """Snapshots frescos de otras solicitudes (de cualquier usuario) por URL"""
+    try:
+        return ProductSnapshot.get_fresh_many(urls)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudieron leer snapshots: {str(e)}")
+        return {}
+
+
+def _snapshot_product(product_url, fields):
+    """Guarda lo scrapeado como snapshot compartido y agrega 'snapshot_id'"""
+    if not any(fields.get(key) for key in ('title', 'price', 'description')):
+        return fields
+    try:
+        snapshot = ProductSnapshot.record(product_url, fields)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo guardar el snapshot de {product_url}: {str(e)}")
+        return fields
+    return {**fields, 'snapshot_id': snapshot.pk} if snapshot else fields
+
+
+def scrape_product(product_url):
+    """Obtiene datos del producto (snapshot fresco o scraping con cache). Nunca lanza excepción."""
+    snapshot = _fresh_snapshots([product_url]).get(product_url)
+    if snapshot:
+        return snapshot.as_product_data()
+    try:
+        from .cache import cached_scrape_product_info
+        result = cached_scrape_product_info(product_url)
+    except Exception as e:
+        logger.warning(f"⚠️ Scraping falló para {product_url}: {str(e)}")
+        return {}
+    return _snapshot_product(product_url, _product_fields(product_url, result))
+
+
+def scrape_for_analysis(params):
+    """
+    Datos del producto; en análisis competitivo descarga también los
+    competidores en paralelo (con deadline) y los deja en 'competitors'.
+    Los competidores que fallan o no llegan a tiempo quedan solo con la URL.
+    """
+    competitor_urls = params.get('competitor_urls') or []
+    if params['analysis_type'] != 'competitive' or not competitor_urls:
+        return scrape_product(params['product_url'])
+
+    urls = [params['product_url'], *competitor_urls]
+    snapshots = _fresh_snapshots(urls)
+    missing = [url for url in urls if url not in snapshots]
+    results = {}
+    if missing:
+        try:
+            results = scrape_many(missing)
+        except Exception as e:
+            logger.warning(f"⚠️ Scraping competitivo falló: {str(e)}")
+
+    def fields_for(url):
+        if url in snapshots:
+            return snapshots[url].as_product_data()
+        return _snapshot_product(url, _product_fields(url, results.get(url)))
+
+    product_data = fields_for(params['product_url'])
+    product_data['competitors'] = [{'url': url, **fields_for(url)} for url in competitor_urls]
+    return product_data
+
+
+def _product_lines(product_data):
+    lines = []
+    if product_data.get('title'):
+        lines.append(f"Producto: {product_data['title']}.")
+    if product_data.get('price'):
+        lines.append(f"Precio: {product_data['price']}.")
+    if product_data.get('description'):
+        lines.append(f"Descripción: {product_data['description']}.")
+    return lines
+
+
+def _competitor_lines(product_data):
+    competitors = product_data.get('competitors') or []
+    if not competitors:
+        return []
+    lines = ['Competidores:']
+    for competitor in competitors:
+        line = f"- {competitor.get('title') or competitor['url']}"
+        if competitor.get('price'):
+            line += f" ({competitor['price']})"
+        lines.append(line)
+    return lines
+
+
+def _campaign_lines(params):
+    return [
+        f"Plataforma: {params['platform']}.",
+        f"Audiencia objetivo: {params['target_audience'] or 'general'}.",
+        f"Objetivo: {params['campaign_goal']}.",
+        f"Tono: {params['tone']}.",
+    ]
+
+
+def build_prompt(params, product_data=None):
+    """Construye el prompt para la IA a partir de los parámetros del análisis"""
+    product_data = product_data or {}
+
+    prompt_parts = [
+        f"Genera una estrategia de marketing para el producto en {params['product_url']}.",
+        *_product_lines(product_data),
+        *_competitor_lines(product_data),
+        *_campaign_lines(params),
+    ]
+    if params['analysis_type'] == 'competitive':
+        prompt_parts.insert(0, 'Análisis competitivo: compara con competidores similares y destaca ventajas.')
+    return '\n'.join(prompt_parts)
+
+
+# ✅ MODO STAGED: etapa 1 entiende el producto (cacheado por URL), etapa 2 arma la estrategia
+
+def get_generation_mode():
+    """'single' (un prompt) o 'staged' (resumen de producto + estrategia)"""
+    return app_setting('AI_GENERATION_MODE', 'single')
+
+
+def build_summary_prompt(product_url, product_data=None):
+    """Etapa 1: análisis del producto, independiente de plataforma, audiencia y tono"""
+    return '\n'.join([
+        f"Analiza el producto en {product_url}.",
+        *_product_lines(product_data or {}),
+        "Resume en máximo 150 palabras, en viñetas: qué es, para quién es, beneficios "
+        "principales, diferenciadores, objeciones típicas del comprador y precio percibido.",
+        "No escribas estrategia de marketing, solo el análisis del producto.",
+    ])
+
+
+def build_strategy_prompt(params, summary, product_data=None):
+    """Etapa 2: estrategia para la plataforma/audiencia a partir del resumen"""
+    prompt_parts = [
+        f"Genera una estrategia de marketing para el producto en {params['product_url']}.",
+        "Análisis del producto (ya realizado, úsalo sin repetirlo):",
+        summary.strip(),
+        *_competitor_lines(product_data or {}),
+        *_campaign_lines(params),
+    ]
+    if params['analysis_type'] == 'competitive':
+        prompt_parts.insert(0, 'Análisis competitivo: compara con competidores similares y destaca ventajas.')
+    return '\n'.join(prompt_parts)
+
+
+def get_product_summary(params, product_data, deadline):
+    """
+    Resumen del producto desde cache o generado con la IA (single-flight por
+    URL). Retorna (resumen, cacheado) o (None, False) si la IA falló.
+    """
+    product_url = params['product_url']
+    summary = CacheManager.get_cached_product_summary(product_url)
+    if summary:
+        return summary, True
+
+    flight = SingleFlight(f"summary:{CacheManager.get_product_summary_key(product_url)}")
+    if not flight.acquire():
+        # Otra petición del mismo producto ya lo está resumiendo
+        summary = flight.wait(
+            lambda: CacheManager.get_cached_product_summary(product_url, record_stats=False),
+            min(deadline, time.monotonic() + flight.wait_seconds)
+        )
+        if summary:
+            return summary, True
+
+    try:
+        # La etapa 1 usa como máximo la mitad del presupuesto: la estrategia necesita tiempo
+        stage_deadline = time.monotonic() + max(0, deadline - time.monotonic()) / 2
+        result = detect_and_generate(build_summary_prompt(product_url, product_data), params['api_key'],
+                                     deadline=stage_deadline)
+        if not result.get('success') or not (result.get('response') or '').strip():
+            logger.warning(f"⚠️ Resumen de producto falló para {product_url}: {result.get('error')}")
+            return None, False
+        CacheManager.cache_product_summary(product_url, result['response'])
+        return result['response'], False
+    finally:
+        flight.release()
+
+
+def prepare_prompt(params, product_data, timer, deadline=None):
+    """
+    Prompt final según AI_GENERATION_MODE. En modo staged, si el resumen no
+    se pudo generar se usa el prompt único con el tiempo que queda.
+    """
+    if get_generation_mode() == 'staged':
+        if deadline is None:
+            deadline = time.monotonic() + app_setting('AI_TIMEOUT_SECONDS', 60)
+        with timer.stage('summary'):
+            summary, summary_cached = get_product_summary(params, product_data, deadline)
+        timer.details.update(generation_mode='staged', summary_cached=summary_cached)
+        if summary:
+            with timer.stage('prompt'):
+                return build_strategy_prompt(params, summary, product_data)
+        timer.details['generation_mode'] = 'single'
+
+    with timer.stage('prompt'):
+        return build_prompt(params, product_data)
+
+
+def get_usage_payload(user):
+    """Estado de contador para refrescar UI en cliente"""
+    if not user or not user.is_authenticated or not hasattr(user, 'profile'):
+        return {}
+    profile = user.profile
+    return {
+        'usage': {
+            'this_month': profile.analyses_this_month,
+            'limit': profile.analyses_limit_monthly,
+            'remaining': profile.analyses_remaining,
+            'plan': profile.plan
+        }
+    }
+
+
+def load_user(user_id):
+    """Carga el usuario (con perfil) para ejecutar el pipeline fuera del request"""
+    if user_id is None:
+        return None
+    return User.objects.filter(pk=user_id).select_related('profile').first()
+
+
+def get_cached_result(params, record_stats=True):
+    """
+    Resultado cacheado para estos parámetros, con el mismo formato que
+    generate_analysis ('cached': True), o None.
+    """
+    try:
+        cached = CacheManager.get_cached_analysis(params, record_stats=record_stats)
+    except Exception as e:
+        logger.warning(f"⚠️ Error leyendo cache de análisis: {str(e)}")
+        return None
+    if not cached or not (cached.get('result') or {}).get('response'):
+        return None
+    result = cached['result']
+    return {
+        'success': True,
+        'product_data': result.get('product_data') or {},
+        'response': result['response'],
+        'provider': result.get('provider'),
+        'model': result.get('model'),
+        'cached': True,
+    }
+
+
+def store_result(params, product_data, ai_response, generation_seconds, provider=None, model=None):
+    """Guarda en cache el resultado de IA para futuras peticiones idénticas"""
+    try:
+        CacheManager.cache_analysis_result(params, {
+            'response': ai_response,
+            'product_data': product_data,
+            'generation_seconds': round(generation_seconds, 3),
+            'provider': provider,
+            'model': model,
+        })
+    except Exception as e:
+        logger.warning(f"⚠️ Error guardando cache de análisis: {str(e)}")
+
+
+def release_dedupe(dedupe_key):
+    """Borra la marca de idempotencia para permitir reintentar de inmediato"""
+    if dedupe_key:
+        try:
+            cache.delete(dedupe_key)
+        except Exception:
+            pass
+
+
+def _product_row_fields(product_data):
+    """Campos de producto de la fila; con snapshot la descripción no se duplica"""
+    snapshot_id = product_data.get('snapshot_id')
+    return {
+        'product_title': product_data.get('title') or 'Producto analizado',
+        'product_price': product_data.get('price'),
+        'product_description': None if snapshot_id else product_data.get('description'),
+        'product_snapshot_id': snapshot_id,
+    }
+
+
+def save_analysis(params, user, product_data, ai_response, dedupe_key=None, cached=False, timer=None):
+    """
+    Guarda el AnalysisHistory e incrementa el contador del usuario.
+
+    Retorna el mismo formato que run_analysis_pipeline.
+    """
+    timer = timer or StageTimer()
+    write_started = time.monotonic()
+    try:
+        analysis = AnalysisHistory.objects.create(
+            user=user,
+            product_url=params['product_url'],
+            **_product_row_fields(product_data),
+            platform=params['platform'],
+            target_audience=params['target_audience'],
+            campaign_goal=params['campaign_goal'],
+            budget='medium',
+            tone=params['tone'],
+            analysis_type=params['analysis_type'],
+            ai_response=ai_response,
+            ai_model_used=timer.model or AnalysisHistory._meta.get_field('ai_model_used').default,
+            processing_time=round(timer.elapsed(), 3),
+            additional_data=timer.as_data(),
+            success=True
+        )
+    except Exception as e:
+        logger.error(f"❌ Error guardando análisis: {str(e)}")
+        # Limpiar marca de idempotencia si falló creación
+        release_dedupe(dedupe_key)
+        return {
+            'success': False,
+            'status': 500,
+            'error': f'No se pudo guardar el análisis: {str(e)}'
+        }
+
+    # Incrementar contadores SOLO después de análisis exitoso
+    if user is not None and analysis.success:
+        try:
+            # Incrementar SOLO una vez por análisis exitoso
+            incremented = user.profile.add_analysis_count_atomic()
+            if not incremented:
+                logger.warning(f"⚠️ Análisis creado pero contador no incrementado para {user.username}")
+            user.profile.refresh_from_db()
+        except Exception as e:
+            logger.error(f"❌ Error incrementando contador: {str(e)}")
+    timer.record('db_write', time.monotonic() - write_started)
+
+    payload = {
+        'success': True,
+        'status': 200,
+        'analysis_id': str(analysis.id),
+        'response': analysis.ai_response,
+        'cached': cached,
+        'product': {
+            'title': analysis.product_title,
+            'price': analysis.product_price,
+        },
+        **get_usage_payload(user),
+    }
+
+    # Un doble envío del mismo solicitante recibe este mismo análisis
+    if dedupe_key:
+        try:
+            result = {key: value for key, value in payload.items() if key != 'status'}
+            cache.set(dedupe_key, {'result': result}, DEDUPE_SECONDS)
+        except Exception:
+            pass
+    return payload
+
+
+def get_analysis_flight(params):
+    """Lease compartido para análisis idénticos (misma clave que el cache de resultados)"""
+    return SingleFlight(f"analysis:{CacheManager._generate_analysis_hash(params)}")
+
+
+def generate_analysis(params, timer=None):
+    """
+    Scraping → prompt → IA, guardando el resultado en el cache de análisis.
+    Retorna {'success', 'product_data', 'response', 'provider', 'model', 'cached'}
+    o un error con 'status'.
+    """
+    timer = timer or StageTimer()
+    deadline = time.monotonic() + app_setting('AI_TIMEOUT_SECONDS', 60)
+    with timer.stage('scrape'):
+        product_data = scrape_for_analysis(params)
+    prompt = prepare_prompt(params, product_data, timer, deadline)
+
+    started = time.monotonic()
+    with timer.stage('provider'):
+        ai_result = detect_and_generate(prompt, params['api_key'], deadline=deadline)
+    if not ai_result.get('success'):
+        logger.error(f"❌ Error IA: {ai_result.get('error')}")
+        return {
+            'success': False,
+            'status': 400,
+            'error': ai_result.get('error', 'Error generando estrategia')
+        }
+
+    timer.set_provider(ai_result.get('provider'), ai_result.get('model'))
+    store_result(params, product_data, ai_result['response'], time.monotonic() - started,
+                 provider=ai_result.get('provider'), model=ai_result.get('model'))
+    return {
+        'success': True,
+        'product_data': product_data,
+        'response': ai_result['response'],
+        'provider': ai_result.get('provider'),
+        'model': ai_result.get('model'),
+        'cached': False,
+    }
+
+
+def generate_coalesced(params, timer=None):
+    """
+    Igual que generate_analysis pero con single-flight: si otra petición
+    idéntica ya está generando, espera su resultado en lugar de llamar otra
+    vez al proveedor.
+    """
+    timer = timer or StageTimer()
+    cached_result = get_cached_result(params)
+    if cached_result is not None:
+        timer.set_provider(cached_result['provider'], cached_result['model'], cached=True)
+        return cached_result
+
+    # Sin cache de resultados no hay dónde publicar el resultado del líder
+    if CacheManager.get_analysis_timeout() <= 0:
+        return generate_analysis(params, timer)
+
+    flight = get_analysis_flight(params)
+    deadline = time.monotonic() + flight.wait_seconds
+    while True:
+        if flight.acquire():
+            try:
+                # El líder anterior pudo terminar justo antes de tomar el lease
+                cached_result = get_cached_result(params, record_stats=False)
+                if cached_result is None:
+                    return generate_analysis(params, timer)
+            finally:
+                flight.release()
+        else:
+            logger.info(f"⏳ Esperando análisis idéntico en curso: {flight.key}")
+            with timer.stage('coalesced_wait'):
+                cached_result = flight.wait(lambda: get_cached_result(params, record_stats=False), deadline)
+
+        if cached_result is not None:
+            CacheManager.record_analysis_cache_event('coalesced')
+            timer.set_provider(cached_result['provider'], cached_result['model'], cached=True)
+            return cached_result
+
+        if time.monotonic() >= deadline:
+            # El líder tarda demasiado: generar por cuenta propia
+            logger.warning(f"⚠️ Timeout esperando single-flight {flight.key}, generando sin coalescing")
+            return generate_analysis(params, timer)
+        # El líder falló sin publicar resultado: reintentar tomar el lease
+
+
+def run_analysis_pipeline(params, user_id=None, dedupe_key=None, timer=None, owner=None):
+    """
+    Ejecuta el análisis completo: scraping → prompt → IA → AnalysisHistory.
+
+    owner: identidad del solicitante en la cola justa de descargas (usuario
+    o IP); sin ella se usa la del usuario y los anónimos comparten turno.
+
+    Retorna un dict con 'success' y 'status' (código HTTP sugerido); si tiene
+    éxito incluye el payload que espera el frontend.
+    """
+    timer = timer or StageTimer()
+    user = load_user(user_id)
+
+    with fetch_owner(owner or owner_for_user(user_id)):
+        outcome = generate_coalesced(params, timer)
+    if not outcome['success']:
+        release_dedupe(dedupe_key)
+        return outcome
+
+    return save_analysis(params, user, outcome['product_data'], outcome['response'],
+                         dedupe_key=dedupe_key, cached=outcome['cached'], timer=timer)
+
+
+def run_analysis_job(params, user_id=None, dedupe_key=None, timer=None, owner=None):
+    """Variante para la cola de jobs: sin respuesta HTTP, cierra el desglose al terminar"""
+    timer = timer or StageTimer()
+    result = run_analysis_pipeline(params, user_id=user_id, dedupe_key=dedupe_key, timer=timer, owner=owner)
+    finalize_timings(result, timer)
+    return result
+
+
+def finalize_timings(result, timer):
+    """
+    Guarda el desglose final (con db_write y serialización, que ocurren
+    después de crear el registro) y el processing_time total.
+    """
+    if not result.get('success') or not result.get('analysis_id'):
+        return
+    try:
+        AnalysisHistory.objects.filter(pk=result['analysis_id']).update(
+            processing_time=round(timer.elapsed(), 3),
+            additional_data=timer.as_data(),
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo guardar el desglose de tiempos: {str(e)}")
+
+
+# ✅ ANÁLISIS EN LOTE: N productos con la misma configuración de campaña
+
+def parse_batch_urls(values):
+    """
+    Lista de URLs del lote a partir de request.POST.getlist (cada valor puede
+    traer varias URLs separadas por saltos de línea). Quita duplicados.
+    """
+    urls, seen = [], set()
+    for value in values:
+        for line in (value or '').splitlines():
+            url = line.strip()
+            if not url:
+                continue
+            normalized = normalize_product_url(url)
+            if normalized in seen:
+                continue
+            seen.add(normalized)
+            urls.append(url)
+    return urls
+
+
+def _generate_batch_item(params, timer, owner):
+    try:
+        with fetch_owner(owner):
+            return generate_coalesced(params, timer)
+    finally:
+        # Los snapshots abren una conexión por hilo del lote
+        connection.close()
+
+
+def run_batch_pipeline(params, product_urls, user_id=None, batch_id=None, progress=None, owner=None):
+    """
+    Ejecuta un análisis por URL con concurrencia limitada (BATCH_CONCURRENCY).
+
+    Los análisis exitosos se guardan con un solo bulk_create y se cobran con
+    una sola actualización atómica del perfil. progress(index, item) se llama
+    desde el hilo coordinador cada vez que termina un producto.
+
+    Retorna el resumen del lote con el resultado de cada producto.
+    """
+    batch_id = batch_id or str(uuid.uuid4())
+    user = load_user(user_id)
+    concurrency = max(1, app_setting('BATCH_CONCURRENCY', 4))
+    items = [{'index': index, 'product_url': url, 'status': 'pending'} for index, url in enumerate(product_urls)]
+    outcomes = {}
+
+    timers = [StageTimer() for _ in product_urls]
+    owner = owner or owner_for_user(user_id)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='analysis-batch') as executor:
+        futures = {
+            executor.submit(_generate_batch_item, {**params, 'product_url': url}, timers[index], owner): index
+            for index, url in enumerate(product_urls)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                logger.error(f"❌ Lote {batch_id}: producto {index} falló: {str(e)}")
+                outcome = {'success': False, 'error': f'Error interno: {str(e)}'}
+
+            outcomes[index] = outcome
+            items[index]['status'] = 'generated' if outcome['success'] else 'failed'
+            if not outcome['success']:
+                items[index]['error'] = outcome.get('error', 'Error generando estrategia')
+            if progress is not None:
+                progress(index, items[index])
+
+    # Solo se guardan (y cobran) los análisis que el plan permite. Cobro e
+    # inserción van en la misma transacción: si el insert falla no se cobra nada
+    succeeded = [index for index in range(len(items)) if outcomes[index]['success']]
+    has_profile = user is not None and hasattr(user, 'profile')
+    try:
+        with transaction.atomic():
+            if has_profile:
+                charged = user.profile.add_analysis_count_bulk_atomic(len(succeeded))
+                for index in succeeded[charged:]:
+                    items[index].update(status='failed', error='Límite mensual alcanzado antes de guardar este análisis.')
+                succeeded = succeeded[:charged]
+
+            analyses = []
+            for index in succeeded:
+                outcome = outcomes[index]
+                product_data = outcome['product_data']
+                timer = timers[index]
+                analyses.append(AnalysisHistory(
+                    user=user,
+                    product_url=items[index]['product_url'],
+                    **_product_row_fields(product_data),
+                    platform=params['platform'],
+                    target_audience=params['target_audience'],
+                    campaign_goal=params['campaign_goal'],
+                    budget='medium',
+                    tone=params['tone'],
+                    analysis_type='batch',
+                    ai_response=outcome['response'],
+                    ai_model_used=timer.model or AnalysisHistory._meta.get_field('ai_model_used').default,
+                    processing_time=round(timer.elapsed(), 3),
+                    success=True,
+                    # bulk_create no llama a save(): el token se asigna aquí
+                    share_token=uuid.uuid4().hex,
+                    additional_data={**timer.as_data(), 'batch_id': batch_id, 'batch_index': index},
+                ))
+            AnalysisHistory.objects.bulk_create(analyses)
+    except Exception as e:
+        logger.error(f"❌ Error guardando lote {batch_id}: {str(e)}")
+        return {
+            'success': False,
+            'status': 500,
+            'batch_id': batch_id,
+            'error': f'No se pudo guardar el lote: {str(e)}'
+        }
+    if has_profile:
+        user.profile.refresh_from_db()
+    if user is not None and analyses:
+        # bulk_create no dispara post_save: invalidar a mano lo cacheado del usuario
+        CacheManager.invalidate_user_cache(user.id)
+
+    for index, analysis in zip(succeeded, analyses):
+        items[index].update(
+            status='done',
+            analysis_id=str(analysis.id),
+            response=analysis.ai_response,
+            cached=outcomes[index]['cached'],
+            product={'title': analysis.product_title, 'price': analysis.product_price},
+        )
+
+    failed = sum(1 for item in items if item['status'] == 'failed')
+    logger.info(f"📦 Lote {batch_id}: {len(items) - failed}/{len(items)} análisis guardados")
+    summary = {
+        'success': failed < len(items),
+        'status': 200,
+        'batch_id': batch_id,
+        'total': len(items),
+        'succeeded': len(items) - failed,
+        'failed': failed,
+        'items': items,
+        **get_usage_payload(user),
+    }
+    if not summary['success']:
+        summary.update(status=400, error='Ningún producto del lote pudo analizarse.')
+    return summary
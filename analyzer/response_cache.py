@@ -0,0 +1,192 @@
+# analyzer/response_cache.py - CACHE DE RESPUESTAS HTTP (bytes + headers, ETag y variantes comprimidas)
+
+import gzip
+import hashlib
+import logging
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from .cache import CacheManager
+from .conf import app_setting
+
+try:
+    import brotli
+except ImportError:  # Opcional: sin el paquete solo se guarda la variante gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+MIN_COMPRESS_BYTES = 512
+
+# Headers que se recalculan al servir (o que nunca deben compartirse)
+SKIPPED_HEADERS = {'content-length', 'content-encoding', 'etag', 'set-cookie'}
+
+RESPONSE_CACHE_COUNTERS = {
+    'hits': 'stats:response_cache:hits',
+    'misses': 'stats:response_cache:misses',
+    'not_modified': 'stats:response_cache:not_modified',
+    'uncacheable': 'stats:response_cache:uncacheable',
+}
+
+
+def _accepted_encodings(request):
+    """Codificaciones aceptadas (sin las marcadas con q=0)"""
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = part.strip().partition(';')
+        if name and params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _if_none_match(request):
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    return {tag.strip() for tag in header.split(',') if tag.strip()}
+
+
+def build_entry(response):
+    """
+    Entrada de cache a partir de una respuesta renderizada: cuerpo, headers,
+    ETag fuerte (SHA-256 del cuerpo) y variantes comprimidas calculadas una
+    sola vez aquí, no en cada petición.
+    """
+    body = response.content
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    entry = {
+        'status': response.status_code,
+        'headers': [
+            (name, value) for name, value in response.items()
+            if name.lower() not in SKIPPED_HEADERS
+        ],
+        'etag': digest,
+        'body': body,
+        'variants': {},
+    }
+
+    content_type = response.get('Content-Type', '')
+    if len(body) >= MIN_COMPRESS_BYTES and content_type.startswith(COMPRESSIBLE_TYPES):
+        # mtime=0: mismo cuerpo → mismos bytes comprimidos en todos los workers
+        compressed = gzip.compress(body, compresslevel=6, mtime=0)
+        if len(compressed) < len(body):
+            entry['variants']['gzip'] = compressed
+        if brotli is not None and app_setting('RESPONSE_CACHE_BROTLI', True):
+            compressed = brotli.compress(body, quality=5)
+            if len(compressed) < len(body):
+                entry['variants']['br'] = compressed
+    return entry
+
+
+def serve_entry(request, entry, extra_headers=None):
+    """Respuesta desde la entrada: 304 si el ETag coincide, si no la mejor variante aceptada"""
+    accepted = _accepted_encodings(request)
+    encoding = next((name for name in ('br', 'gzip') if name in entry['variants'] and name in accepted), None)
+    # Un ETag fuerte identifica bytes exactos: cada codificación tiene el suyo
+    etag = f'"{entry["etag"]}-{encoding}"' if encoding else f'"{entry["etag"]}"'
+
+    if_none_match = _if_none_match(request)
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+        CacheManager.incr_counter(RESPONSE_CACHE_COUNTERS['not_modified'])
+    else:
+        response = HttpResponse(entry['variants'][encoding] if encoding else entry['body'], status=entry['status'])
+        for name, value in entry['headers']:
+            response[name] = value
+        if encoding:
+            response['Content-Encoding'] = encoding
+
+    response['ETag'] = etag
+    for name, value in (extra_headers or {}).items():
+        response[name] = value
+    if entry['variants']:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def _is_cacheable(request, response, vary_on_csrf):
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    if response.has_header('Content-Encoding'):
+        return False
+    if 'no-store' in response.get('Cache-Control', '') or 'private' in response.get('Cache-Control', ''):
+        return False
+    # La página lleva un token CSRF: solo sirve para la cookie con la que se generó
+    if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        if not vary_on_csrf or not request.COOKIES.get(settings.CSRF_COOKIE_NAME):
+            return False
+    return True
+
+
+def cached_response(timeout=300, tags=None, per_user=False):
+    """
+    Decorador de vistas: guarda el cuerpo ya renderizado y sus headers en el
+    cache compartido y lo sirve sin ejecutar la vista.
+
+    - Responde 304 a If-None-Match sin renderizar ni descomprimir nada.
+    - gzip (y brotli si el paquete está instalado) se comprimen al guardar.
+    - per_user: una entrada por usuario (y por cookie CSRF, para páginas con
+      formularios), invalidada con el tag del usuario. Sin per_user la
+      entrada solo distingue visitantes anónimos de autenticados.
+    - tags: lista o función(request) → lista; invalidar un tag descarta
+      todas sus respuestas (CacheManager.invalidate_tag).
+
+    Solo GET/HEAD con 200, sin cookies nuevas ni Cache-Control privado.
+    """
+    def decorator(view):
+        view_name = f"{view.__module__}.{view.__name__}"
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or timeout <= 0:
+                return view(request, *args, **kwargs)
+
+            key_tags = list(tags(request) if callable(tags) else (tags or ()))
+            if per_user and request.user.is_authenticated:
+                csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+                variant = f"user:{request.user.id}:{hashlib.md5(csrf_cookie.encode()).hexdigest()[:12]}"
+                key_tags.append(CacheManager.user_tag(request.user.id))
+            else:
+                variant = 'auth' if request.user.is_authenticated else 'anon'
+            key_str = f"{request.get_full_path()}|{variant}"
+            cache_key = CacheManager.tagged_key(
+                f"response:{view_name}:{hashlib.md5(key_str.encode()).hexdigest()}", key_tags
+            )
+
+            extra_headers = {}
+            if per_user:
+                extra_headers['Cache-Control'] = 'private, no-cache'
+
+            entry = cache.get(cache_key)
+            if entry is not None:
+                CacheManager.incr_counter(RESPONSE_CACHE_COUNTERS['hits'])
+                logger.debug(f"📋 Served from response cache: {request.path}")
+                response = serve_entry(request, entry, extra_headers)
+                patch_vary_headers(response, ('Cookie',))
+                return response
+
+            CacheManager.incr_counter(RESPONSE_CACHE_COUNTERS['misses'])
+            response = view(request, *args, **kwargs)
+            if not _is_cacheable(request, response, vary_on_csrf=per_user):
+                CacheManager.incr_counter(RESPONSE_CACHE_COUNTERS['uncacheable'])
+                return response
+
+            entry = build_entry(response)
+            cache.set(cache_key, entry, timeout)
+            response = serve_entry(request, entry, extra_headers)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+
+        return wrapper
+    return decorator
+
+
+def get_response_cache_stats():
+    values = cache.get_many(list(RESPONSE_CACHE_COUNTERS.values()))
+    stats = {name: values.get(key, 0) for name, key in RESPONSE_CACHE_COUNTERS.items()}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0
+    return stats
@@ -1,3 +1,1902 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import threading
+import time
+from datetime import timedelta
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+
+from .benchmarks.scraping import compare_with_baseline, run_scraping_benchmark
+from .cache_backends import get_cache_metrics, recorder
+from .cache import (
+    CachedValue, CacheManager, HostBackoff, SingleFlight, cache_result, cached_scrape_product_info,
+    get_or_recompute,
+)
+from .jobs import AnalysisJobQueue
+from .models import AnalysisHistory, MarketingTemplate, ProductSnapshot
+from .pipeline import prepare_prompt, run_batch_pipeline
+from .response_cache import cached_response
+from .utils import ai_integration, cache_tags
+from .utils.ai_integration import (
+    AIProviderError, ProviderClientRegistry, detect_and_generate, is_fake_api_key, stream_and_generate,
+)
+from .utils.circuit_breaker import CircuitBreaker, CircuitBreakerRegistry
+from .utils.concurrent_scraping import scrape_many
+from .utils.extraction import ProductMetaParser, extract_product_data
+from .utils.extraction_rules import ExtractionRuleRegistry
+from .utils.fetch_scheduler import FetchScheduler, fetch_owner
+from .utils.http_client import ScrapingHttpClient
+from .utils.near_cache import NearCache, near_cache
+from .utils.page_cache import ProductPageCache, product_page_cache
+from .utils.scraping import _parse_streaming, scrape_product_info
+from .utils.timing import StageTimer, percentile
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'analyzer.cache_backends.InstrumentedLocMemCache',
+        'LOCATION': 'analyzer-tests',
+    }
+}
+TEST_APP_SETTINGS = {
+    **settings.AFFILIATE_STRATEGIST_SETTINGS,
+    'AI_FAKE_PROVIDER_ENABLED': True,
+}
+
+PRODUCT = {'title': 'Zapatilla Runner', 'price': '$49.99', 'description': 'Ligera y cómoda'}
+
+# Proveedor falso sin pausas entre fragmentos
+fast_fake_stream = partial(ai_integration.stream_strategy_fake, delay=0)
+
+
+def analysis_data(**overrides):
+    return {
+        'product_url': 'https://shop.example.com/p/runner',
+        'api_key': 'fake-test',
+        'platform': 'instagram',
+        'target_audience': 'corredores',
+        **overrides,
+    }
+
+
+def read_events(response):
+    """[(evento, payload)] de una respuesta SSE (los comentarios ': ...' se omiten)"""
+    body = b''.join(response.streaming_content).decode()
+    events = []
+    for block in body.split('\n\n'):
+        lines = block.strip().splitlines()
+        if not lines or lines[0].startswith(':'):
+            continue
+        events.append((lines[0].removeprefix('event: '), json.loads(lines[1].removeprefix('data: '))))
+    return events
+
+
+def wait_for_job(client, job_url, timeout=10, **extra):
+    """
+    Espera el job leyendo la cola (solo cache) y consulta el endpoint una vez
+    al terminar: con SQLite en memoria, sondear la vista mientras el worker
+    escribe bloquea tablas.
+    """
+    job_id = job_url.rstrip('/').rsplit('/', 1)[-1]
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = AnalysisJobQueue.get_job(job_id) or {}
+        if job.get('status') in ('done', 'failed'):
+            return client.get(job_url, **extra).json()
+        time.sleep(0.05)
+    raise AssertionError(f'El job no terminó en {timeout}s')
+
+
+class LocalSite:
+    """
+    Servidor HTTP local para probar el scraping sin red. routes mapea path (sin
+    query) -> función(handler) que escribe la respuesta; hits cuenta peticiones.
+    """
+
+    def __init__(self, routes):
+        site = self
+        self.routes = routes
+        self.hits = {}
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                site.hits[path] = site.hits.get(path, 0) + 1
+                site.routes[path](self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.server.handle_error = lambda request, address: None  # Clientes que cortan a propósito
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server.server_address[1]}{path}'
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def send_page(handler, body, status=200, headers=None):
+    body = body.encode('utf-8') if isinstance(body, str) else body
+    handler.send_response(status)
+    handler.send_header('Content-Type', 'text/html; charset=utf-8')
+    handler.send_header('Content-Length', str(len(body)))
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+class CacheIsolationMixin:
+    """Cache y near cache vacíos en cada test"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        near_cache.clear()
+
+
+# ✅ SSE (user-002)
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS=TEST_APP_SETTINGS)
+@mock.patch('analyzer.utils.ai_integration.stream_strategy_fake', fast_fake_stream)
+class AnalyzeStreamTests(CacheIsolationMixin, TestCase):
+
+    @mock.patch('analyzer.pipeline.scrape_product', return_value=dict(PRODUCT))
+    def test_events_arrive_in_order_and_analysis_is_saved(self, _scrape):
+        response = self.client.post('/api/analyze-stream/', analysis_data())
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        events = read_events(response)
+        names = [name for name, _ in events]
+        self.assertEqual(names[0], 'start')
+        self.assertEqual(names[1], 'product')
+        self.assertEqual(names[-1], 'done')
+        self.assertTrue(all(name == 'chunk' for name in names[2:-1]))
+        self.assertGreater(names.count('chunk'), 1)
+
+        done = events[-1][1]
+        self.assertTrue(done['success'])
+        text = ''.join(payload['text'] for name, payload in events if name == 'chunk')
+        analysis = AnalysisHistory.objects.get(pk=done['analysis_id'])
+        self.assertEqual(analysis.ai_response, text)
+        self.assertEqual(done['response'], text)
+
+    @mock.patch('analyzer.pipeline.scrape_product', return_value=dict(PRODUCT))
+    def test_provider_error_ends_with_error_event(self, _scrape):
+        def failing_stream(prompt, api_key, meta=None):
+            yield 'Inicio '
+            raise AIProviderError('Error con Cohere: servicio no disponible')
+
+        with mock.patch('analyzer.views.stream_and_generate', failing_stream):
+            events = read_events(self.client.post('/api/analyze-stream/', analysis_data()))
+
+        self.assertEqual([name for name, _ in events], ['start', 'product', 'chunk', 'error'])
+        self.assertFalse(events[-1][1]['success'])
+        self.assertIn('servicio no disponible', events[-1][1]['error'])
+        self.assertFalse(AnalysisHistory.objects.exists())
+
+        # La marca de doble envío se libera: el reintento no es un duplicado
+        events = read_events(self.client.post('/api/analyze-stream/', analysis_data()))
+        self.assertEqual(events[-1][0], 'done')
+
+    @mock.patch('analyzer.pipeline.scrape_product', return_value=dict(PRODUCT))
+    def test_unexpected_error_ends_with_error_event_and_releases_dedupe(self, _scrape):
+        with mock.patch('analyzer.views.prepare_prompt', side_effect=RuntimeError('plantilla rota')):
+            events = read_events(self.client.post('/api/analyze-stream/', analysis_data()))
+
+        self.assertEqual([name for name, _ in events], ['start', 'product', 'error'])
+        self.assertFalse(events[-1][1]['success'])
+        self.assertNotIn('plantilla rota', events[-1][1]['error'])
+
+        events = read_events(self.client.post('/api/analyze-stream/', analysis_data()))
+        self.assertEqual(events[-1][0], 'done')
+
+    @mock.patch('analyzer.pipeline.scrape_product', return_value=dict(PRODUCT))
+    def test_provider_stage_excludes_client_read_time(self, _scrape):
+        response = self.client.post('/api/analyze-stream/', analysis_data())
+        body = b''
+        for part in response.streaming_content:
+            body += part
+            time.sleep(0.02)  # Cliente lento
+        done = json.loads(body.decode().strip().split('\n\n')[-1].split('data: ', 1)[1])
+
+        timings = AnalysisHistory.objects.get(pk=done['analysis_id']).additional_data['timings_ms']
+        self.assertLess(timings['provider'], 20)
+
+    def test_missing_api_key_is_rejected(self):
+        response = self.client.post('/api/analyze-stream/', analysis_data(api_key=''))
+        self.assertEqual(response.status_code, 400)
+
+
+# ✅ COLA DE JOBS Y ESTADO (user-001)
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS=TEST_APP_SETTINGS)
+@mock.patch('analyzer.pipeline.scrape_product', return_value=dict(PRODUCT))
+class AnalysisJobTests(CacheIsolationMixin, TransactionTestCase):
+
+    def test_job_runs_in_background_and_reports_result(self, _scrape):
+        response = self.client.post('/', analysis_data(mode='job'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 202)
+        payload = response.json()
+        self.assertEqual(payload['status'], 'queued')
+
+        status = wait_for_job(self.client, payload['status_url'], REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(status['status'], 'done')
+        self.assertTrue(status['result']['success'])
+        self.assertTrue(AnalysisHistory.objects.filter(pk=status['result']['analysis_id']).exists())
+
+    def test_status_is_only_visible_to_its_owner(self, _scrape):
+        payload = self.client.post('/', analysis_data(mode='job'), REMOTE_ADDR='10.0.0.1').json()
+        wait_for_job(self.client, payload['status_url'], REMOTE_ADDR='10.0.0.1')
+
+        response = self.client.get(payload['status_url'], REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 404)
+
+        user = User.objects.create_user('owner-test', password='pw-123456')
+        self.client.force_login(user)
+        response = self.client.get(payload['status_url'], REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 404)
+
+    def test_unknown_job_returns_404(self, _scrape):
+        response = self.client.get('/api/analysis-status/00000000-0000-0000-0000-000000000000/')
+        self.assertEqual(response.status_code, 404)
+
+
+class FakeProviderSettingTests(SimpleTestCase):
+
+    def test_fake_keys_are_rejected_unless_enabled(self):
+        with override_settings(AFFILIATE_STRATEGIST_SETTINGS={}):
+            self.assertFalse(is_fake_api_key('fake-test'))
+        with override_settings(AFFILIATE_STRATEGIST_SETTINGS={'AI_FAKE_PROVIDER_ENABLED': True}):
+            self.assertTrue(is_fake_api_key('fake-test'))
+            self.assertFalse(is_fake_api_key('AIza-real'))
+
+
+# ✅ REGISTRO DE CLIENTES DE IA (user-003)
+
+class ProviderClientRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.built = []
+
+    def factory(self, api_key):
+        client = object()
+        self.built.append(api_key)
+        return client
+
+    def test_reuses_client_per_provider_and_key(self):
+        registry = ProviderClientRegistry(max_size=4)
+        first = registry.get('gemini', 'key-a', self.factory)
+
+        self.assertIs(registry.get('gemini', 'key-a', self.factory), first)
+        self.assertIsNot(registry.get('gemini', 'key-b', self.factory), first)
+        self.assertIsNot(registry.get('cohere', 'key-a', self.factory), first)
+        self.assertEqual(self.built, ['key-a', 'key-b', 'key-a'])
+        self.assertEqual((registry.stats['hits'], registry.stats['misses']), (1, 3))
+
+    def test_evicts_least_recently_used(self):
+        registry = ProviderClientRegistry(max_size=2)
+        first = registry.get('gemini', 'key-a', self.factory)
+        registry.get('gemini', 'key-b', self.factory)
+        registry.get('gemini', 'key-a', self.factory)  # key-a pasa a ser la más reciente
+        registry.get('gemini', 'key-c', self.factory)
+
+        self.assertIs(registry.get('gemini', 'key-a', self.factory), first)
+        registry.get('gemini', 'key-b', self.factory)
+        self.assertEqual(self.built, ['key-a', 'key-b', 'key-c', 'key-b'])
+        stats = registry.get_stats()
+        self.assertEqual((stats['size'], stats['evictions']), (2, 2))
+
+    def test_expired_client_is_rebuilt(self):
+        registry = ProviderClientRegistry(ttl_seconds=60)
+        first = registry.get('gemini', 'key-a', self.factory)
+        with mock.patch('analyzer.utils.ai_integration.time.monotonic', return_value=time.monotonic() + 61):
+            second = registry.get('gemini', 'key-a', self.factory)
+
+        self.assertIsNot(second, first)
+        self.assertEqual(registry.stats['expirations'], 1)
+
+    def test_api_key_is_not_stored_in_clear(self):
+        registry = ProviderClientRegistry()
+        registry.get('gemini', 'AIza-secreta', self.factory)
+        self.assertFalse(any('AIza-secreta' in key for key in registry._clients))
+
+
+# ✅ CACHE DE RESULTADOS (user-004)
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS=TEST_APP_SETTINGS)
+class AnalysisResultCacheTests(CacheIsolationMixin, TestCase):
+
+    @mock.patch('analyzer.pipeline.scrape_product', return_value=dict(PRODUCT))
+    def test_equivalent_request_is_served_from_cache(self, scrape):
+        first = self.client.post('/', analysis_data(product_url='https://shop.example.com/p/runner?utm_source=ig'),
+                                 REMOTE_ADDR='10.0.1.1').json()
+        second = self.client.post('/', analysis_data(product_url='https://SHOP.example.com/p/runner#reviews'),
+                                  REMOTE_ADDR='10.0.1.2').json()
+
+        self.assertTrue(first['success'])
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['response'], first['response'])
+        self.assertEqual(scrape.call_count, 1)
+
+        stats = CacheManager.get_analysis_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    @mock.patch('analyzer.pipeline.scrape_product', return_value=dict(PRODUCT))
+    def test_different_campaign_is_a_miss(self, scrape):
+        self.client.post('/', analysis_data(), REMOTE_ADDR='10.0.1.1')
+        other = self.client.post('/', analysis_data(platform='tiktok'), REMOTE_ADDR='10.0.1.2').json()
+
+        self.assertFalse(other['cached'])
+        self.assertEqual(scrape.call_count, 2)
+
+    def test_cache_key_ignores_api_key_and_tracking_params(self):
+        params = {
+            'analysis_type': 'basic', 'product_url': 'https://www.shop.example.com/p/runner?utm_medium=x&b=2&a=1',
+            'platform': 'instagram', 'target_audience': '', 'campaign_goal': 'conversions',
+            'tone': 'professional', 'api_key': 'key-a', 'competitor_urls': [],
+        }
+        same = {**params, 'api_key': 'key-b', 'product_url': 'https://shop.example.com/p/runner?a=1&b=2'}
+        self.assertEqual(CacheManager._generate_analysis_hash(params), CacheManager._generate_analysis_hash(same))
+
+
+# ✅ SINGLE-FLIGHT Y DOBLE ENVÍO (user-005)
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS=TEST_APP_SETTINGS)
+@mock.patch('analyzer.pipeline.scrape_product', return_value=dict(PRODUCT))
+class SingleFlightTests(CacheIsolationMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.provider_calls = 0
+        self.calls_lock = threading.Lock()
+
+    def slow_generate(self, prompt, api_key, **kwargs):
+        with self.calls_lock:
+            self.provider_calls += 1
+        time.sleep(0.5)
+        return {'success': True, 'response': 'Estrategia coalescida', 'provider': 'fake', 'model': 'fake-stream'}
+
+    def post_in_thread(self, results, ip, user=None):
+        try:
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            response = client.post('/', analysis_data(), REMOTE_ADDR=ip)
+            results[ip] = (response.status_code, response.json())
+        finally:
+            connection.close()
+
+    def test_identical_analyses_call_the_provider_once(self, _scrape):
+        results = {}
+        with mock.patch('analyzer.pipeline.detect_and_generate', side_effect=self.slow_generate):
+            threads = [
+                threading.Thread(target=self.post_in_thread, args=(results, f'10.0.2.{index}'))
+                for index in range(3)
+            ]
+            for thread in threads:
+                thread.start()
+                time.sleep(0.05)
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(self.provider_calls, 1)
+        self.assertEqual(len(results), 3)
+        for status, payload in results.values():
+            self.assertEqual(status, 200)
+            self.assertEqual(payload['response'], 'Estrategia coalescida')
+        self.assertEqual(sum(payload['cached'] for _, payload in results.values()), 2)
+
+    def test_duplicate_submit_gets_409_without_waiting(self, _scrape):
+        # Usuario registrado: el límite anónimo (2 por día) cortaría el tercer envío
+        user = User.objects.create_user('dup-test', password='pw-123456')
+        self.client.force_login(user)
+        results = {}
+        with mock.patch('analyzer.pipeline.detect_and_generate', side_effect=self.slow_generate):
+            original = threading.Thread(target=self.post_in_thread, args=(results, '10.0.3.1', user))
+            original.start()
+            time.sleep(0.1)
+
+            started = time.monotonic()
+            duplicate = self.client.post('/', analysis_data(), REMOTE_ADDR='10.0.3.1')
+            elapsed = time.monotonic() - started
+            original.join()
+
+        self.assertEqual(duplicate.status_code, 409)
+        self.assertTrue(duplicate.json()['in_progress'])
+        self.assertIn('Retry-After', duplicate)
+        self.assertLess(elapsed, 0.3)
+        self.assertEqual(results['10.0.3.1'][0], 200)
+
+        # Terminado el original, el doble envío recibe su resultado
+        repeated = self.client.post('/', analysis_data(), REMOTE_ADDR='10.0.3.1').json()
+        self.assertTrue(repeated['deduplicated'])
+        self.assertEqual(repeated['analysis_id'], results['10.0.3.1'][1]['analysis_id'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SingleFlightLeaseTests(CacheIsolationMixin, SimpleTestCase):
+
+    def test_only_one_leader_and_release_is_owner_only(self):
+        leader = SingleFlight('analysis:test', lease_seconds=30)
+        follower = SingleFlight('analysis:test', lease_seconds=30)
+
+        self.assertTrue(leader.acquire())
+        self.assertFalse(follower.acquire())
+        follower.release()  # No es suyo: no debe liberar el lease del líder
+        self.assertTrue(leader.is_held())
+
+        leader.release()
+        self.assertFalse(leader.is_held())
+        self.assertTrue(follower.acquire())
+
+    def test_wait_returns_result_or_gives_up_when_leader_is_gone(self):
+        flight = SingleFlight('analysis:test', poll_interval=0.01)
+        self.assertEqual(flight.wait(lambda: 'listo', time.monotonic() + 1), 'listo')
+
+        # Sin líder ni resultado no espera hasta el deadline
+        started = time.monotonic()
+        self.assertIsNone(flight.wait(lambda: None, time.monotonic() + 5))
+        self.assertLess(time.monotonic() - started, 1)
+
+
+# ✅ DEADLINE, FALLBACK Y HEDGING ENTRE PROVEEDORES (user-006)
+
+def provider_ok(name, delay=0):
+    def call(prompt, api_key, timeout=None):
+        time.sleep(delay)
+        return {'success': True, 'response': f'Estrategia {name}', 'provider': name, 'model': name}
+    return mock.Mock(side_effect=call)
+
+
+def provider_error(error_type, delay=0):
+    def call(prompt, api_key, timeout=None):
+        time.sleep(delay)
+        return {'success': False, 'error_type': error_type, 'error': f'Error con Cohere: {error_type}'}
+    return mock.Mock(side_effect=call)
+
+
+class ProviderFallbackTests(SimpleTestCase):
+
+    def setUp(self):
+        # Circuitos limpios: los de otros tests no deben bloquear llamadas
+        patcher = mock.patch('analyzer.utils.ai_integration.circuit_breakers', CircuitBreakerRegistry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def providers(self, cohere, gemini):
+        return mock.patch.dict(ai_integration.PROVIDER_FUNCTIONS, {'cohere': cohere, 'gemini': gemini})
+
+    def test_cohere_provider_errors_fall_back_to_gemini(self):
+        for error_type in ('provider', 'timeout'):
+            with self.subTest(error_type=error_type), \
+                    self.providers(provider_error(error_type), provider_ok('gemini')):
+                result = detect_and_generate('prompt', 'co-key', hedge_delay=None)
+                self.assertEqual(result['provider'], 'gemini')
+
+    def test_key_errors_do_not_fall_back(self):
+        for error_type in ('invalid_key', 'quota'):
+            gemini = provider_ok('gemini')
+            with self.subTest(error_type=error_type), self.providers(provider_error(error_type), gemini):
+                result = detect_and_generate('prompt', 'co-key', hedge_delay=None)
+                self.assertEqual(result['error_type'], error_type)
+                gemini.assert_not_called()
+
+    def test_deadline_bounds_the_whole_call(self):
+        gemini = provider_ok('gemini')
+        with self.providers(provider_ok('cohere', delay=1), gemini):
+            started = time.monotonic()
+            result = detect_and_generate('prompt', 'co-key', deadline=time.monotonic() + 0.2, hedge_delay=None)
+            elapsed = time.monotonic() - started
+
+        self.assertTrue(result['timeout'])
+        self.assertEqual(result['error_type'], 'timeout')
+        self.assertLess(elapsed, 0.5)
+        gemini.assert_not_called()  # Sin tiempo restante no hay fallback
+
+    def test_hedge_takes_the_first_success(self):
+        with self.providers(provider_ok('cohere', delay=0.5), provider_ok('gemini')):
+            started = time.monotonic()
+            result = detect_and_generate('prompt', 'co-key', deadline=time.monotonic() + 2, hedge_delay=0.05)
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(result['provider'], 'gemini')
+        self.assertLess(elapsed, 0.4)
+
+    def test_hedge_does_not_race_on_key_errors(self):
+        gemini = provider_ok('gemini')
+        with self.providers(provider_error('quota'), gemini):
+            result = detect_and_generate('prompt', 'co-key', deadline=time.monotonic() + 2, hedge_delay=0.5)
+
+        self.assertEqual(result['error_type'], 'quota')
+        gemini.assert_not_called()
+
+    def test_stream_falls_back_before_first_chunk(self):
+        def failing_cohere(prompt, api_key):
+            raise AIProviderError('Error con Cohere: HTTP 503', 'provider')
+            yield  # pragma: no cover
+
+        def gemini(prompt, api_key):
+            yield 'Hola '
+            yield 'mundo'
+
+        meta = {}
+        with mock.patch('analyzer.utils.ai_integration.stream_strategy_cohere', failing_cohere), \
+                mock.patch('analyzer.utils.ai_integration.stream_strategy', gemini):
+            text = ''.join(stream_and_generate('prompt', 'co-key', meta=meta))
+
+        self.assertEqual(text, 'Hola mundo')
+        self.assertEqual(meta['provider'], 'gemini')
+
+
+# ✅ CIRCUIT BREAKER (user-007)
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def make_breaker(self, **options):
+        return CircuitBreaker('test', **{'min_calls': 3, 'open_seconds': 0.05, **options})
+
+    def test_opens_on_error_rate_and_rejects(self):
+        breaker = self.make_breaker()
+        for _ in range(3):
+            self.assertTrue(breaker.allow_request())
+            breaker.record_failure(0.1, 'HTTP 503')
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+    def test_half_open_probe_closes_or_reopens(self):
+        breaker = self.make_breaker()
+        breaker.trip()
+        time.sleep(0.06)
+
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow_request())  # Un solo probe a la vez
+        breaker.record_failure(0.1, 'timeout')
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success(0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_adaptive_timeout_follows_latency(self):
+        breaker = self.make_breaker(min_timeout=0.01)
+        for _ in range(5):
+            breaker.record_success(0.2)
+        self.assertAlmostEqual(breaker.get_timeout(60), 0.3)
+        self.assertEqual(breaker.get_timeout(0.1), 0.1)
+
+
+class CircuitBreakerRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.registry = CircuitBreakerRegistry(min_calls=3, open_seconds=0.05, quota_cooldown_seconds=0.05)
+
+    def key_breaker(self, api_key):
+        return self.registry.get_key_breaker('gemini', api_key)
+
+    def test_quota_blocks_only_that_key(self):
+        self.registry.record('gemini', 'key-a', False, 0.1, 'quota', 'cuota agotada')
+
+        self.assertIs(self.registry.check('gemini', 'key-a'), self.key_breaker('key-a'))
+        self.assertIsNone(self.registry.check('gemini', 'key-b'))
+        self.assertEqual(self.registry.get('gemini').state, CircuitBreaker.CLOSED)
+
+    def test_failed_key_probe_is_released(self):
+        self.registry.record('gemini', 'key-a', False, 0.1, 'quota', 'cuota agotada')
+        time.sleep(0.06)
+
+        self.assertIsNone(self.registry.check('gemini', 'key-a'))
+        self.registry.record('gemini', 'key-a', False, 0.1, 'timeout', 'timeout')
+        self.assertEqual(self.key_breaker('key-a').probes_in_flight, 0)
+
+        self.assertIsNone(self.registry.check('gemini', 'key-a'))
+        self.registry.record('gemini', 'key-a', True, 0.1)
+        self.assertIsNone(self.key_breaker('key-a'))  # Cerrado: se descarta
+
+    def test_quota_errors_do_not_count_as_provider_latency(self):
+        provider = self.registry.get('gemini')
+        provider.trip()
+        time.sleep(0.06)
+
+        self.assertIsNone(self.registry.check('gemini', 'key-a'))
+        self.registry.record('gemini', 'key-a', False, 5.0, 'quota', 'cuota agotada')
+        self.assertEqual(provider.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(provider.probes_in_flight, 0)
+        self.assertEqual(len(provider.latencies), 0)
+
+    def test_provider_errors_open_the_provider_circuit(self):
+        for _ in range(3):
+            self.registry.record('gemini', 'key-a', False, 0.1, 'provider', 'HTTP 503')
+        self.assertIs(self.registry.check('gemini', 'key-b'), self.registry.get('gemini'))
+
+    def test_user_errors_do_not_resolve_a_half_open_provider(self):
+        provider = self.registry.get('gemini')
+        provider.trip()
+        time.sleep(0.06)
+
+        self.assertIsNone(self.registry.check('gemini', 'key-a'))
+        self.registry.record('gemini', 'key-a', False, 2.0, 'invalid_key', 'API key not valid')
+        self.assertEqual(provider.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(provider.probes_in_flight, 0)
+        self.assertEqual(len(provider.latencies), 0)
+
+    def test_key_breakers_are_bounded(self):
+        registry = CircuitBreakerRegistry(max_key_breakers=2, quota_cooldown_seconds=60)
+        for api_key in ('key-a', 'key-b', 'key-c'):
+            registry.record('gemini', api_key, False, 0.1, 'quota', 'cuota agotada')
+
+        self.assertIsNone(registry.get_key_breaker('gemini', 'key-a'))
+        self.assertIsNone(registry.check('gemini', 'key-a'))
+        self.assertIsNotNone(registry.check('gemini', 'key-c'))
+        self.assertEqual(len([name for name in registry.get_states() if ':key:' in name]), 2)
+
+    def test_client_disconnect_releases_probes_without_an_outcome(self):
+        def stream(prompt, api_key):
+            yield 'uno '
+            yield 'dos'
+
+        provider = self.registry.get('gemini')
+        self.registry.record('gemini', 'key-a', False, 0.1, 'quota', 'cuota agotada')
+        provider.trip()
+        time.sleep(0.06)
+
+        with mock.patch('analyzer.utils.ai_integration.circuit_breakers', self.registry):
+            chunks = ai_integration._guarded_stream('gemini', stream, 'prompt', 'key-a')
+            next(chunks)
+            chunks.close()
+
+        self.assertEqual(provider.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(provider.probes_in_flight, 0)
+        self.assertEqual(len(provider.latencies), 0)
+        self.assertEqual(self.key_breaker('key-a').state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(self.key_breaker('key-a').probes_in_flight, 0)
+
+
+# ✅ LOTES: LÍMITES Y COBRO (user-008)
+
+def batch_generate(prompt, api_key, **kwargs):
+    if 'roto' in prompt:
+        return {'success': False, 'error': 'Proveedor no disponible'}
+    return {'success': True, 'response': 'Estrategia del lote', 'provider': 'fake', 'model': 'fake-stream'}
+
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS={**TEST_APP_SETTINGS, 'BATCH_MAX_ITEMS': 3, 'BATCH_CONCURRENCY': 2})
+@mock.patch('analyzer.pipeline.scrape_product', return_value=dict(PRODUCT))
+@mock.patch('analyzer.pipeline.detect_and_generate', side_effect=batch_generate)
+class BatchAnalysisTests(CacheIsolationMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('batch-test', password='pw-123456')
+        self.profile = self.user.profile
+        self.profile.analyses_limit_monthly = 10
+        self.profile.save()
+
+    def post_batch(self, urls):
+        return self.client.post('/api/analyze-batch/', {
+            'product_urls': '\n'.join(urls), 'api_key': 'fake-test', 'platform': 'instagram',
+        })
+
+    def test_requires_login(self, _generate, _scrape):
+        response = self.post_batch(['https://shop.example.com/p/1'])
+        self.assertEqual(response.status_code, 401)
+
+    def test_rejects_more_items_than_allowed(self, _generate, _scrape):
+        self.client.force_login(self.user)
+        response = self.post_batch([f'https://shop.example.com/p/{index}' for index in range(4)])
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_batch_larger_than_remaining_quota(self, _generate, _scrape):
+        self.profile.analyses_this_month = 9
+        self.profile.save()
+        self.client.force_login(self.user)
+        response = self.post_batch(['https://shop.example.com/p/1', 'https://shop.example.com/p/2'])
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(response.json()['limit_reached'])
+
+    def test_only_saved_analyses_are_charged(self, _generate, _scrape):
+        self.client.force_login(self.user)
+        response = self.post_batch([
+            'https://shop.example.com/p/1', 'https://shop.example.com/p/roto', 'https://shop.example.com/p/3',
+        ])
+        self.assertEqual(response.status_code, 202)
+
+        status = wait_for_job(self.client, response.json()['status_url'])
+        result = status['result']
+        self.assertEqual((result['succeeded'], result['failed']), (2, 1))
+        self.assertEqual(AnalysisHistory.objects.filter(user=self.user, analysis_type='batch').count(), 2)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.analyses_this_month, 2)
+
+    def test_fan_out_respects_batch_concurrency(self, _generate, _scrape):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def tracked_generate(prompt, api_key, **kwargs):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return batch_generate(prompt, api_key)
+
+        params = {'platform': 'instagram', 'target_audience': '', 'campaign_goal': '', 'tone': '',
+                  'api_key': 'fake-test', 'analysis_type': 'batch'}
+        urls = [f'https://shop.example.com/p/{index}' for index in range(5)]
+        with mock.patch('analyzer.pipeline.detect_and_generate', side_effect=tracked_generate):
+            result = run_batch_pipeline(params, urls, user_id=self.user.id)
+
+        self.assertEqual(result['succeeded'], 5)
+        self.assertEqual(peak[0], 2)
+
+    def test_failed_insert_is_not_charged(self, _generate, _scrape):
+        params = {'platform': 'instagram', 'target_audience': '', 'campaign_goal': '', 'tone': '',
+                  'api_key': 'fake-test', 'analysis_type': 'batch'}
+        with mock.patch('analyzer.models.AnalysisHistory.objects.bulk_create', side_effect=RuntimeError('db caída')):
+            result = run_batch_pipeline(params, ['https://shop.example.com/p/1'], user_id=self.user.id)
+
+        self.assertEqual(result['status'], 500)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.analyses_this_month, 0)
+
+
+# ✅ LATENCIA POR ETAPA (user-009)
+
+class StageTimerTests(SimpleTestCase):
+
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.50), 50)
+        self.assertEqual(percentile(values, 0.95), 95)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([7], 0.99), 7)
+        self.assertEqual(percentile([1, 2, 3], 0), 1)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_stages_accumulate_and_survive_errors(self):
+        timer = StageTimer()
+        with timer.stage('scrape'):
+            time.sleep(0.01)
+        timer.record('scrape', 0.005)
+        with self.assertRaises(ValueError), timer.stage('prompt'):
+            raise ValueError('plantilla rota')
+
+        self.assertGreaterEqual(timer.stages_ms['scrape'], 15)
+        self.assertIn('prompt', timer.stages_ms)
+
+    def test_as_data_reports_provider_and_details(self):
+        timer = StageTimer()
+        timer.record('provider', 0.25)
+        timer.set_provider('gemini', 'gemini-1.5-flash')
+        timer.details['generation_mode'] = 'single'
+
+        data = timer.as_data()
+        self.assertEqual(data['timings_ms'], {'provider': 250.0})
+        self.assertEqual(data['provider'], 'gemini')
+        self.assertFalse(data['cached'])
+        self.assertEqual(data['generation_mode'], 'single')
+        self.assertIn('total_ms', data)
+
+    def test_measure_stream_only_counts_producer_time(self):
+        def slow_producer():
+            for item in ('a', 'b'):
+                time.sleep(0.02)
+                yield item
+
+        timer = StageTimer()
+        for _ in timer.measure_stream('provider', slow_producer()):
+            time.sleep(0.05)  # Consumidor lento
+
+        self.assertGreaterEqual(timer.stages_ms['provider'], 40)
+        self.assertLess(timer.stages_ms['provider'], 90)
+
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS=TEST_APP_SETTINGS)
+class StageTimingPersistenceTests(CacheIsolationMixin, TestCase):
+
+    @mock.patch('analyzer.pipeline.scrape_product', return_value=dict(PRODUCT))
+    def test_analysis_stores_breakdown_and_provider(self, _scrape):
+        payload = self.client.post('/', analysis_data(), REMOTE_ADDR='10.0.4.1').json()
+
+        analysis = AnalysisHistory.objects.get(pk=payload['analysis_id'])
+        data = analysis.additional_data
+        self.assertEqual(data['provider'], 'fake')
+        self.assertEqual(analysis.ai_model_used, 'fake-stream')
+        for stage in ('limit_check', 'scrape', 'prompt', 'provider', 'db_write', 'serialization'):
+            self.assertIn(stage, data['timings_ms'])
+        self.assertIsNotNone(analysis.processing_time)
+
+    def test_latency_report_groups_by_provider_and_cache(self):
+        rows = [
+            ('gemini', False, {'provider': 100.0, 'scrape': 10.0}),
+            ('gemini', False, {'provider': 300.0, 'scrape': 30.0}),
+            ('gemini', True, {'dedupe': 1.0}),
+        ]
+        for provider, cached, timings in rows:
+            AnalysisHistory.objects.create(
+                product_url='https://shop.example.com/p/1', product_title='T', platform='instagram',
+                target_audience='', ai_response='x', success=True, processing_time=0.5,
+                additional_data={'timings_ms': timings, 'provider': provider, 'cached': cached},
+            )
+
+        out = io.StringIO()
+        call_command('analysis_latency_report', format='json', stdout=out)
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(report['gemini']['provider'], {'count': 2, 'p50': 100.0, 'p95': 300.0, 'p99': 300.0})
+        self.assertEqual(report['cache']['dedupe']['count'], 1)
+        self.assertEqual(report['todos']['total']['count'], 3)
+        self.assertEqual(list(report['todos'])[:2], ['dedupe', 'scrape'])
+
+
+# ✅ PROMPT EN DOS ETAPAS CON RESUMEN CACHEADO (user-010)
+
+STAGED_SETTINGS = {**TEST_APP_SETTINGS, 'AI_GENERATION_MODE': 'staged'}
+
+
+def staged_params(**overrides):
+    return {
+        'analysis_type': 'basic', 'product_url': 'https://shop.example.com/p/runner', 'platform': 'instagram',
+        'target_audience': 'corredores', 'campaign_goal': 'conversions', 'tone': 'professional',
+        'api_key': 'co-key', 'competitor_urls': [], **overrides,
+    }
+
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS=STAGED_SETTINGS)
+class StagedPromptTests(CacheIsolationMixin, SimpleTestCase):
+
+    def summary_ok(self, prompt, api_key, **kwargs):
+        return {'success': True, 'response': '- Zapatilla ligera para corredores', 'provider': 'cohere'}
+
+    def test_summary_is_generated_once_per_product(self):
+        with mock.patch('analyzer.pipeline.detect_and_generate', side_effect=self.summary_ok) as generate:
+            timer = StageTimer()
+            first = prepare_prompt(staged_params(), dict(PRODUCT), timer)
+            other_campaign = StageTimer()
+            second = prepare_prompt(
+                staged_params(platform='tiktok', product_url='https://shop.example.com/p/runner?utm_source=x'),
+                dict(PRODUCT), other_campaign,
+            )
+
+        self.assertEqual(generate.call_count, 1)
+        self.assertIn('Analiza el producto', generate.call_args.args[0])
+        self.assertNotIn('instagram', generate.call_args.args[0])  # El resumen no depende de la campaña
+        for prompt in (first, second):
+            self.assertIn('Zapatilla ligera para corredores', prompt)
+        self.assertIn('tiktok', second)
+        self.assertEqual(timer.details, {'generation_mode': 'staged', 'summary_cached': False})
+        self.assertEqual(other_campaign.details, {'generation_mode': 'staged', 'summary_cached': True})
+        self.assertIn('summary', timer.stages_ms)
+
+    def test_failed_summary_falls_back_to_single_prompt(self):
+        failure = {'success': False, 'error_type': 'provider', 'error': 'HTTP 503'}
+        with mock.patch('analyzer.pipeline.detect_and_generate', return_value=failure):
+            timer = StageTimer()
+            prompt = prepare_prompt(staged_params(), dict(PRODUCT), timer)
+
+        self.assertNotIn('Análisis del producto (ya realizado', prompt)
+        self.assertEqual(timer.details['generation_mode'], 'single')
+        self.assertIsNone(CacheManager.get_cached_product_summary(staged_params()['product_url']))
+
+    def test_summary_uses_at_most_half_of_the_budget(self):
+        deadline = time.monotonic() + 10
+        with mock.patch('analyzer.pipeline.detect_and_generate', side_effect=self.summary_ok) as generate:
+            prepare_prompt(staged_params(), dict(PRODUCT), StageTimer(), deadline=deadline)
+
+        stage_deadline = generate.call_args.kwargs['deadline']
+        self.assertLessEqual(stage_deadline - time.monotonic(), 5.01)
+
+    @override_settings(AFFILIATE_STRATEGIST_SETTINGS=TEST_APP_SETTINGS)
+    def test_single_mode_skips_the_summary(self):
+        with mock.patch('analyzer.pipeline.detect_and_generate') as generate:
+            prompt = prepare_prompt(staged_params(), dict(PRODUCT), StageTimer())
+
+        generate.assert_not_called()
+        self.assertIn('shop.example.com/p/runner', prompt)
+
+
+# ✅ SESIÓN HTTP CON REINTENTOS DENTRO DEL PRESUPUESTO (user-011)
+
+RETRY_SETTINGS = {**TEST_APP_SETTINGS, 'SCRAPING_RETRIES': 2, 'SCRAPING_BACKOFF_SECONDS': 0.05}
+
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS=RETRY_SETTINGS)
+class DeadlineRetryTests(CacheIsolationMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.flaky_calls = 0
+        self.site = LocalSite({
+            '/flaky': self.flaky,
+            '/busy': lambda handler: send_page(handler, 'ocupado', 503, {'Retry-After': '5'}),
+            '/slow': self.slow,
+            '/trickle': self.trickle,
+        })
+        self.addCleanup(self.site.close)
+        self.client = ScrapingHttpClient()
+
+    def flaky(self, handler):
+        self.flaky_calls += 1
+        if self.flaky_calls == 1:
+            send_page(handler, 'error', 503)
+        else:
+            send_page(handler, '<title>Zapatilla</title>')
+
+    def slow(self, handler):
+        time.sleep(1)
+        send_page(handler, '<title>Tarde</title>')
+
+    def trickle(self, handler):
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/html; charset=utf-8')
+        handler.end_headers()
+        try:
+            handler.wfile.write(b'<html><body>')
+            for _ in range(20):
+                handler.wfile.write(b'<p>' + b'x' * 16 * 1024 + b'</p>')
+                handler.wfile.flush()
+                time.sleep(0.15)
+        except OSError:
+            pass  # El scraper cortó la conexión
+
+    def test_retries_server_errors_within_budget(self):
+        response = self.client.get(self.site.url('/flaky'), timeout=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.site.hits['/flaky'], 2)
+
+    def test_retry_after_longer_than_budget_returns_immediately(self):
+        started = time.monotonic()
+        response = self.client.get(self.site.url('/busy'), timeout=1)
+
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.site.hits['/busy'], 1)
+
+    def test_read_timeouts_are_not_retried(self):
+        started = time.monotonic()
+        with self.assertRaises(Exception) as raised:
+            self.client.get(self.site.url('/slow'), timeout=0.3)
+
+        self.assertIn('timed out', str(raised.exception).lower())
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertEqual(self.site.hits['/slow'], 1)
+
+    def test_streaming_read_stops_at_the_total_deadline(self):
+        started = time.monotonic()
+        result = scrape_product_info(self.site.url('/trickle'), timeout=0.5)
+
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error_type'], 'timeout')
+
+
+# ✅ SCRAPING CONCURRENTE CON LÍMITE POR HOST Y DEADLINE (user-012)
+
+class ConcurrentScrapingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.active = {}
+        self.peak = {}
+
+    def tracked_fetch(self, seconds):
+        def fetch(url, timeout):
+            host = url.split('/')[2]
+            with self.lock:
+                self.active[host] = self.active.get(host, 0) + 1
+                self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+            time.sleep(seconds(url) if callable(seconds) else seconds)
+            with self.lock:
+                self.active[host] -= 1
+            return {'success': True, 'data': {'title': url}}
+        return fetch
+
+    def test_per_host_limit_and_shared_deadline(self):
+        urls = [f'https://a.example/{index}' for index in range(4)] + ['https://b.example/1', 'https://c.example/lento']
+        fetch = self.tracked_fetch(lambda url: 3 if 'lento' in url else 0.2)
+
+        started = time.monotonic()
+        results = scrape_many(urls, deadline_seconds=1, per_host=2, fetch=fetch)
+
+        self.assertLess(time.monotonic() - started, 1.3)
+        self.assertEqual(set(results), set(urls))
+        self.assertEqual(self.peak['a.example'], 2)
+        self.assertTrue(all(results[url]['success'] for url in urls if 'lento' not in url))
+        self.assertTrue(results['https://c.example/lento']['timeout'])
+
+    def test_host_limit_holds_for_fetches_still_running_after_a_deadline(self):
+        fetch = self.tracked_fetch(0.5)
+        first = scrape_many([f'https://d.example/{index}' for index in range(2)],
+                            deadline_seconds=0.1, per_host=2, fetch=fetch)
+        self.assertTrue(all(result['timeout'] for result in first.values()))
+
+        # Las descargas anteriores siguen en sus hilos: las nuevas esperan su turno
+        second = scrape_many([f'https://d.example/b{index}' for index in range(2)],
+                             deadline_seconds=1.5, per_host=2, fetch=fetch)
+        self.assertTrue(all(result['success'] for result in second.values()))
+        self.assertEqual(self.peak['d.example'], 2)
+
+    def test_duplicates_and_empty_urls_are_dropped(self):
+        fetch = mock.Mock(return_value={'success': True})
+        results = scrape_many(['https://e.example/1', '', 'https://e.example/1'], deadline_seconds=1, fetch=fetch)
+
+        self.assertEqual(list(results), ['https://e.example/1'])
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(scrape_many([]), {})
+
+
+# ✅ REVALIDACIÓN CONDICIONAL DE PÁGINAS (user-013)
+
+PRODUCT_PAGE = (
+    '<html><head><title>Zapatilla Runner</title>'
+    '<meta name="description" content="Ligera y cómoda">'
+    '<meta property="og:price:amount" content="49.99"></head><body><h1>Zapatilla Runner</h1></body></html>'
+)
+
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS=TEST_APP_SETTINGS)
+class ConditionalRevalidationTests(CacheIsolationMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        product_page_cache.clear()
+        self.addCleanup(product_page_cache.clear)
+        self.conditional_headers = []
+        self.site = LocalSite({'/p/runner': self.page, '/p/sin-validadores': self.page_without_validators})
+        self.addCleanup(self.site.close)
+
+    def page(self, handler):
+        self.conditional_headers.append(handler.headers.get('If-None-Match'))
+        if handler.headers.get('If-None-Match') == '"v1"':
+            handler.send_response(304)
+            handler.send_header('ETag', '"v1"')
+            handler.end_headers()
+            return
+        send_page(handler, PRODUCT_PAGE, headers={'ETag': '"v1"', 'Last-Modified': 'Wed, 01 Oct 2025 10:00:00 GMT'})
+
+    def page_without_validators(self, handler):
+        send_page(handler, PRODUCT_PAGE)
+
+    def test_second_fetch_is_a_304_with_the_stored_fields(self):
+        before = product_page_cache.get_stats()
+        first = scrape_product_info(self.site.url('/p/runner?utm_source=ig'))
+        second = scrape_product_info(self.site.url('/p/runner'))
+
+        self.assertNotIn('revalidated', first)
+        self.assertTrue(second['revalidated'])
+        self.assertEqual(second['data'], first['data'])
+        self.assertEqual(second['data']['title'], 'Zapatilla Runner')
+        self.assertEqual(self.conditional_headers, [None, '"v1"'])
+
+        stats = product_page_cache.get_stats()
+        self.assertEqual(stats['revalidated'] - before['revalidated'], 1)
+        self.assertEqual(stats['full_downloads'] - before['full_downloads'], 1)
+
+    def test_pages_without_validators_are_not_stored(self):
+        scrape_product_info(self.site.url('/p/sin-validadores'))
+        self.assertIsNone(product_page_cache.get(self.site.url('/p/sin-validadores')))
+
+    def test_page_cache_is_bounded_lru(self):
+        page_cache = ProductPageCache(max_entries=2)
+        for index in range(3):
+            page_cache.store(f'https://shop.example.com/p/{index}', {'title': str(index)}, etag=f'"{index}"')
+
+        self.assertIsNone(page_cache.get('https://shop.example.com/p/0'))
+        self.assertEqual(page_cache.get('https://shop.example.com/p/2')['etag'], '"2"')
+        self.assertEqual(page_cache.get_stats()['evictions'], 1)
+
+
+
+# ✅ EXTRACCIÓN EN STREAMING CON CORTE TEMPRANO (user-014)
+
+class FakeStreamingResponse:
+    """Respuesta con el cuerpo en fragmentos, como requests con stream=True"""
+
+    def __init__(self, html, chunk_size=1024):
+        body = html.encode('utf-8')
+        self.headers = {'Content-Type': 'text/html; charset=utf-8'}
+        self.chunks = [body[index:index + chunk_size] for index in range(0, len(body), chunk_size)]
+        self.size = len(body)
+
+    def iter_content(self, chunk_size=None):
+        yield from self.chunks
+
+
+HEAD = '<html><head><meta name="description" content="Ligera y cómoda"></head><body><h1>Zapatilla Runner</h1>'
+FILLER = '<div class="review"><p>Muy buena, la recomiendo.</p></div>' * 400
+JSON_LD = (
+    '<script type="application/ld+json">'
+    '{"@context": "https://schema.org", "@type": "Product", "name": "Zapatilla Runner",'
+    ' "offers": {"@type": "Offer", "price": "49.99", "priceCurrency": "USD"}}'
+    '</script>'
+)
+
+
+class StreamingExtractionTests(SimpleTestCase):
+
+    def test_text_price_does_not_complete_the_page(self):
+        parser = ProductMetaParser()
+        parser.feed(HEAD + '<p>Solo $79.00</p>')
+        self.assertEqual(parser.price_source, 'text')
+        self.assertFalse(parser.complete)
+
+    def test_streaming_stops_once_fields_are_found(self):
+        response = FakeStreamingResponse(HEAD + JSON_LD + FILLER + '</body></html>')
+        parser, bytes_read, timed_out = _parse_streaming(response, max_bytes=10 * response.size)
+
+        self.assertLess(bytes_read, response.size)
+        self.assertFalse(timed_out)
+        self.assertEqual(parser.get_product_data()['price'], '$49.99')
+
+    def test_head_title_is_enough_without_h1(self):
+        html = (
+            '<html><head><title>Zapatilla Runner | Tienda</title>'
+            '<meta name="description" content="Ligera y cómoda">'
+            '<meta property="product:price:amount" content="49.99"></head><body>'
+            + FILLER + '</body></html>'
+        )
+        response = FakeStreamingResponse(html)
+        parser, bytes_read, _ = _parse_streaming(response, max_bytes=10 * response.size)
+
+        self.assertLess(bytes_read, response.size)
+        self.assertEqual(parser.get_product_data()['title'], 'Zapatilla Runner | Tienda')
+
+    def test_og_title_is_enough_without_h1(self):
+        parser = ProductMetaParser()
+        parser.feed(
+            '<html><head><meta property="og:title" content="Zapatilla Runner">'
+            '<meta name="description" content="Ligera y cómoda">'
+            '<meta property="og:price:amount" content="49.99"></head><body>'
+        )
+        self.assertTrue(parser.complete)
+
+    def test_svg_title_in_body_is_ignored(self):
+        parser = ProductMetaParser()
+        parser.feed('<html><head></head><body><svg><title>Icono carrito</title></svg><p>$5.00</p>')
+        self.assertEqual(parser.get_product_data()['title'], '')
+        self.assertEqual(parser.price_source, 'text')
+
+    def test_stops_after_head_once_text_scan_is_exhausted(self):
+        parser = ProductMetaParser(text_scan_limit=200)
+        parser.feed('<html><head><title>Zapatilla Runner</title></head><body>')
+        self.assertFalse(parser.complete)
+
+        parser.feed(FILLER)
+        self.assertTrue(parser.complete)
+        self.assertEqual(parser.get_product_data()['title'], 'Zapatilla Runner')
+
+    def test_streaming_respects_max_bytes(self):
+        response = FakeStreamingResponse(HEAD + '<p>Antes $79.00</p>' + FILLER + JSON_LD + '</body></html>')
+        parser, bytes_read, _ = _parse_streaming(response, max_bytes=4096)
+
+        self.assertLessEqual(bytes_read, 4096 + 1024)
+        self.assertEqual(parser.price_source, 'text')
+
+
+# ✅ PRIORIDAD DE FUENTES DE PRECIO (user-015)
+
+class PricePriorityTests(SimpleTestCase):
+
+    def parse(self, html):
+        parser = ProductMetaParser()
+        parser.feed(html)
+        parser.close()
+        return parser
+
+    def test_json_ld_price_beats_text_price(self):
+        parser = self.parse(HEAD + '<p>Antes $79.00</p>' + JSON_LD + '</body></html>')
+        self.assertEqual(parser.price_source, 'json_ld')
+        self.assertEqual(parser.get_product_data()['price'], '$49.99')
+
+    def test_meta_price_beats_itemprop(self):
+        parser = self.parse(
+            '<html><head><meta property="og:price:amount" content="30.00">'
+            '<meta property="og:price:currency" content="EUR"></head>'
+            '<body><span itemprop="price" content="35.00">35.00</span></body></html>'
+        )
+        self.assertEqual(parser.price_source, 'og:price:amount')
+        self.assertEqual(parser.get_product_data()['price'], '€30.00')
+
+    def test_itemprop_currency_declared_after_amount(self):
+        parser = self.parse(
+            '<html><body><span itemprop="price">1299</span>'
+            '<meta itemprop="priceCurrency" content="MXN"></body></html>'
+        )
+        self.assertEqual(parser.price_source, 'itemprop')
+        self.assertEqual(parser.get_product_data()['price'], 'MX$1299')
+
+    def test_streaming_reads_past_text_price_to_structured_one(self):
+        response = FakeStreamingResponse(HEAD + '<p>Antes $79.00</p>' + FILLER + JSON_LD + '</body></html>')
+        parser, bytes_read, _ = _parse_streaming(response, max_bytes=10 * response.size)
+
+        self.assertEqual(bytes_read, response.size)
+        self.assertEqual(parser.price_source, 'json_ld')
+        self.assertEqual(parser.get_product_data()['price'], '$49.99')
+
+
+# ✅ BENCHMARK DE SCRAPING CON CORPUS LOCAL (user-016)
+
+class ScrapingBenchmarkTests(CacheIsolationMixin, SimpleTestCase):
+
+    def test_corpus_run_reports_metrics_and_full_accuracy(self):
+        report = run_scraping_benchmark(iterations=1, concurrency=4)
+
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(report['requests'], len(report['pages']))
+        self.assertEqual(report['accuracy'], 1.0)
+        for metric in ('pages_per_sec', 'p50_ms', 'p99_ms', 'peak_rss_mb'):
+            self.assertGreater(report[metric], 0)
+        # Con precio estructurado al principio la descarga se corta antes del relleno
+        json_ld = report['pages']['json_ld']
+        self.assertLess(json_ld['bytes_read'], json_ld['bytes'])
+
+    def test_baseline_comparison_flags_regressions(self):
+        baseline = {'pages_per_sec': 100, 'p50_ms': 20, 'p99_ms': 200, 'accuracy': 1.0}
+        report = {'pages_per_sec': 95, 'p50_ms': 23, 'p99_ms': 400, 'accuracy': 0.9}
+
+        comparison = compare_with_baseline(report, baseline, tolerance=0.3)
+
+        self.assertFalse(comparison['pages_per_sec']['regression'])
+        self.assertFalse(comparison['p50_ms']['regression'])  # Bajo el umbral de ruido
+        self.assertTrue(comparison['p99_ms']['regression'])
+        self.assertTrue(comparison['accuracy']['regression'])
+        self.assertNotIn('peak_rss_mb', comparison)
+
+
+# ✅ REGLAS DE EXTRACCIÓN POR DOMINIO (user-017)
+
+RULES_SPEC = {
+    'tienda': {
+        'hosts': ['tienda.example.com'],
+        'title': ['h1.product-title'],
+        'price': ['div#buybox .price', 'meta[itemprop=price]@content'],
+        'currency': ['meta[itemprop=priceCurrency]@content'],
+    },
+}
+RULE_PAGE = (
+    '<html><head><meta name="description" content="Ligera y cómoda"></head><body>'
+    '<h1 class="promo">Oferta del día</h1><h1 class="product-title main">Zapatilla Runner</h1>'
+    '<div class="related"><span class="price">$9.99</span></div>'
+    '<meta itemprop="priceCurrency" content="EUR">'
+    '<div id="buybox"><p><span class="price">49,99</span></p></div>'
+    '</body></html>'
+)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ExtractionRuleTests(CacheIsolationMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.registry = ExtractionRuleRegistry(RULES_SPEC)
+
+    def test_host_lookup_walks_up_to_parent_domains(self):
+        rule = self.registry.rules['tienda']
+        self.assertIs(self.registry.for_url('https://www.tienda.example.com/p/1'), rule)
+        self.assertIs(self.registry.for_url('https://m.tienda.example.com/p/1'), rule)
+        self.assertIsNone(self.registry.for_url('https://example.com/p/1'))
+        self.assertIsNone(self.registry.for_url('https://otratienda.example.com/p/1'))
+
+    def test_rule_selectors_beat_generic_heuristics(self):
+        parser = ProductMetaParser(rule=self.registry.rules['tienda'])
+        parser.feed(RULE_PAGE)
+        parser.close()
+
+        data = parser.get_product_data()
+        self.assertEqual(data['title'], 'Zapatilla Runner')
+        self.assertEqual(data['price'], '€49,99')
+        self.assertEqual(data['description'], 'Ligera y cómoda')
+        self.assertEqual(parser.rule_hits, {'title', 'price'})
+        # Sin regla gana el primer h1 y el primer precio del texto
+        self.assertEqual(extract_product_data(RULE_PAGE)['title'], 'Oferta del día')
+
+    def test_missing_rule_field_falls_back_to_generic(self):
+        parser = ProductMetaParser(rule=self.registry.rules['tienda'])
+        parser.feed('<html><body><h1>Zapatilla Runner</h1><p>$49.99</p></body></html>')
+        parser.close()
+
+        self.assertEqual(parser.get_product_data()['title'], 'Zapatilla Runner')
+        self.assertEqual(parser.rule_hits, set())
+
+    def test_invalid_selector_fails_at_startup(self):
+        with self.assertRaises(ImproperlyConfigured):
+            ExtractionRuleRegistry({'rota': {'hosts': ['rota.example.com'], 'title': ['h1 > span']}})
+
+    def test_counters_report_hit_rate_per_rule_and_generic_hosts(self):
+        rule = self.registry.rules['tienda']
+        self.registry.record(rule, {'title', 'price'})
+        self.registry.record(rule, {'title'})
+        for _ in range(2):
+            self.registry.record(None, set(), 'www.lenta.example.org')
+        self.registry.record(None, set(), 'rara.example.org')
+
+        stats = self.registry.get_stats()
+        self.assertEqual(stats['tienda']['pages'], 2)
+        self.assertEqual(stats['tienda']['fields']['price'], {'hits': 1, 'fallbacks': 1, 'hit_rate': 0.5})
+        self.assertEqual(stats['tienda']['hit_rate'], 0.75)
+        self.assertEqual(stats['generic']['pages'], 3)
+        self.assertEqual(stats['generic']['hosts'], [
+            {'host': 'lenta.example.org', 'pages': 2},
+            {'host': 'rara.example.org', 'pages': 1},
+        ])
+
+    @override_settings(AFFILIATE_STRATEGIST_SETTINGS={'SCRAPING_GENERIC_HOSTS_TRACKED': 2})
+    def test_generic_host_registry_keeps_the_busiest_hosts(self):
+        for host, pages in (('a.example.org', 3), ('b.example.org', 1), ('c.example.org', 1)):
+            for _ in range(pages):
+                self.registry.record(None, set(), host)
+
+        hosts = [item['host'] for item in self.registry.get_generic_hosts()]
+        self.assertEqual(hosts, ['a.example.org', 'c.example.org'])
+
+
+# ✅ CACHE NEGATIVO DE SCRAPING Y BACKOFF POR HOST (user-018)
+
+BACKOFF_SETTINGS = {
+    **TEST_APP_SETTINGS,
+    'SCRAPING_NEGATIVE_CACHE_SECONDS': {'timeout': 5},
+    'SCRAPING_HOST_BACKOFF_THRESHOLD': 3,
+    'SCRAPING_HOST_BACKOFF_BASE_SECONDS': 30,
+    'SCRAPING_HOST_BACKOFF_MAX_SECONDS': 100,
+}
+
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS=BACKOFF_SETTINGS)
+class ScrapeFailureTests(CacheIsolationMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.site = LocalSite({
+            '/p/runner': lambda handler: send_page(handler, PRODUCT_PAGE),
+            '/p/borrado': lambda handler: send_page(handler, '<h1>No existe</h1>', status=404),
+        })
+        self.addCleanup(self.site.close)
+
+    def test_recent_failure_is_served_without_downloading_again(self):
+        url = self.site.url('/p/borrado')
+        first = cached_scrape_product_info(url)
+        second = cached_scrape_product_info(url)
+
+        self.assertEqual(first['error_type'], 'http_4xx')
+        self.assertTrue(second['negative_cached'])
+        self.assertEqual(second['error'], first['error'])
+        self.assertEqual(self.site.hits['/p/borrado'], 1)
+        self.assertEqual(CacheManager.get_scrape_failure_stats()['negative_hits'], 1)
+
+    def test_failure_ttl_per_error_type(self):
+        self.assertEqual(CacheManager.get_scrape_failure_timeout('timeout'), 5)
+        self.assertEqual(CacheManager.get_scrape_failure_timeout('http_4xx'), 600)
+        self.assertEqual(CacheManager.get_scrape_failure_timeout('desconocido'), 30)
+
+        with override_settings(AFFILIATE_STRATEGIST_SETTINGS={'SCRAPING_NEGATIVE_CACHE_SECONDS': {'other': 0}}):
+            self.assertIsNone(CacheManager.cache_product_failure('https://shop.example.com/p/x', {'success': False}))
+
+    def test_host_cooldown_doubles_up_to_the_cap(self):
+        host = 'lenta.example.com'
+        cooldowns = [HostBackoff.record_failure(host, 'timeout') for _ in range(5)]
+
+        self.assertEqual(cooldowns, [0, 0, 30, 60, 100])
+        self.assertGreater(HostBackoff.get_cooldown(host), 90)
+
+    def test_only_host_errors_count_and_success_resets(self):
+        host = 'tienda.example.com'
+        for _ in range(3):
+            self.assertEqual(HostBackoff.record_failure(host, 'http_4xx'), 0)
+        HostBackoff.record_failure(host, 'http_5xx')
+        HostBackoff.record_failure(host, 'http_5xx')
+        HostBackoff.record_success(host)
+
+        self.assertEqual(HostBackoff.record_failure(host, 'http_5xx'), 0)
+        self.assertEqual(HostBackoff.get_cooldown(host), 0)
+
+    def test_cooling_host_fails_fast(self):
+        for _ in range(3):
+            HostBackoff.record_failure('127.0.0.1', 'connection')
+
+        result = cached_scrape_product_info(self.site.url('/p/runner'))
+
+        self.assertEqual(result['error_type'], 'host_backoff')
+        self.assertGreater(result['retry_after'], 0)
+        self.assertNotIn('/p/runner', self.site.hits)
+        self.assertEqual(CacheManager.get_scrape_failure_stats()['backoff_rejections'], 1)
+
+
+# ✅ SNAPSHOTS DE PRODUCTO COMPARTIDOS Y VERSIONADOS (user-019)
+
+class ProductSnapshotTests(TestCase):
+
+    URL = 'https://www.shop.example.com/p/runner?utm_source=ig#reviews'
+
+    def test_same_data_renews_freshness_and_changes_add_a_version(self):
+        first = ProductSnapshot.record(self.URL, PRODUCT)
+        ProductSnapshot.objects.filter(pk=first.pk).update(scraped_at=first.scraped_at - timedelta(hours=1))
+
+        renewed = ProductSnapshot.record('https://shop.example.com/p/runner', PRODUCT)
+        changed = ProductSnapshot.record(self.URL, {**PRODUCT, 'price': '$39.99'})
+
+        self.assertEqual(renewed.pk, first.pk)
+        self.assertGreater(renewed.scraped_at, first.scraped_at)
+        self.assertEqual((first.version, changed.version), (1, 2))
+        self.assertEqual(ProductSnapshot.objects.count(), 2)
+
+    def test_fresh_many_returns_latest_fresh_version_in_one_query(self):
+        ProductSnapshot.record(self.URL, PRODUCT)
+        latest = ProductSnapshot.record(self.URL, {**PRODUCT, 'price': '$39.99'})
+        stale = ProductSnapshot.record('https://shop.example.com/p/vieja', PRODUCT)
+        ProductSnapshot.objects.filter(pk=stale.pk).update(scraped_at=stale.scraped_at - timedelta(hours=7))
+        urls = [self.URL, 'https://shop.example.com/p/runner', 'https://shop.example.com/p/vieja']
+
+        with self.assertNumQueries(1):
+            fresh = ProductSnapshot.get_fresh_many(urls)
+
+        self.assertEqual(set(fresh), set(urls[:2]))
+        self.assertEqual(fresh['https://shop.example.com/p/runner'].pk, latest.pk)
+        self.assertEqual(fresh[self.URL].as_product_data()['price'], '$39.99')
+
+    @override_settings(AFFILIATE_STRATEGIST_SETTINGS={'PRODUCT_SNAPSHOT_FRESH_HOURS': 0})
+    def test_zero_fresh_hours_disables_reuse(self):
+        ProductSnapshot.record(self.URL, PRODUCT)
+        self.assertIsNone(ProductSnapshot.get_fresh(self.URL))
+
+
+# ✅ PLANIFICADOR DE DESCARGAS: TOKENS POR HOST, LEASES Y COLA JUSTA (user-020)
+
+SCHEDULER_SETTINGS = {
+    **TEST_APP_SETTINGS,
+    'SCRAPING_HOST_RATE_PER_SECOND': 5,
+    'SCRAPING_HOST_BURST': 2,
+    'SCRAPING_HOST_RATE_LIMITS': {'lenta.example.com': {'rate': 0.1, 'burst': 1}},
+    'SCRAPING_GLOBAL_CONCURRENCY': 2,
+    'SCRAPING_SCHEDULER_MAX_WAIT_SECONDS': 5,
+}
+
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS=SCHEDULER_SETTINGS)
+class FetchSchedulerTests(CacheIsolationMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.scheduler = FetchScheduler(poll_interval=0.05)
+
+    def acquire_and_release(self, url, timeout=None):
+        started = time.monotonic()
+        permit = self.scheduler.acquire(url, timeout=timeout)
+        if permit is not None:
+            permit.release()
+        return permit, time.monotonic() - started
+
+    def test_host_limits_use_the_most_specific_override(self):
+        self.assertEqual(FetchScheduler.get_host_limits('m.lenta.example.com'), (0.1, 1))
+        self.assertEqual(FetchScheduler.get_host_limits('tienda.example.com'), (5.0, 2))
+
+    def test_burst_then_host_rate(self):
+        waits = [self.acquire_and_release(f'https://tienda.example.com/p/{i}')[1] for i in range(4)]
+
+        self.assertLess(max(waits[:2]), 0.05)
+        self.assertGreater(sum(waits[2:]), 0.15)  # Dos tokens más a 5 por segundo
+
+    def test_throttled_host_does_not_block_other_hosts(self):
+        self.acquire_and_release('https://lenta.example.com/p/1')
+
+        permit, waited = self.acquire_and_release('https://lenta.example.com/p/2', timeout=0.2)
+        self.assertIsNone(permit)
+        self.assertEqual(self.scheduler.get_stats()['timeouts'], 1)
+
+        permit, waited = self.acquire_and_release('https://tienda.example.com/p/1')
+        self.assertIsNotNone(permit)
+        self.assertLess(waited, 0.05)
+
+    def test_global_leases_cap_concurrent_downloads(self):
+        held = [self.scheduler.acquire(f'https://h{i}.example.com/p') for i in range(2)]
+        self.assertIsNone(self.scheduler.acquire('https://h2.example.com/p', timeout=0.2))
+
+        held.pop().release()
+        permit, _ = self.acquire_and_release('https://h2.example.com/p', timeout=1)
+        self.assertIsNotNone(permit)
+        held.pop().release()
+        self.assertEqual(self.scheduler.get_stats()['active'], 0)
+
+    def test_release_does_not_free_a_lease_taken_over_by_another_worker(self):
+        permit = self.scheduler.acquire('https://tienda.example.com/p')
+        key = f'fetch_global:{permit.slot}'
+        cache.set(key, 'otro-worker', 60)  # El lease expiró y otro worker lo tomó
+
+        permit.release()
+        self.assertEqual(cache.get(key), 'otro-worker')
+
+    def test_waiting_downloads_are_served_round_robin_between_users(self):
+        order, lock = [], threading.Lock()
+
+        def download(owner, index):
+            with fetch_owner(owner):
+                permit = self.scheduler.acquire(f'https://h{index}.example.com/{owner}')
+            with permit:
+                with lock:
+                    order.append(owner)
+                time.sleep(0.05)
+
+        batch = [threading.Thread(target=download, args=('lote', i)) for i in range(8)]
+        for thread in batch:
+            thread.start()
+        time.sleep(0.02)
+        single = threading.Thread(target=download, args=('otro', 8))
+        single.start()
+        for thread in batch + [single]:
+            thread.join()
+
+        # Con 2 descargas a la vez, el usuario nuevo entra en el siguiente turno libre
+        self.assertLessEqual(order.index('otro'), 4)
+        self.assertEqual(self.scheduler.get_stats()['active'], 0)
+
+
+# ✅ NEAR CACHE EN PROCESO CON STALENESS ACOTADA (user-021)
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS={'NEAR_CACHE_MAX_STALENESS_SECONDS': 0.2})
+class NearCacheTests(CacheIsolationMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Dos workers con su propio tier local y el mismo cache compartido
+        self.writer = NearCache()
+        self.reader = NearCache()
+
+    def test_local_hits_skip_the_shared_cache_and_return_copies(self):
+        self.writer.set('plantillas', [{'id': 1}], 60)
+        with mock.patch('analyzer.utils.near_cache.cache') as shared:
+            value = self.writer.get('plantillas')
+        shared.get.assert_not_called()
+        shared.get_many.assert_not_called()
+
+        value.append({'id': 2})
+        self.assertEqual(self.writer.get('plantillas'), [{'id': 1}])
+        self.assertEqual(self.writer.get_stats()['local_hits'], 2)
+
+    def test_other_workers_see_writes_within_the_staleness_bound(self):
+        self.writer.set('plantillas', 'v1', 60)
+        self.assertEqual(self.reader.get('plantillas'), 'v1')
+
+        self.writer.set('plantillas', 'v2', 60)
+        self.assertEqual(self.reader.get('plantillas'), 'v1')  # Aún dentro del límite
+        time.sleep(0.25)
+        self.assertEqual(self.reader.get('plantillas'), 'v2')
+
+    def test_unchanged_entry_is_revalidated_without_refetching(self):
+        self.writer.set('plantillas', 'v1', 60)
+        self.reader.get('plantillas')
+        time.sleep(0.25)
+
+        with mock.patch.object(cache, 'get', wraps=cache.get) as shared_get:
+            self.assertEqual(self.reader.get('plantillas'), 'v1')
+        # Solo se consultó la versión (get_many), no el valor
+        self.assertNotIn('plantillas', [call.args[0] for call in shared_get.call_args_list])
+        self.assertEqual(self.reader.get_stats()['revalidated'], 1)
+
+    def test_local_entries_do_not_outlive_the_shared_value(self):
+        self.writer.set('plantillas', 'v1', 1)
+        time.sleep(1.1)
+        self.assertIsNone(self.writer.get('plantillas'))
+
+    def test_forget_tag_drops_local_entries_at_once(self):
+        self.writer.set('stats:7', {'n': 1}, 60, tags=['user:7'])
+        self.writer.set('stats:8', {'n': 1}, 60, tags=['user:8'])
+
+        self.writer.forget_tag('user:7')
+        self.assertEqual(self.writer.get_stats()['size'], 1)
+
+    def test_local_tier_is_bounded_lru(self):
+        small = NearCache(max_entries=2)
+        for index in range(3):
+            small.set(f'k{index}', index, 60)
+
+        stats = small.get_stats()
+        self.assertEqual((stats['size'], stats['evictions']), (2, 1))
+
+    @override_settings(AFFILIATE_STRATEGIST_SETTINGS={'NEAR_CACHE_MAX_STALENESS_SECONDS': 0})
+    def test_zero_staleness_disables_the_local_tier(self):
+        self.writer.set('plantillas', 'v1', 60)
+        self.reader.get('plantillas')
+        self.writer.set('plantillas', 'v2', 60)
+
+        self.assertEqual(self.reader.get('plantillas'), 'v2')
+        self.assertEqual(self.reader.get_stats()['size'], 0)
+
+
+# ✅ PROTECCIÓN CONTRA STAMPEDE: XFETCH Y LOCK DE RECÁLCULO (user-022)
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS={'CACHE_RECOMPUTE_WAIT_SECONDS': 2})
+class RecomputeTests(CacheIsolationMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.calls = 0
+
+    def compute(self, value='nuevo', seconds=0):
+        self.calls += 1
+        time.sleep(seconds)
+        return value
+
+    def test_cold_key_is_computed_once_under_the_lock(self):
+        results = []
+        compute = partial(self.compute, seconds=0.2)
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_recompute('ranking', compute, 60, recompute_lock=True)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['nuevo'] * 5)
+        self.assertEqual(self.calls, 1)
+
+    def test_expired_value_is_served_while_another_worker_recomputes(self):
+        cache.set('ranking', CachedValue('viejo', 0.5, time.time() - 1), 600)
+        flight = SingleFlight('recompute:ranking')
+        self.assertTrue(flight.acquire())
+        try:
+            value = get_or_recompute('ranking', self.compute, 60, recompute_lock=True, stale_seconds=300)
+        finally:
+            flight.release()
+
+        self.assertEqual(value, 'viejo')
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(CacheManager.get_recompute_stats()['stale_served'], 1)
+
+    def test_without_a_usable_stale_value_waits_for_the_recompute(self):
+        cache.set('ranking', CachedValue('viejo', 0.5, time.time() - 10), 600)
+        flight = SingleFlight('recompute:ranking')
+        self.assertTrue(flight.acquire())
+
+        def other_worker():
+            time.sleep(0.2)
+            cache.set('ranking', CachedValue('nuevo', 0.5, time.time() + 60), 600)
+            flight.release()
+
+        worker = threading.Thread(target=other_worker)
+        worker.start()
+        value = get_or_recompute('ranking', self.compute, 60, recompute_lock=True, stale_seconds=5)
+        worker.join()
+
+        self.assertEqual(value, 'nuevo')
+        self.assertEqual(self.calls, 0)
+
+    def test_xfetch_recomputes_early_only_near_expiry_of_costly_values(self):
+        cache.set('ranking', CachedValue('viejo', 1.0, time.time() + 5), 600)
+        with mock.patch('analyzer.cache.random.random', return_value=0.0):
+            self.assertEqual(get_or_recompute('ranking', self.compute, 60), 'viejo')
+        with mock.patch('analyzer.cache.random.random', return_value=0.999999):
+            self.assertEqual(get_or_recompute('ranking', self.compute, 60, beta=0), 'viejo')
+            self.assertEqual(get_or_recompute('ranking', self.compute, 60), 'nuevo')
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(CacheManager.get_recompute_stats()['early'], 1)
+
+    def test_none_is_not_cached(self):
+        get_or_recompute('vacio', partial(self.compute, None), 60)
+        get_or_recompute('vacio', partial(self.compute, None), 60)
+        self.assertEqual(self.calls, 2)
+
+
+# ✅ INVALIDACIÓN POR TAGS CON GENERACIONES (user-023)
+
+user_summary_calls = []
+
+
+@cache_result(timeout=60, key_prefix='tests_user_summary', tags=lambda user_id: [CacheManager.user_tag(user_id)])
+def user_summary(user_id):
+    user_summary_calls.append(user_id)
+    return {'user_id': user_id}
+
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS={'NEAR_CACHE_MAX_STALENESS_SECONDS': 0.2})
+class TagInvalidationTests(CacheIsolationMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        user_summary_calls.clear()
+
+    def test_invalidating_a_user_tag_only_affects_that_user(self):
+        user_summary(1)
+        user_summary(1)
+        user_summary(2)
+        CacheManager.invalidate_user_cache(1)
+        user_summary(1)
+        user_summary(2)
+
+        self.assertEqual(user_summary_calls, [1, 2, 1])
+
+    def test_other_workers_stop_serving_invalidated_entries_within_the_bound(self):
+        other = NearCache()
+        CacheManager.cache_user_stats(5, {'analyses': 1})
+        key = CacheManager.get_cache_key('user_stats', 5)
+        self.assertEqual(other.get(key, tags=['user:5']), {'analyses': 1})
+
+        CacheManager.invalidate_user_cache(5)
+        self.assertIsNone(CacheManager.get_cached_user_stats(5))  # Este proceso, al instante
+        time.sleep(0.25)
+        self.assertIsNone(other.get(key, tags=['user:5']))
+
+    def test_model_signals_invalidate_templates_and_user_entries(self):
+        CacheManager.cache_templates('instagram', [{'id': 1}])
+        MarketingTemplate.objects.create(name='Nueva', platform='instagram', category='general', template='t')
+        self.assertIsNone(CacheManager.get_cached_templates('instagram'))
+
+        user = User.objects.create(username='tags')
+        CacheManager.cache_user_stats(user.id, {'analyses': 0})
+        AnalysisHistory.objects.create(
+            user=user, product_url='https://shop.example.com/p/runner', platform='instagram', target_audience='corredores'
+        )
+        self.assertIsNone(CacheManager.get_cached_user_stats(user.id))
+
+    def test_evicted_generation_restarts_above_the_previous_one(self):
+        before = CacheManager.invalidate_tag('plantillas')
+        cache.delete(cache_tags.generation_key('plantillas'))
+
+        self.assertGreater(CacheManager.get_tag_generation('plantillas'), before)
+
+
+# ✅ CACHE DE RESPUESTAS HTTP: ETAG, COMPRESIÓN Y VARIANTES POR USUARIO (user-024)
+
+RENDERED_PAGE = '<html><body>' + '<p>Análisis público de campañas</p>' * 40 + '</body></html>'
+
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS={'NEAR_CACHE_MAX_STALENESS_SECONDS': 0})
+class ResponseCacheTests(CacheIsolationMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        self.renders = []
+
+    def make_view(self, **options):
+        @cached_response(timeout=60, **options)
+        def page(request):
+            self.renders.append(request.user)
+            return HttpResponse(f'{RENDERED_PAGE}<!-- {len(self.renders)} -->')
+        return page
+
+    def get(self, view, user=None, **headers):
+        request = self.factory.get('/pagina/', **headers)
+        request.user = user or AnonymousUser()
+        return view(request)
+
+    def test_matching_etag_gets_304_without_rendering(self):
+        view = self.make_view()
+        first = self.get(view)
+        second = self.get(view, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(len(self.renders), 1)
+        self.assertEqual(CacheManager.get_response_cache_stats()['not_modified'], 1)
+
+    def test_gzip_variant_is_stored_and_served_to_clients_that_accept_it(self):
+        view = self.make_view()
+        plain = self.get(view)
+        compressed = self.get(view, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertNotEqual(compressed['ETag'], plain['ETag'])  # ETag fuerte por codificación
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertEqual(len(self.renders), 1)
+
+    def test_per_user_entries_are_private_and_invalidated_by_user_tag(self):
+        view = self.make_view(per_user=True)
+        ana, beto = User.objects.create(username='ana'), User.objects.create(username='beto')
+        for user in (ana, beto, ana, beto):
+            response = self.get(view, user)
+        self.assertEqual(self.renders, [ana, beto])
+        self.assertIn('private', response['Cache-Control'])
+
+        CacheManager.invalidate_user_cache(ana.id)
+        self.get(view, ana)
+        self.get(view, beto)
+        self.assertEqual(self.renders, [ana, beto, ana])
+
+    def test_responses_with_cookies_or_private_cache_control_are_not_stored(self):
+        @cached_response(timeout=60)
+        def with_cookie(request):
+            self.renders.append(request.user)
+            response = HttpResponse(RENDERED_PAGE)
+            response.set_cookie('visto', '1')
+            return response
+
+        self.get(with_cookie)
+        self.get(with_cookie)
+        self.assertEqual(len(self.renders), 2)
+        self.assertEqual(CacheManager.get_response_cache_stats()['uncacheable'], 2)
+
+    def test_public_history_is_invalidated_by_a_new_public_analysis(self):
+        client = Client()
+        etag = client.get('/public-history/')['ETag']
+        self.assertEqual(client.get('/public-history/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        AnalysisHistory.objects.create(
+            user=User.objects.create(username='publica'), product_url='https://shop.example.com/p/runner',
+            product_title='Zapatilla Runner', platform='instagram', target_audience='corredores',
+            is_public=True, success=True,
+        )
+        response = client.get('/public-history/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Zapatilla Runner')
+
+
+# ✅ MÉTRICAS DEL BACKEND DE CACHE POR PREFIJO (user-025)
+
+@override_settings(CACHES=TEST_CACHES, AFFILIATE_STRATEGIST_SETTINGS={'CACHE_METRICS_FLUSH_SECONDS': 3600})
+class CacheMetricsTests(CacheIsolationMixin, SimpleTestCase):
+
+    def setUp(self):
+        recorder.flush(cache)  # Lo pendiente de otros tests no cuenta aquí
+        super().setUp()
+
+    def test_operations_are_counted_per_prefix(self):
+        cache.set('probe:1', 'x' * 2000)
+        cache.get('probe:1')
+        cache.get('probe:2')
+        cache.get_many(['probe:1', 'probe:3'])  # get_many llama a get: cuenta una vez por clave
+        cache.add('probe:n', 0)
+        cache.incr('probe:n')
+        cache.delete('probe:1')
+
+        probe = get_cache_metrics()['prefixes']['probe']
+        self.assertEqual((probe['gets'], probe['hits'], probe['misses']), (4, 2, 2))
+        self.assertEqual((probe['sets'], probe['incrs'], probe['deletes']), (2, 1, 1))
+        self.assertGreater(probe['avg_value_bytes'], 1000)
+        self.assertEqual(sum(probe['get_latency_ms']['buckets'].values()), 3)  # Una latencia por llamada
+
+    def test_flush_publishes_all_counters_in_one_batch(self):
+        cache.get('probe:1')
+        cache.set('other:1', 1)
+        with mock.patch.object(cache, 'incr_many', wraps=cache.incr_many) as incr_many:
+            recorder.flush(cache)
+
+        incr_many.assert_called_once()
+        deltas = incr_many.call_args.args[0]
+        self.assertEqual(deltas['cachemetrics:probe:misses'], 1)
+        self.assertEqual(deltas['cachemetrics:other:sets'], 1)
+
+    def test_periodic_flush_runs_off_the_request_thread(self):
+        flushed = threading.Event()
+        threads = []
+
+        def slow_incr_many(deltas):
+            threads.append(threading.current_thread())
+            time.sleep(0.2)
+            flushed.set()
+
+        cache.get('probe:1')
+        with mock.patch.object(cache, 'incr_many', side_effect=slow_incr_many), \
+                override_settings(AFFILIATE_STRATEGIST_SETTINGS={'CACHE_METRICS_FLUSH_SECONDS': 0}):
+            started = time.monotonic()
+            cache.get('probe:2')
+            elapsed = time.monotonic() - started
+            self.assertTrue(flushed.wait(2))
+
+        self.assertLess(elapsed, 0.1)
+        self.assertIsNot(threads[0], threading.current_thread())
@@ -7,6 +7,9 @@ app_name = 'analyzer'
 
 urlpatterns = [
     path('', views.home, name='home'),
+    path('api/analysis-status/<uuid:job_id>/', views.analysis_status, name='analysis_status'),
+    path('api/analyze-stream/', views.analyze_stream, name='analyze_stream'),
+    path('api/analyze-batch/', views.analyze_batch, name='analyze_batch'),
     # Autenticación
     path('login/', LoginView.as_view(), name='login'),
     path('register/', RegisterView.as_view(), name='register'),
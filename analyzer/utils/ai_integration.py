@@ -1,109 +1,580 @@
 # analyzer/utils/ai_integration.py
 
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
 import google.generativeai as genai
 
-def generate_strategy(prompt, api_key):
+from analyzer.conf import app_setting
+from .circuit_breaker import CircuitBreakerRegistry
+
+
+logger = logging.getLogger(__name__)
+
+# IMPORTANTE: El modelo gratuito actual es 'gemini-1.5-flash' no 'gemini-pro'
+GEMINI_MODEL = 'gemini-1.5-flash'
+COHERE_MODEL = 'command'
+
+
+class AIProviderError(Exception):
+    """Error de un proveedor de IA con mensaje apto para el usuario"""
+
+    def __init__(self, message, error_type='provider'):
+        super().__init__(message)
+        self.error_type = error_type
+
+
+# ✅ REGISTRO DE CLIENTES: un cliente por (proveedor, API key) reutilizado entre requests
+
+class ProviderClientRegistry:
+    """
+    Cache LRU/TTL de clientes de proveedores de IA, indexado por el hash de
+    la API key (la key en claro nunca se guarda como índice).
+
+    Cada cliente lleva sus propias credenciales, así que no se toca estado
+    global (genai.configure) y los hilos no compiten por la key.
+    """
+
+    def __init__(self, max_size=32, ttl_seconds=1800):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clients = OrderedDict()  # key -> (cliente, creado_en)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    @staticmethod
+    def make_key(provider, api_key):
+        return f"{provider}:{hashlib.sha256(api_key.encode()).hexdigest()}"
+
+    def get(self, provider, api_key, factory):
+        """Retorna el cliente cacheado o lo crea con factory(api_key)"""
+        key = self.make_key(provider, api_key)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None:
+                client, created_at = entry
+                if now - created_at < self.ttl_seconds:
+                    self._clients.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return client
+                del self._clients[key]
+                self.stats['expirations'] += 1
+            self.stats['misses'] += 1
+
+        # Crear fuera del lock: la construcción puede ser lenta
+        client = factory(api_key)
+
+        with self._lock:
+            self._clients[key] = (client, now)
+            self._clients.move_to_end(key)
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+                self.stats['evictions'] += 1
+        return client
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, 'size': len(self._clients), 'max_size': self.max_size}
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+
+client_registry = ProviderClientRegistry(
+    max_size=app_setting('AI_CLIENT_POOL_SIZE', 32),
+    ttl_seconds=app_setting('AI_CLIENT_TTL_SECONDS', 1800),
+)
+
+
+def _build_gemini_model(api_key):
+    """GenerativeModel con un cliente propio (sin genai.configure global)"""
+    from google.ai import generativelanguage as glm
+    from google.api_core import client_options as client_options_lib
+
+    model = genai.GenerativeModel(GEMINI_MODEL)
+    model._client = glm.GenerativeServiceClient(
+        client_options=client_options_lib.ClientOptions(api_key=api_key)
+    )
+    return model
+
+
+def _build_cohere_client(api_key):
+    import cohere
+    return cohere.Client(api_key)
+
+
+def get_gemini_model(api_key):
+    return client_registry.get('gemini', api_key, _build_gemini_model)
+
+
+def get_cohere_client(api_key):
+    return client_registry.get('cohere', api_key, _build_cohere_client)
+
+
+def get_provider_client_stats():
+    """Contadores del registro de clientes (hits, misses, evicciones)"""
+    return client_registry.get_stats()
+
+
+def generate_strategy(prompt, api_key, timeout=None):
     """Genera estrategia usando Gemini"""
     try:
-        # Configurar API key
-        genai.configure(api_key=api_key)
-        
-        # IMPORTANTE: El modelo gratuito actual es 'gemini-1.5-flash' no 'gemini-pro'
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        model = get_gemini_model(api_key)
         
-        # Generar contenido
-        response = model.generate_content(prompt)
+        # Generar contenido (con timeout real del lado del cliente HTTP/gRPC)
+        request_options = {'timeout': timeout} if timeout else None
+        response = model.generate_content(prompt, request_options=request_options)
         
         if response.text:
             return {
                 'success': True,
-                'response': response.text
+                'response': response.text,
+                'provider': 'gemini',
+                'model': GEMINI_MODEL,
             }
         else:
             return {
                 'success': False,
+                'error_type': 'provider',
                 'error': 'No se pudo generar una respuesta. Intenta de nuevo.'
             }
             
     except Exception as e:
-        error_msg = str(e)
-        
-        # Mensajes de error más específicos
-        if '404' in error_msg or 'not found' in error_msg.lower():
-            return {
-                'success': False,
-                'error': 'Modelo no encontrado. Asegúrate de usar "gemini-1.5-flash" y que tu API key sea válida.'
-            }
-        elif 'API_KEY_INVALID' in error_msg or 'API key not valid' in error_msg:
-            return {
-                'success': False,
-                'error': 'La API key no es válida. Verifica que copiaste correctamente tu key de Google AI Studio.'
-            }
-        elif 'QUOTA_EXCEEDED' in error_msg or 'quota' in error_msg.lower():
-            return {
-                'success': False,
-                'error': 'Has excedido el límite gratuito. Espera un poco o usa otra API key.'
-            }
-        else:
-            return {
-                'success': False,
-                'error': f'Error: {error_msg}'
-            }
+        return {
+            'success': False,
+            'error_type': _gemini_error_type(str(e)),
+            'error': _gemini_error_message(str(e))
+        }
+
+
+def _gemini_error_message(error_msg):
+    """Traduce errores de Gemini a mensajes para el usuario"""
+    # Mensajes de error más específicos
+    if '404' in error_msg or 'not found' in error_msg.lower():
+        return 'Modelo no encontrado. Asegúrate de usar "gemini-1.5-flash" y que tu API key sea válida.'
+    elif 'API_KEY_INVALID' in error_msg or 'API key not valid' in error_msg:
+        return 'La API key no es válida. Verifica que copiaste correctamente tu key de Google AI Studio.'
+    elif 'QUOTA_EXCEEDED' in error_msg or 'quota' in error_msg.lower():
+        return 'Has excedido el límite gratuito. Espera un poco o usa otra API key.'
+    else:
+        return f'Error: {error_msg}'
+
+
+def _gemini_error_type(error_msg):
+    """Clasifica el error para el circuit breaker: solo 'timeout'/'provider' son culpa del proveedor"""
+    lowered = error_msg.lower()
+    if '404' in error_msg or 'not found' in lowered:
+        return 'not_found'
+    elif 'API_KEY_INVALID' in error_msg or 'API key not valid' in error_msg:
+        return 'invalid_key'
+    elif 'QUOTA_EXCEEDED' in error_msg or 'quota' in lowered or '429' in error_msg:
+        return 'quota'
+    elif 'deadline' in lowered or 'timed out' in lowered or 'timeout' in lowered:
+        return 'timeout'
+    return 'provider'
 
 
-def generate_strategy_cohere(prompt, api_key):
+def _cohere_error_type(error_msg):
+    lowered = error_msg.lower()
+    if '429' in error_msg or 'rate limit' in lowered or 'quota' in lowered:
+        return 'quota'
+    elif '401' in error_msg or 'invalid api token' in lowered or 'unauthorized' in lowered:
+        return 'invalid_key'
+    elif 'timed out' in lowered or 'timeout' in lowered:
+        return 'timeout'
+    return 'provider'
+
+
+def generate_strategy_cohere(prompt, api_key, timeout=None):
     """
     Alternativa usando Cohere (también gratuito)
     Primero instala: pip install cohere
     """
     try:
-        import cohere
+        # Cliente reutilizado por API key
+        co = get_cohere_client(api_key)
         
-        # Inicializar cliente
-        co = cohere.Client(api_key)
+        # El SDK cohere >= 5 acepta timeout por request
+        extra = {}
+        if timeout and hasattr(co, 'generate_stream'):
+            extra['request_options'] = {'timeout_in_seconds': max(1, int(timeout))}
         
         # Generar respuesta
         response = co.generate(
-            model='command',  # Modelo gratuito de Cohere
+            model=COHERE_MODEL,  # Modelo gratuito de Cohere
             prompt=prompt,
             max_tokens=1000,
-            temperature=0.7
+            temperature=0.7,
+            **extra
         )
         
         if response.generations:
             return {
                 'success': True,
-                'response': response.generations[0].text
+                'response': response.generations[0].text,
+                'provider': 'cohere',
+                'model': COHERE_MODEL,
             }
         else:
             return {
                 'success': False,
+                'error_type': 'provider',
                 'error': 'No se pudo generar respuesta con Cohere.'
             }
             
     except Exception as e:
         return {
             'success': False,
+            'error_type': _cohere_error_type(str(e)),
             'error': f'Error con Cohere: {str(e)}'
         }
 
 
-def detect_and_generate(prompt, api_key):
+# ✅ CIRCUIT BREAKER: un proveedor caído o lento falla rápido en lugar de ocupar workers
+
+circuit_breakers = CircuitBreakerRegistry(**app_setting('AI_CIRCUIT_BREAKER', {}))
+
+
+def get_circuit_breaker_states():
+    """Estado de cada circuito (proveedor y keys con cuota agotada)"""
+    return circuit_breakers.get_states()
+
+
+def _circuit_error_type(breaker):
+    """Circuito de una key (cuota agotada) o del proveedor completo"""
+    return 'quota' if ':key:' in breaker.name else 'circuit_open'
+
+
+def _circuit_open_message(breaker):
+    seconds = max(1, int(breaker.retry_after() + 0.999))
+    if ':key:' in breaker.name:
+        return f'Has excedido el límite de tu API key. Intenta de nuevo en {seconds}s o usa otra key.'
+    return f'El proveedor de IA no está disponible temporalmente. Intenta de nuevo en {seconds}s.'
+
+
+def _circuit_open_result(provider, breaker):
+    return {
+        'success': False,
+        'circuit_open': True,
+        'error_type': _circuit_error_type(breaker),
+        'provider': provider,
+        'retry_after': breaker.retry_after(),
+        'error': _circuit_open_message(breaker),
+    }
+
+
+def _guarded_call(provider, prompt, api_key, timeout):
+    """Llama al proveedor y registra el resultado y la latencia en su circuito"""
+    started = time.monotonic()
+    try:
+        result = PROVIDER_FUNCTIONS[provider](prompt, api_key, timeout=timeout)
+    except Exception as e:
+        result = {'success': False, 'error_type': 'provider', 'error': f'Error: {str(e)}'}
+    circuit_breakers.record(
+        provider, api_key, result['success'], time.monotonic() - started,
+        error_type=result.get('error_type'), error=result.get('error'),
+    )
+    return result
+
+
+def _provider_deadline(provider, deadline):
+    """Recorta el deadline con el timeout adaptativo (percentil de latencia) del proveedor"""
+    remaining = max(0.1, deadline - time.monotonic())
+    return min(deadline, time.monotonic() + circuit_breakers.get(provider).get_timeout(remaining))
+
+
+# ✅ PRESUPUESTO DE TIEMPO: cada llamada corre en un pool con deadline
+
+_provider_executor = None
+_provider_executor_lock = threading.Lock()
+
+# Resolución tardía del nombre: respeta reemplazos de las funciones (mocks, pruebas)
+PROVIDER_FUNCTIONS = {
+    'gemini': lambda *args, **kwargs: generate_strategy(*args, **kwargs),
+    'cohere': lambda *args, **kwargs: generate_strategy_cohere(*args, **kwargs),
+}
+
+
+def _get_provider_executor():
+    global _provider_executor
+    if _provider_executor is None:
+        with _provider_executor_lock:
+            if _provider_executor is None:
+                _provider_executor = ThreadPoolExecutor(
+                    max_workers=app_setting('AI_PROVIDER_THREADS', 8),
+                    thread_name_prefix='ai-provider'
+                )
+    return _provider_executor
+
+
+def _timeout_result(provider):
+    return {
+        'success': False,
+        'timeout': True,
+        'error_type': 'timeout',
+        'provider': provider,
+        'error': 'La IA tardó demasiado en responder. Intenta de nuevo en unos segundos.'
+    }
+
+
+def _submit_provider(provider, prompt, api_key, call_deadline):
     """
-    Detecta automáticamente qué API usar basándose en el formato de la key
+    Lanza la llamada al proveedor en el pool con el tiempo restante hasta
+    call_deadline (ya recortado con _provider_deadline) como timeout.
+    Si el circuito está abierto retorna un future ya resuelto con el error.
+    """
+    blocking = circuit_breakers.check(provider, api_key)
+    if blocking is not None:
+        logger.info(f"⛔ Circuito {blocking.name} abierto, {provider} no se llama")
+        future = Future()
+        future.set_result(_circuit_open_result(provider, blocking))
+        return future
+
+    remaining = max(0.1, call_deadline - time.monotonic())
+    return _get_provider_executor().submit(_guarded_call, provider, prompt, api_key, remaining)
+
+
+def _call_with_deadline(provider, prompt, api_key, deadline):
+    """Llama a un proveedor sin exceder el deadline (time.monotonic)"""
+    if deadline - time.monotonic() <= 0:
+        return _timeout_result(provider)
+
+    call_deadline = _provider_deadline(provider, deadline)
+    future = _submit_provider(provider, prompt, api_key, call_deadline)
+    try:
+        return future.result(timeout=max(0, call_deadline - time.monotonic()))
+    except FutureTimeoutError:
+        # La llamada sigue en su hilo hasta su propio timeout; su resultado se ignora
+        future.cancel()
+        logger.warning(f"⏱️ {provider} excedió el presupuesto de tiempo")
+        return _timeout_result(provider)
+
+
+# Fallos del proveedor (caído, lento o con el circuito abierto): el otro puede responder.
+# Con la key inválida o sin cuota cambiar de proveedor no ayuda.
+FALLBACK_ERROR_TYPES = {'timeout', 'provider', 'circuit_open'}
+
+
+def _should_fallback(result):
+    """Si Cohere falla por culpa del proveedor, intentar con Gemini"""
+    return not result['success'] and result.get('error_type', 'provider') in FALLBACK_ERROR_TYPES
+
+
+def _race_providers(prompt, api_key, primary, fallback, deadline, hedge_delay):
     """
+    Modo hedged: arranca el fallback si el primario no respondió tras
+    hedge_delay segundos y se queda con la primera respuesta exitosa.
+    """
+    futures = {_submit_provider(primary, prompt, api_key, _provider_deadline(primary, deadline)): primary}
+    first_failure = None
+
+    done, _ = wait(futures, timeout=min(hedge_delay, max(0, deadline - time.monotonic())),
+                   return_when=FIRST_COMPLETED)
+    if done:
+        result = done.pop().result()
+        if result['success'] or not _should_fallback(result):
+            return result
+        first_failure = result
+        futures = {}
+
+    if deadline - time.monotonic() > 0:
+        logger.info(f"🏁 Hedge: lanzando {fallback} en paralelo a {primary}")
+        futures[_submit_provider(fallback, prompt, api_key, _provider_deadline(fallback, deadline))] = fallback
+
+    pending = set(futures)
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            result = future.result()
+            if result['success']:
+                # El perdedor se cancela si no arrancó; si ya corre, se ignora
+                for loser in pending:
+                    loser.cancel()
+                return result
+            first_failure = first_failure or result
+
+    for future in pending:
+        future.cancel()
+    return first_failure or _timeout_result(primary)
+
+
+def detect_and_generate(prompt, api_key, deadline=None, hedge_delay=None):
+    """
+    Detecta automáticamente qué API usar basándose en el formato de la key.
+
+    Todo el proceso respeta un presupuesto (AI_TIMEOUT_SECONDS, o el deadline
+    time.monotonic() recibido): el fallback solo usa el tiempo que queda, así
+    que la latencia total no es la suma de los timeouts de cada proveedor.
+    Con hedge_delay (o AI_HEDGE_DELAY_SECONDS) el fallback se lanza en
+    paralelo si el primario tarda más de ese tiempo.
+    """
+    if is_fake_api_key(api_key):
+        return {
+            'success': True,
+            'response': ''.join(stream_strategy_fake(prompt, api_key, delay=0)),
+            'provider': 'fake',
+            'model': 'fake-stream',
+        }
+
+    if deadline is None:
+        deadline = time.monotonic() + app_setting('AI_TIMEOUT_SECONDS', 60)
+    if hedge_delay is None:
+        hedge_delay = app_setting('AI_HEDGE_DELAY_SECONDS')
+
     # Las API keys de Google suelen empezar con "AIza"
     if api_key.startswith('AIza'):
-        print("Detectado: Google Gemini API")
-        return generate_strategy(prompt, api_key)
-    else:
-        # Intentar primero con Cohere
-        print("Intentando con Cohere...")
-        result = generate_strategy_cohere(prompt, api_key)
-        
-        # Si Cohere falla, intentar con Gemini
-        if not result['success'] and 'cohere' not in result['error'].lower():
-            print("Cohere falló, intentando con Gemini...")
-            return generate_strategy(prompt, api_key)
-        
-        return result
\ No newline at end of file
+        logger.info("Detectado: Google Gemini API")
+        return _call_with_deadline('gemini', prompt, api_key, deadline)
+
+    if hedge_delay is not None:
+        return _race_providers(prompt, api_key, 'cohere', 'gemini', deadline, hedge_delay)
+
+    # Intentar primero con Cohere
+    logger.info("Intentando con Cohere...")
+    result = _call_with_deadline('cohere', prompt, api_key, deadline)
+    
+    # Si Cohere falla, intentar con Gemini con el tiempo restante
+    if _should_fallback(result) and deadline - time.monotonic() > 0:
+        logger.info("Cohere falló, intentando con Gemini...")
+        return _call_with_deadline('gemini', prompt, api_key, deadline)
+    
+    return result
+
+
+# ✅ STREAMING: los proveedores entregan el texto por fragmentos a medida que se genera
+
+FAKE_API_KEY_PREFIX = 'fake-'
+
+
+def is_fake_api_key(api_key):
+    """El proveedor falso solo se acepta si está habilitado (desarrollo / pruebas)"""
+    enabled = app_setting('AI_FAKE_PROVIDER_ENABLED', False)
+    return bool(enabled) and api_key.startswith(FAKE_API_KEY_PREFIX)
+
+
+def stream_strategy(prompt, api_key):
+    """Genera estrategia en streaming usando Gemini. Lanza AIProviderError."""
+    try:
+        model = get_gemini_model(api_key)
+        response = model.generate_content(
+            prompt, stream=True,
+            request_options={'timeout': app_setting('AI_TIMEOUT_SECONDS', 60)}
+        )
+
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Fragmento sin partes de texto (p. ej. bloqueado por seguridad)
+                continue
+            if text:
+                yield text
+
+    except AIProviderError:
+        raise
+    except Exception as e:
+        raise AIProviderError(_gemini_error_message(str(e)), _gemini_error_type(str(e))) from e
+
+
+def stream_strategy_cohere(prompt, api_key):
+    """Genera estrategia en streaming usando Cohere. Lanza AIProviderError."""
+    try:
+        co = get_cohere_client(api_key)
+
+        if hasattr(co, 'generate_stream'):
+            # SDK cohere >= 5
+            events = co.generate_stream(model=COHERE_MODEL, prompt=prompt, max_tokens=1000, temperature=0.7)
+            for event in events:
+                if getattr(event, 'event_type', None) == 'text-generation' and event.text:
+                    yield event.text
+        else:
+            events = co.generate(model=COHERE_MODEL, prompt=prompt, max_tokens=1000, temperature=0.7, stream=True)
+            for token in events:
+                if getattr(token, 'text', None):
+                    yield token.text
+
+    except Exception as e:
+        raise AIProviderError(f'Error con Cohere: {str(e)}', _cohere_error_type(str(e))) from e
+
+
+def stream_strategy_fake(prompt, api_key, delay=0.05):
+    """
+    Proveedor local que emite fragmentos sin red. Útil para desarrollo y para
+    probar el streaming de extremo a extremo con una key 'fake-...'.
+    """
+    lines = [
+        '## Estrategia de marketing (proveedor de prueba)\n\n',
+        'Resumen del pedido:\n',
+    ]
+    lines += [f'- {line}\n' for line in prompt.splitlines() if line.strip()]
+    lines.append('\n1. Hook en los primeros 3 segundos.\n2. Demostración del beneficio.\n3. Llamada a la acción.\n')
+
+    for line in lines:
+        for word in line.split(' '):
+            if delay:
+                time.sleep(delay)
+            yield word + (' ' if not word.endswith('\n') else '')
+
+
+STREAM_MODELS = {'gemini': GEMINI_MODEL, 'cohere': COHERE_MODEL, 'fake': 'fake-stream'}
+
+
+def _guarded_stream(provider, stream_function, prompt, api_key, meta=None):
+    """Streaming con el mismo circuit breaker que las llamadas completas"""
+    blocking = circuit_breakers.check(provider, api_key)
+    if blocking is not None:
+        raise AIProviderError(_circuit_open_message(blocking), _circuit_error_type(blocking))
+
+    if meta is not None:
+        meta.update(provider=provider, model=STREAM_MODELS[provider])
+
+    started = time.monotonic()
+    try:
+        yield from stream_function(prompt, api_key)
+    except AIProviderError as e:
+        circuit_breakers.record(provider, api_key, False, time.monotonic() - started,
+                                error_type=e.error_type, error=str(e))
+        raise
+    except GeneratorExit:
+        # El cliente cortó la conexión: no dice nada del proveedor, solo se devuelve el probe
+        circuit_breakers.cancel(provider, api_key)
+        raise
+    circuit_breakers.record(provider, api_key, True, time.monotonic() - started)
+
+
+def stream_and_generate(prompt, api_key, meta=None):
+    """
+    Versión en streaming de detect_and_generate: elige proveedor según la key.
+    Solo hace fallback a Gemini si Cohere falla antes de emitir texto.
+    Si recibe meta (dict), deja ahí el proveedor y modelo que respondieron.
+    """
+    if is_fake_api_key(api_key):
+        if meta is not None:
+            meta.update(provider='fake', model=STREAM_MODELS['fake'])
+        yield from stream_strategy_fake(prompt, api_key)
+        return
+
+    if api_key.startswith('AIza'):
+        yield from _guarded_stream('gemini', stream_strategy, prompt, api_key, meta)
+        return
+
+    emitted = False
+    try:
+        for chunk in _guarded_stream('cohere', stream_strategy_cohere, prompt, api_key, meta):
+            emitted = True
+            yield chunk
+    except AIProviderError as e:
+        if emitted or e.error_type not in FALLBACK_ERROR_TYPES:
+            raise
+        yield from _guarded_stream('gemini', stream_strategy, prompt, api_key, meta)
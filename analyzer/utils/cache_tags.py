@@ -0,0 +1,52 @@
+# analyzer/utils/cache_tags.py
+
+import time
+
+from django.core.cache import cache
+
+GENERATION_PREFIX = 'tag:gen'
+
+
+def generation_key(tag):
+    return f"{GENERATION_PREFIX}:{tag}"
+
+
+def _initial_generation():
+    # Arranca en el timestamp en µs: si el backend desaloja el contador, el
+    # nuevo siempre es mayor que cualquier generación anterior del tag
+    return time.time_ns() // 1000
+
+
+def get_generations(tags, known=None):
+    """
+    {tag: generación} de cada tag. known: valores ya leídos con get_many
+    (por clave de generación) para no repetir la consulta.
+    """
+    keys = {tag: generation_key(tag) for tag in tags}
+    values = known if known is not None else cache.get_many(list(keys.values()))
+    generations = {}
+    for tag, key in keys.items():
+        generation = values.get(key)
+        if generation is None:
+            cache.add(key, _initial_generation(), None)
+            generation = cache.get(key)
+        generations[tag] = generation
+    return generations
+
+
+def invalidate_tag(tag):
+    """Un incremento atómico: las claves con la generación anterior quedan huérfanas y expiran solas"""
+    key = generation_key(tag)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Sin contador todavía: nadie tiene claves con este tag
+        cache.add(key, _initial_generation(), None)
+        return cache.get(key)
+
+
+def tagged_key(key, generations):
+    """Clave física con la generación de cada tag: 'user_stats:42|user:42=1718...'"""
+    if not generations:
+        return key
+    return key + '|' + ','.join(f"{tag}={generations[tag]}" for tag in sorted(generations))
@@ -0,0 +1,272 @@
+# analyzer/utils/circuit_breaker.py
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker con ventana deslizante y timeout adaptativo.
+
+    - CLOSED: deja pasar todo y mide errores/latencia de las últimas llamadas.
+    - OPEN: falla rápido durante open_seconds (no ocupa un worker esperando).
+    - HALF_OPEN: deja pasar unas pocas llamadas de prueba; si salen bien
+      vuelve a CLOSED, si fallan vuelve a OPEN.
+
+    El estado es por proceso: cada worker de gunicorn aprende por su cuenta.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, window_size=20, min_calls=5, error_rate_threshold=0.5,
+                 slow_call_seconds=30, slow_call_rate_threshold=0.5, open_seconds=30,
+                 half_open_probes=1, timeout_percentile=0.95, timeout_multiplier=1.5,
+                 min_timeout=5):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.timeout_percentile = timeout_percentile
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout = min_timeout
+
+        self.state = self.CLOSED
+        self.opened_until = 0
+        self.probes_in_flight = 0
+        self.last_error = None
+        self.outcomes = deque(maxlen=window_size)  # (ok, segundos)
+        self.latencies = deque(maxlen=window_size * 5)  # solo llamadas exitosas
+        self.stats = {'calls': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """True si la llamada puede salir; en HALF_OPEN reserva un probe"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now < self.opened_until:
+                    self.stats['rejected'] += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self.probes_in_flight = 0
+                logger.info(f"🟡 Circuito {self.name} en half-open")
+
+            if self.state == self.HALF_OPEN:
+                if self.probes_in_flight >= self.half_open_probes:
+                    self.stats['rejected'] += 1
+                    return False
+                self.probes_in_flight += 1
+            return True
+
+    def cancel_probe(self):
+        """Devuelve un probe reservado que finalmente no se usó"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+
+    def retry_after(self):
+        """Segundos hasta el próximo intento permitido"""
+        return max(0, round(self.opened_until - time.monotonic(), 1))
+
+    def record_success(self, seconds):
+        with self._lock:
+            self.stats['calls'] += 1
+            self.latencies.append(seconds)
+            self.outcomes.append((True, seconds))
+            if self.state == self.HALF_OPEN:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+                self._close()
+            else:
+                self._evaluate()
+
+    def record_failure(self, seconds, error=None):
+        with self._lock:
+            self.stats['calls'] += 1
+            self.stats['failures'] += 1
+            self.last_error = error
+            self.outcomes.append((False, seconds))
+            if self.state == self.HALF_OPEN:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+                self._open(self.open_seconds)
+            else:
+                self._evaluate()
+
+    def trip(self, seconds=None, error=None):
+        """Abre el circuito sin esperar a la ventana (p. ej. cuota agotada)"""
+        with self._lock:
+            self.last_error = error
+            self._open(seconds or self.open_seconds)
+
+    def get_timeout(self, default):
+        """
+        Timeout adaptativo: percentil de latencia reciente × multiplicador,
+        nunca menor que min_timeout ni mayor que default.
+        """
+        with self._lock:
+            if len(self.latencies) < self.min_calls:
+                return default
+            ordered = sorted(self.latencies)
+            index = min(len(ordered) - 1, int(len(ordered) * self.timeout_percentile))
+            adaptive = ordered[index] * self.timeout_multiplier
+        return min(default, max(self.min_timeout, adaptive))
+
+    def get_state(self):
+        with self._lock:
+            failures = sum(1 for ok, _ in self.outcomes if not ok)
+            return {
+                'name': self.name,
+                'state': self.state,
+                'retry_after': self.retry_after() if self.state == self.OPEN else 0,
+                'window_calls': len(self.outcomes),
+                'window_error_rate': round(failures / len(self.outcomes), 3) if self.outcomes else 0,
+                'last_error': self.last_error,
+                **self.stats,
+            }
+
+    def _evaluate(self):
+        """Abre el circuito si la ventana supera los umbrales de error o lentitud"""
+        if len(self.outcomes) < self.min_calls:
+            return
+        total = len(self.outcomes)
+        error_rate = sum(1 for ok, _ in self.outcomes if not ok) / total
+        slow_rate = 0
+        if self.slow_call_seconds:
+            slow_rate = sum(1 for _, seconds in self.outcomes if seconds >= self.slow_call_seconds) / total
+        if error_rate >= self.error_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+            self._open(self.open_seconds)
+
+    def _open(self, seconds):
+        if self.state != self.OPEN:
+            self.stats['opened'] += 1
+            logger.warning(f"🔴 Circuito {self.name} abierto por {seconds}s ({self.last_error})")
+        self.state = self.OPEN
+        self.opened_until = time.monotonic() + seconds
+        self.outcomes.clear()
+
+    def _close(self):
+        if self.state != self.CLOSED:
+            logger.info(f"🟢 Circuito {self.name} cerrado")
+        self.state = self.CLOSED
+        self.outcomes.clear()
+
+
+class CircuitBreakerRegistry:
+    """
+    Breakers por proveedor y, para errores de cuota, por proveedor + API key.
+
+    Los breakers de key solo existen mientras la key está enfriándose: se
+    descartan al volver a cerrar y, como máximo, se guardan max_key_breakers
+    (LRU). Si se descarta uno aún abierto, esa key solo gana un intento extra.
+    """
+
+    # Tipos de error que dicen algo del proveedor (no de la key del usuario)
+    PROVIDER_ERROR_TYPES = {'timeout', 'provider'}
+
+    def __init__(self, **breaker_options):
+        self.breaker_options = breaker_options
+        self.quota_cooldown_seconds = breaker_options.pop('quota_cooldown_seconds', 60)
+        self.max_key_breakers = breaker_options.pop('max_key_breakers', 1000)
+        self._breakers = {}
+        self._key_breakers = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_breaker_name(provider, api_key):
+        return f"{provider}:key:{hashlib.sha256(api_key.encode()).hexdigest()[:16]}"
+
+    def get(self, name):
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(name, **self.breaker_options)
+                self._breakers[name] = breaker
+            return breaker
+
+    def get_key_breaker(self, provider, api_key, create=False):
+        """Breaker de cuota de la key (None si la key no está enfriándose)"""
+        name = self.key_breaker_name(provider, api_key)
+        with self._lock:
+            breaker = self._key_breakers.get(name)
+            if breaker is not None:
+                self._key_breakers.move_to_end(name)
+            elif create:
+                breaker = CircuitBreaker(name, **self.breaker_options)
+                self._key_breakers[name] = breaker
+                while len(self._key_breakers) > self.max_key_breakers:
+                    self._key_breakers.popitem(last=False)
+            return breaker
+
+    def _forget_if_closed(self, breaker):
+        with self._lock:
+            if breaker.state == CircuitBreaker.CLOSED and self._key_breakers.get(breaker.name) is breaker:
+                del self._key_breakers[breaker.name]
+
+    def check(self, provider, api_key):
+        """Retorna el breaker que bloquea la llamada, o None si puede salir"""
+        key_breaker = self.get_key_breaker(provider, api_key)
+        if key_breaker is not None and not key_breaker.allow_request():
+            return key_breaker
+        provider_breaker = self.get(provider)
+        if not provider_breaker.allow_request():
+            if key_breaker is not None:
+                key_breaker.cancel_probe()
+            return provider_breaker
+        return None
+
+    def cancel(self, provider, api_key):
+        """Devuelve los probes de una llamada que terminó sin resultado (p. ej. el cliente se fue)"""
+        self.get(provider).cancel_probe()
+        key_breaker = self.get_key_breaker(provider, api_key)
+        if key_breaker is not None:
+            key_breaker.cancel_probe()
+
+    def record(self, provider, api_key, success, seconds, error_type=None, error=None):
+        """
+        Registra el resultado de una llamada en los breakers que corresponda.
+        Si la key estaba en half-open, su probe siempre se resuelve aquí:
+        éxito cierra (y descarta su breaker), cuota vuelve a abrir y
+        cualquier otro error solo devuelve el probe (no dice nada de la cuota).
+        """
+        provider_breaker = self.get(provider)
+        key_breaker = self.get_key_breaker(provider, api_key)
+        if key_breaker is not None and key_breaker.state == CircuitBreaker.CLOSED:
+            key_breaker = None
+
+        if success:
+            provider_breaker.record_success(seconds)
+            if key_breaker is not None:
+                key_breaker.record_success(seconds)
+                self._forget_if_closed(key_breaker)
+            return
+
+        if error_type == 'quota':
+            # Cuota agotada: solo esta key deja de intentarlo por un rato. No
+            # es una respuesta normal del proveedor: no entra en las latencias
+            # del timeout adaptativo ni cierra su circuito si estaba en prueba
+            self.get_key_breaker(provider, api_key, create=True).trip(self.quota_cooldown_seconds, error)
+            provider_breaker.cancel_probe()
+            return
+
+        if key_breaker is not None:
+            key_breaker.cancel_probe()
+        if error_type in self.PROVIDER_ERROR_TYPES:
+            provider_breaker.record_failure(seconds, error)
+        else:
+            # Errores del usuario (key inválida, etc.) no dicen nada del proveedor:
+            # ni latencia para el timeout adaptativo ni cierre de un half-open
+            provider_breaker.cancel_probe()
+
+    def get_states(self):
+        with self._lock:
+            breakers = list(self._breakers.values()) + list(self._key_breakers.values())
+        return {breaker.name: breaker.get_state() for breaker in breakers}
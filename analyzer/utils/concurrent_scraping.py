@@ -0,0 +1,142 @@
+# analyzer/utils/concurrent_scraping.py
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from analyzer.conf import app_setting
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Límite por host compartido por todas las llamadas del proceso. Se toma en
+# el hilo que descarga: si el deadline cancela la tarea, el lugar sigue
+# ocupado hasta que la descarga termine de verdad
+_host_slots = weakref.WeakValueDictionary()
+_host_slots_lock = threading.Lock()
+
+
+def _get_executor():
+    """Hilos para las descargas (la sesión HTTP compartida es bloqueante)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=app_setting('SCRAPING_MAX_CONCURRENCY', 8),
+                    thread_name_prefix='scraper'
+                )
+    return _executor
+
+
+def _timeout_result():
+    return {
+        'success': False,
+        'timeout': True,
+        'error': 'Tiempo agotado descargando la página'
+    }
+
+
+def _default_fetch(url, timeout):
+    from analyzer.cache import cached_scrape_product_info
+    return cached_scrape_product_info(url, timeout=timeout)
+
+
+def _host_of(url):
+    return (urlsplit(url).hostname or '').lower()
+
+
+def _host_semaphore(host, per_host):
+    with _host_slots_lock:
+        semaphore = _host_slots.get((host, per_host))
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(per_host)
+            _host_slots[(host, per_host)] = semaphore
+        return semaphore
+
+
+def _fetch_with_host_slot(fetch, url, deadline, per_host):
+    """Corre en el hilo del executor: espera lugar en el host sin pasarse del deadline"""
+    semaphore = _host_semaphore(_host_of(url), per_host)
+    if not semaphore.acquire(timeout=max(0, deadline - time.monotonic())):
+        return _timeout_result()
+    try:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return _timeout_result()
+        return fetch(url, remaining)
+    finally:
+        semaphore.release()
+
+
+async def _scrape_all(urls, deadline, per_host, fetch):
+    loop = asyncio.get_running_loop()
+    semaphores = {}
+
+    async def scrape_one(url):
+        # Este semáforo solo evita ocupar hilos esperando al mismo host; el
+        # límite real lo impone _fetch_with_host_slot
+        semaphore = semaphores.setdefault(_host_of(url), asyncio.Semaphore(per_host))
+        async with semaphore:
+            if deadline - time.monotonic() <= 0:
+                return _timeout_result()
+            # run_in_executor no copia el contexto: el hilo necesita el usuario para la cola justa
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(
+                _get_executor(), context.run, _fetch_with_host_slot, fetch, url, deadline, per_host
+            )
+
+    tasks = {asyncio.ensure_future(scrape_one(url)): url for url in urls}
+    done, pending = await asyncio.wait(tasks, timeout=max(0, deadline - time.monotonic()))
+    for task in pending:
+        # La descarga sigue en su hilo hasta su propio timeout; su resultado se ignora
+        task.cancel()
+
+    results = {}
+    for task, url in tasks.items():
+        if task not in done:
+            logger.warning(f"⏱️ Scraping excedió el deadline: {url}")
+            results[url] = _timeout_result()
+        elif task.exception() is not None:
+            results[url] = {'success': False, 'error': str(task.exception())}
+        else:
+            results[url] = task.result()
+    return results
+
+
+def scrape_many(urls, deadline_seconds=None, per_host=None, fetch=None):
+    """
+    Descarga varias páginas de producto en paralelo.
+
+    Todas comparten un deadline (COMPETITIVE_SCRAPE_DEADLINE_SECONDS) y cada
+    host admite como máximo SCRAPING_PER_HOST_CONCURRENCY descargas a la vez
+    en el proceso, contando las que siguen en curso tras un deadline vencido.
+    Las páginas que no llegan a tiempo vuelven como {'success': False,
+    'timeout': True}: el resultado siempre trae todas las URLs.
+    """
+    urls = list(dict.fromkeys(url for url in urls if url))
+    if not urls:
+        return {}
+
+    deadline = time.monotonic() + (deadline_seconds or app_setting('COMPETITIVE_SCRAPE_DEADLINE_SECONDS', 15))
+    coroutine = _scrape_all(
+        urls, deadline,
+        per_host or app_setting('SCRAPING_PER_HOST_CONCURRENCY', 2),
+        fetch or _default_fetch,
+    )
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    # Ya hay un event loop en este hilo: ejecutar en un hilo aparte
+    with ThreadPoolExecutor(max_workers=1) as runner:
+        return runner.submit(contextvars.copy_context().run, asyncio.run, coroutine).result()
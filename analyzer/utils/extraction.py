@@ -0,0 +1,382 @@
+# analyzer/utils/extraction.py
+
+import json
+import re
+from html.parser import HTMLParser
+
+from .extraction_rules import json_ld_path
+
+# Precio en texto visible: símbolo antes del número o código/símbolo después
+PRICE_TEXT_PATTERN = re.compile(
+    r'(?:US\$|R\$|MX\$|CA\$|AU\$|S/\.?|[$€£¥₹])\s?\d(?:[\d.,]*\d)?'
+    r'|\d(?:[\d.,]*\d)?\s?(?:€|£|(?:EUR|USD|MXN|COP|ARS|CLP|PEN|BRL|GBP)\b)'
+)
+NUMBER_PATTERN = re.compile(r'\d(?:[\d.,]*\d)?')
+
+# Elementos sin cierre: no entran en la pila de ancestros de los selectores
+VOID_TAGS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+    'meta', 'param', 'source', 'track', 'wbr',
+))
+BARE_AMOUNT_PATTERN = re.compile(r'^\d[\d.,]*$')
+
+# Caracteres de texto visible que se revisan como máximo buscando un precio
+# (alineado con el tope por defecto de SCRAPING_MAX_BYTES)
+TEXT_SCAN_LIMIT = 512 * 1024
+
+CURRENCY_SYMBOLS = {
+    'USD': '$', 'EUR': '€', 'GBP': '£', 'BRL': 'R$', 'MXN': 'MX$',
+    'JPY': '¥', 'INR': '₹', 'PEN': 'S/',
+}
+
+# Prioridad de las fuentes de precio (menor = más confiable)
+PRICE_SOURCES = ('json_ld', 'og:price:amount', 'product:price:amount', 'itemprop', 'text')
+
+META_PRICE_PROPERTIES = ('og:price:amount', 'product:price:amount')
+META_CURRENCY_PROPERTIES = {
+    'og:price:currency': 'og:price:amount',
+    'product:price:currency': 'product:price:amount',
+}
+
+
+def format_price(amount, currency=None):
+    """'19.99' + 'USD' -> '$19.99'; sin símbolo conocido -> '19.99 CLP'"""
+    amount = str(amount).strip()
+    if not amount:
+        return ''
+    currency = (currency or '').strip().upper()
+    if not currency:
+        return amount
+    symbol = CURRENCY_SYMBOLS.get(currency)
+    return f"{symbol}{amount}" if symbol else f"{amount} {currency}"
+
+
+def _iter_products(node):
+    """Nodos @type Product dentro de un documento JSON-LD (listas y @graph incluidos)"""
+    if isinstance(node, list):
+        for item in node:
+            yield from _iter_products(item)
+    elif isinstance(node, dict):
+        node_type = node.get('@type')
+        types = node_type if isinstance(node_type, list) else [node_type]
+        if 'Product' in types:
+            yield node
+        if '@graph' in node:
+            yield from _iter_products(node['@graph'])
+
+
+def load_json_ld(raw):
+    try:
+        return json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_json_ld_product(document):
+    """
+    (precio, nombre, descripción) del primer Product con oferta en un
+    documento JSON-LD; cualquier campo ausente es ''.
+    """
+    for product in _iter_products(document):
+        offers = product.get('offers') or {}
+        if isinstance(offers, list):
+            offers = offers[0] if offers else {}
+        if not isinstance(offers, dict):
+            offers = {}
+        amount = offers.get('price', offers.get('lowPrice', ''))
+        name = product.get('name') or ''
+        description = product.get('description') or ''
+        price = format_price(amount, offers.get('priceCurrency')) if amount not in ('', None) else ''
+        return price, str(name), str(description)
+    return '', '', ''
+
+
+class ProductMetaParser(HTMLParser):
+    """
+    Extractor incremental de título, descripción y precio.
+
+    Se alimenta por fragmentos con feed(). El precio se toma de la fuente
+    más confiable disponible (JSON-LD Product > og:price:amount >
+    product:price:amount > itemprop=price > texto visible); el escaneo de
+    texto está acotado a TEXT_SCAN_LIMIT caracteres. `complete` indica que
+    ya no hace falta seguir leyendo: hay título (h1, og:title, JSON-LD o
+    <title>), descripción y precio estructurado, o bien el <head> ya pasó y
+    el escaneo de texto se agotó, así que el resto del cuerpo no aporta.
+
+    Con una ExtractionRule del dominio, sus selectores tienen prioridad
+    sobre las heurísticas genéricas para cada campo que definen; los campos
+    sin acierto caen al valor genérico (`rule_hits` dice cuáles acertaron).
+    """
+
+    SKIP_TAGS = ('script', 'style')
+
+    def __init__(self, text_scan_limit=TEXT_SCAN_LIMIT, rule=None):
+        super().__init__(convert_charrefs=True)
+        self.rule = rule
+        self.rule_values = {}  # campo -> (prioridad, valor)
+        self._stack = []  # [(tag, attrs)] para selectores con descendientes
+        self._captures = []  # textos de elementos que coincidieron con un selector
+        self.h1 = None
+        self.og_title = ''
+        self.head_title = ''
+        self.head_done = False
+        self.json_ld_name = ''
+        self.description = ''
+        self.json_ld_description = ''
+        self.prices = {}  # fuente -> precio ya formateado
+        self.text_scan_remaining = text_scan_limit
+        # Montos sin símbolo: la moneda puede declararse antes o después
+        self._amounts = {}
+        self._currencies = {}
+        self._h1_parts = None
+        self._title_parts = None
+        self._skip_tag = None
+        self._json_ld_parts = None
+        self._itemprop_price_tag = None
+
+    # --- HTMLParser ---
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_tag = tag
+            attrs = dict(attrs)
+            if tag == 'script' and (attrs.get('type') or '').lower() == 'application/ld+json':
+                self._json_ld_parts = []
+            return
+
+        attrs = dict(attrs)
+        if self.rule:
+            self._match_rule(tag, attrs)
+        itemprop = attrs.get('itemprop')
+        if itemprop == 'price' and not self._has_price('itemprop'):
+            if attrs.get('content'):
+                self._amounts['itemprop'] = attrs['content']
+            else:
+                self._itemprop_price_tag = tag
+        elif itemprop == 'priceCurrency':
+            self._currencies.setdefault('itemprop', attrs.get('content') or '')
+
+        if tag == 'body':
+            self.head_done = True
+        if tag == 'h1' and self.h1 is None and self._h1_parts is None:
+            self._h1_parts = []
+        elif tag == 'title' and not self.head_done and not self.head_title:
+            # Solo el <title> del documento, no los de SVG en el cuerpo
+            self._title_parts = []
+        elif tag == 'meta':
+            self._handle_meta(attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag == self._itemprop_price_tag:
+            self._itemprop_price_tag = None
+        if self.rule and tag not in VOID_TAGS and tag not in self.SKIP_TAGS:
+            self._close_element(tag)
+
+    def handle_endtag(self, tag):
+        if self.rule and tag not in self.SKIP_TAGS:
+            self._close_element(tag)
+        if tag == self._skip_tag:
+            if self._json_ld_parts is not None:
+                self._handle_json_ld(''.join(self._json_ld_parts))
+                self._json_ld_parts = None
+            self._skip_tag = None
+        elif tag == 'h1' and self._h1_parts is not None:
+            self.h1 = ''.join(self._h1_parts).strip()
+            self._h1_parts = None
+        elif tag == 'title' and self._title_parts is not None:
+            self.head_title = ' '.join(''.join(self._title_parts).split())
+            self._title_parts = None
+        elif tag == 'head':
+            self.head_done = True
+        if tag == self._itemprop_price_tag:
+            self._itemprop_price_tag = None
+
+    def handle_data(self, data):
+        if self._skip_tag:
+            if self._json_ld_parts is not None:
+                self._json_ld_parts.append(data)
+            return
+        if self._h1_parts is not None:
+            self._h1_parts.append(data)
+        if self._title_parts is not None:
+            self._title_parts.append(data)
+            return  # El <title> no es texto visible: no se escanea como precio
+        for capture in self._captures:
+            capture[2].append(data)
+        if self._itemprop_price_tag and not self._has_price('itemprop'):
+            self._handle_itemprop_text(data)
+        if 'text' not in self.prices and self.text_scan_remaining > 0:
+            chunk = data[:self.text_scan_remaining]
+            self.text_scan_remaining -= len(chunk)
+            match = PRICE_TEXT_PATTERN.search(chunk)
+            if match:
+                self._set_price('text', match.group())
+
+    # --- reglas por dominio ---
+
+    def _match_rule(self, tag, attrs):
+        element = (tag, attrs)
+        stack = self._stack + [element] if tag in VOID_TAGS else self._stack
+        if tag not in VOID_TAGS:
+            self._stack.append(element)
+        for field, selectors in self.rule.selectors.items():
+            for priority, selector in enumerate(selectors):
+                if self._rule_priority(field) <= priority:
+                    break  # Ya hay un valor de un selector más prioritario
+                if not selector.matches(stack):
+                    continue
+                if selector.attr:
+                    self._set_rule_value(field, priority, attrs.get(selector.attr) or '')
+                elif tag not in VOID_TAGS:
+                    self._captures.append((field, len(self._stack), [], priority))
+                break
+
+    def _close_element(self, tag):
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index][0] == tag:
+                del self._stack[index:]
+                break
+        else:
+            return  # Cierre sin apertura (HTML mal formado)
+        depth = len(self._stack)
+        finished = [capture for capture in self._captures if capture[1] > depth]
+        if finished:
+            self._captures = [capture for capture in self._captures if capture[1] <= depth]
+            for field, _, parts, priority in finished:
+                self._set_rule_value(field, priority, ''.join(parts))
+
+    def _rule_priority(self, field):
+        return self.rule_values[field][0] if field in self.rule_values else float('inf')
+
+    def _set_rule_value(self, field, priority, value):
+        value = ' '.join(value.split())
+        if value and priority < self._rule_priority(field):
+            self.rule_values[field] = (priority, value)
+
+    def _rule_value(self, field):
+        return self.rule_values[field][1] if field in self.rule_values else ''
+
+    @property
+    def rule_hits(self):
+        """Campos reportables que se obtuvieron con la regla del dominio"""
+        return {field for field in self.rule_values if field != 'currency'}
+
+    # --- fuentes ---
+
+    def _handle_meta(self, attrs):
+        key = attrs.get('property') or attrs.get('name') or ''
+        content = attrs.get('content') or ''
+        if key == 'og:title' and not self.og_title:
+            self.og_title = content
+        elif attrs.get('name') == 'description' and not self.description:
+            self.description = content
+        elif key in META_PRICE_PROPERTIES and content:
+            self._amounts.setdefault(key, content)
+        elif key in META_CURRENCY_PROPERTIES and content:
+            self._currencies.setdefault(META_CURRENCY_PROPERTIES[key], content)
+
+    def _handle_json_ld(self, raw):
+        document = load_json_ld(raw)
+        if document is None:
+            return
+        if self.rule and self.rule.json_ld:
+            # Las rutas JSON-LD de la regla van después de sus selectores
+            for field, path in self.rule.json_ld.items():
+                priority = len(self.rule.selectors.get(field, ()))
+                for product in _iter_products(document):
+                    value = json_ld_path(product, path)
+                    if value not in (None, ''):
+                        self._set_rule_value(field, priority, str(value))
+                        break
+        price, name, description = parse_json_ld_product(document)
+        if price and 'json_ld' not in self.prices:
+            self._set_price('json_ld', price)
+        self.json_ld_name = self.json_ld_name or name
+        self.json_ld_description = self.json_ld_description or description
+
+    def _handle_itemprop_text(self, data):
+        match = PRICE_TEXT_PATTERN.search(data)
+        if match:
+            self._set_price('itemprop', match.group())
+            return
+        match = NUMBER_PATTERN.search(data)
+        if match:
+            self._amounts['itemprop'] = match.group()
+
+    def _set_price(self, source, price):
+        if price:
+            self.prices[source] = price
+
+    def _has_price(self, source):
+        return bool(self.prices.get(source) or self._amounts.get(source))
+
+    def _price_for(self, source):
+        if self.prices.get(source):
+            return self.prices[source]
+        if self._amounts.get(source):
+            return format_price(self._amounts[source], self._currencies.get(source))
+        return ''
+
+    # --- resultado ---
+
+    @property
+    def price_source(self):
+        for source in PRICE_SOURCES:
+            if self._has_price(source):
+                return source
+        return None
+
+    @property
+    def price(self):
+        source = self.price_source
+        return self._price_for(source) if source else ''
+
+    @property
+    def has_structured_price(self):
+        """Precio de una fuente estructurada: uno del texto puede mejorarse más adelante en la página"""
+        return self.price_source not in (None, 'text')
+
+    @property
+    def generic_title(self):
+        return self.h1 or self.og_title or self.json_ld_name or self.head_title
+
+    @property
+    def complete(self):
+        if self.head_done and self.text_scan_remaining <= 0:
+            # Metadatos del <head> ya leídos y escaneo de texto agotado
+            return True
+        generic = {
+            'title': self.generic_title,
+            'description': self.description or self.json_ld_description,
+            'price': self.has_structured_price,
+        }
+        if self.rule:
+            # Un campo con regla solo está listo cuando la regla acierta
+            return all(
+                self._rule_value(field) if field in self.rule.fields else generic[field]
+                for field in generic
+            )
+        return all(generic.values())
+
+    def _rule_price(self):
+        price = self._rule_value('price')
+        if price and BARE_AMOUNT_PATTERN.match(price):
+            currency = self._rule_value('currency') or self._currencies.get('itemprop')
+            return format_price(price, currency)
+        return price
+
+    def get_product_data(self):
+        return {
+            'title': self._rule_value('title') or self.generic_title,
+            'description': self._rule_value('description') or self.description or self.json_ld_description,
+            'price': self._rule_price() or self.price,
+        }
+
+
+def extract_product_data(html, text_scan_limit=TEXT_SCAN_LIMIT, rule=None):
+    """Extrae título, descripción y precio de un documento HTML completo"""
+    parser = ProductMetaParser(text_scan_limit=text_scan_limit, rule=rule)
+    parser.feed(html)
+    parser.close()
+    return parser.get_product_data()
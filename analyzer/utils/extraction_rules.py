@@ -0,0 +1,338 @@
+# analyzer/utils/extraction_rules.py
+
+import re
+from urllib.parse import urlsplit
+
+from django.core.exceptions import ImproperlyConfigured
+
+from analyzer.conf import app_setting
+
+# Campos que un rule puede extraer; currency solo sirve para formatear el precio
+RULE_FIELDS = ('title', 'price', 'description', 'currency')
+REPORTED_FIELDS = ('title', 'price', 'description')
+
+GENERIC_RULE = 'generic'
+
+# ✅ REGLAS INCLUIDAS (se pueden ampliar o reemplazar con SCRAPING_EXTRACTION_RULES)
+#
+# Selectores: tag, #id, .clase, [attr] y [attr=valor], combinables y con
+# descendientes separados por espacio; '@attr' al final lee el atributo en
+# vez del texto. json_ld: rutas con puntos dentro del nodo Product.
+DEFAULT_EXTRACTION_RULES = {
+    'amazon': {
+        'hosts': [
+            'amazon.com', 'amazon.com.mx', 'amazon.es', 'amazon.com.br', 'amazon.ca',
+            'amazon.co.uk', 'amazon.de', 'amazon.fr', 'amazon.it',
+        ],
+        'title': ['#productTitle'],
+        'price': [
+            '#corePrice_feature_div .a-offscreen',
+            '#corePriceDisplay_desktop_feature_div .a-offscreen',
+            '#priceblock_ourprice',
+            '#priceblock_dealprice',
+        ],
+        'description': ['meta[name=description]@content', '#productDescription'],
+    },
+    'mercadolibre': {
+        'hosts': [
+            'mercadolibre.com.mx', 'mercadolibre.com.ar', 'mercadolibre.com.co',
+            'mercadolibre.cl', 'mercadolibre.com.pe', 'mercadolibre.com.uy',
+            'mercadolivre.com.br',
+        ],
+        'title': ['h1.ui-pdp-title'],
+        'price': ['meta[itemprop=price]@content'],
+        'currency': ['meta[itemprop=priceCurrency]@content'],
+        'description': ['meta[name=description]@content', 'p.ui-pdp-description__content'],
+    },
+    'ebay': {
+        'hosts': ['ebay.com', 'ebay.es', 'ebay.co.uk', 'ebay.de'],
+        'title': ['h1.x-item-title__mainTitle'],
+        'price': ['.x-price-primary', '[itemprop=price]@content'],
+        'currency': ['[itemprop=priceCurrency]@content'],
+        'description': ['meta[name=description]@content'],
+    },
+    'aliexpress': {
+        'hosts': ['aliexpress.com', 'aliexpress.us'],
+        'title': ['h1[data-pl=product-title]', 'meta[property=og:title]@content'],
+        'price': ['.product-price-current', '.product-price-value'],
+        'description': ['meta[name=description]@content'],
+    },
+    'walmart': {
+        'hosts': ['walmart.com', 'walmart.com.mx'],
+        'title': ['h1[itemprop=name]'],
+        'price': ['[itemprop=price]'],
+        'description': ['meta[name=description]@content'],
+        'json_ld': {'price': 'offers.price', 'currency': 'offers.priceCurrency'},
+    },
+}
+
+_COMPOUND_PATTERN = re.compile(r'^(?P<tag>[a-zA-Z][\w-]*|\*)?(?P<rest>(?:#[\w-]+|\.[\w-]+|\[[^\]]+\])*)$')
+_SIMPLE_PATTERN = re.compile(
+    r'#(?P<id>[\w-]+)'
+    r'|\.(?P<cls>[\w-]+)'
+    r'|\[\s*(?P<attr>[\w:-]+)\s*(?:=\s*(?P<value>"[^"]*"|\'[^\']*\'|[^\]\s]+)\s*)?\]'
+)
+_ATTR_SUFFIX_PATTERN = re.compile(r'^(?P<selector>.*[^\s])\s*@(?P<attr>[\w:-]+)$')
+
+
+class CompoundSelector:
+    """Un paso del selector: tag + #id + .clases + [atributos]"""
+
+    __slots__ = ('tag', 'id', 'classes', 'attrs')
+
+    def __init__(self, tag=None, element_id=None, classes=(), attrs=()):
+        self.tag = tag
+        self.id = element_id
+        self.classes = frozenset(classes)
+        self.attrs = tuple(attrs)  # (nombre, valor o None)
+
+    def matches(self, tag, attrs):
+        if self.tag and self.tag != tag:
+            return False
+        if self.id and attrs.get('id') != self.id:
+            return False
+        if self.classes and not self.classes.issubset((attrs.get('class') or '').split()):
+            return False
+        for name, value in self.attrs:
+            if name not in attrs or (value is not None and attrs[name] != value):
+                return False
+        return True
+
+
+class CompiledSelector:
+    """Selector con descendientes ('div.price span') y atributo opcional a leer"""
+
+    __slots__ = ('source', 'compounds', 'attr')
+
+    def __init__(self, source):
+        self.source = source
+        selector, self.attr = source.strip(), None
+        suffix = _ATTR_SUFFIX_PATTERN.match(selector)
+        if suffix and ']' not in suffix.group('attr'):
+            selector, self.attr = suffix.group('selector'), suffix.group('attr')
+        self.compounds = [self._compile_compound(part) for part in selector.split()]
+        if not self.compounds:
+            raise ValueError(f"Selector vacío: {source!r}")
+
+    def _compile_compound(self, part):
+        match = _COMPOUND_PATTERN.match(part)
+        if not match:
+            raise ValueError(f"Selector no soportado: {self.source!r}")
+        tag = match.group('tag')
+        element_id, classes, attrs = None, [], []
+        for simple in _SIMPLE_PATTERN.finditer(match.group('rest')):
+            if simple.group('id'):
+                element_id = simple.group('id')
+            elif simple.group('cls'):
+                classes.append(simple.group('cls'))
+            else:
+                value = simple.group('value')
+                if value is not None and value[:1] in ('"', "'"):
+                    value = value[1:-1]
+                attrs.append((simple.group('attr'), value))
+        return CompoundSelector(None if tag in (None, '*') else tag.lower(), element_id, classes, attrs)
+
+    def matches(self, stack):
+        """stack: [(tag, attrs)] desde la raíz hasta el elemento actual"""
+        if not stack or not self.compounds[-1].matches(*stack[-1]):
+            return False
+        position = len(stack) - 2
+        for compound in reversed(self.compounds[:-1]):
+            while position >= 0 and not compound.matches(*stack[position]):
+                position -= 1
+            if position < 0:
+                return False
+            position -= 1
+        return True
+
+
+class ExtractionRule:
+    """Reglas de un dominio ya compiladas: selectores y rutas JSON-LD por campo"""
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.hosts = [host.lower().removeprefix('www.') for host in spec.get('hosts', [])]
+        try:
+            self.selectors = {
+                field: [CompiledSelector(selector) for selector in spec.get(field, [])]
+                for field in RULE_FIELDS
+                if spec.get(field)
+            }
+        except ValueError as e:
+            raise ImproperlyConfigured(f"Regla de extracción '{name}': {e}")
+        self.json_ld = {
+            field: tuple(path.split('.'))
+            for field, path in (spec.get('json_ld') or {}).items()
+            if field in RULE_FIELDS
+        }
+        self.fields = tuple(
+            field for field in REPORTED_FIELDS
+            if field in self.selectors or field in self.json_ld
+        )
+
+    def __repr__(self):
+        return f"<ExtractionRule {self.name}>"
+
+
+def json_ld_path(node, path):
+    """Valor en una ruta con puntos; las listas usan índice numérico o su primer elemento"""
+    for key in path:
+        if isinstance(node, list):
+            if key.isdigit():
+                index = int(key)
+                node = node[index] if index < len(node) else None
+                continue
+            node = node[0] if node else None
+        if not isinstance(node, dict):
+            return None
+        node = node.get(key)
+    return node
+
+
+class ExtractionRuleRegistry:
+    """
+    Reglas por dominio compiladas una sola vez al importar el módulo.
+
+    La búsqueda es por hostname (sin www. y subiendo por los dominios padre:
+    'articulo.mercadolibre.com.mx' usa la regla de 'mercadolibre.com.mx').
+    Los hosts sin regla usan solo el extractor genérico. Los aciertos y
+    fallbacks por regla y campo, y las páginas sin regla por dominio, se
+    cuentan en el cache compartido para ver qué dominios siguen yendo por
+    el camino lento.
+    """
+
+    COUNTER_PREFIX = 'stats:extraction'
+    GENERIC_HOSTS_KEY = 'stats:extraction:generic_hosts'
+
+    def __init__(self, rules_spec):
+        self.rules = {}
+        self._by_host = {}
+        for name, spec in rules_spec.items():
+            if not spec:
+                continue  # Una regla en None desactiva la incluida por defecto
+            rule = ExtractionRule(name, spec)
+            self.rules[name] = rule
+            for host in rule.hosts:
+                self._by_host[host] = rule
+        self._known_generic_hosts = set()  # Ya registrados (copia local del registro compartido)
+
+    @classmethod
+    def from_settings(cls):
+        rules_spec = dict(DEFAULT_EXTRACTION_RULES)
+        rules_spec.update(app_setting('SCRAPING_EXTRACTION_RULES', {}) or {})
+        return cls(rules_spec)
+
+    def for_host(self, hostname):
+        labels = (hostname or '').lower().removeprefix('www.').split('.')
+        for start in range(len(labels) - 1):
+            rule = self._by_host.get('.'.join(labels[start:]))
+            if rule:
+                return rule
+        return None
+
+    def for_url(self, url):
+        return self.for_host(urlsplit(url).hostname)
+
+    # --- contadores ---
+
+    def _counter_key(self, rule_name, counter):
+        return f"{self.COUNTER_PREFIX}:{rule_name}:{counter}"
+
+    def _generic_host_key(self, host):
+        return f"{self.COUNTER_PREFIX}:{GENERIC_RULE}:host:{host}"
+
+    def record(self, rule, rule_hits, hostname=None):
+        """
+        Una página extraída: los campos del rule que no acertaron cuentan
+        como fallback. Las páginas sin regla se cuentan también por dominio.
+        """
+        from analyzer.cache import CacheManager
+
+        rule_name = rule.name if rule else GENERIC_RULE
+        CacheManager.incr_counter(self._counter_key(rule_name, 'pages'))
+        for field in (rule.fields if rule else ()):
+            if field not in rule_hits:
+                CacheManager.incr_counter(self._counter_key(rule_name, f"{field}:fallbacks"))
+        if rule is None and hostname:
+            host = hostname.lower().removeprefix('www.')
+            CacheManager.incr_counter(self._generic_host_key(host))
+            if host not in self._known_generic_hosts:
+                self._register_generic_host(host)
+
+    def _register_generic_host(self, host):
+        """
+        Agrega el dominio al registro compartido de dominios sin regla
+        (SCRAPING_GENERIC_HOSTS_TRACKED como máximo). Lleno, sale el que
+        menos páginas tiene: los dominios frecuentes se quedan.
+        """
+        from django.core.cache import cache
+
+        lock_key = f"{self.GENERIC_HOSTS_KEY}:lock"
+        if not cache.add(lock_key, 1, 5):
+            return  # Otro worker lo está actualizando: se reintenta en la próxima página
+        try:
+            hosts = list(cache.get(self.GENERIC_HOSTS_KEY) or [])
+            if host not in hosts:
+                limit = max(1, app_setting('SCRAPING_GENERIC_HOSTS_TRACKED', 100))
+                if len(hosts) >= limit:
+                    counts = cache.get_many([self._generic_host_key(name) for name in hosts])
+                    ordered = sorted(hosts, key=lambda name: counts.get(self._generic_host_key(name), 0))
+                    evicted = ordered[:len(hosts) - limit + 1]
+                    cache.delete_many([self._generic_host_key(name) for name in evicted])
+                    hosts = [name for name in hosts if name not in evicted]
+                hosts.append(host)
+                cache.set(self.GENERIC_HOSTS_KEY, hosts, None)
+            self._known_generic_hosts = set(hosts)
+        finally:
+            cache.delete(lock_key)
+
+    def get_generic_hosts(self, limit=20):
+        """Dominios sin regla con más páginas: [{'host', 'pages'}], de mayor a menor"""
+        from django.core.cache import cache
+
+        hosts = cache.get(self.GENERIC_HOSTS_KEY) or []
+        counts = cache.get_many([self._generic_host_key(host) for host in hosts])
+        ranked = sorted(
+            ({'host': host, 'pages': counts.get(self._generic_host_key(host), 0)} for host in hosts),
+            key=lambda item: item['pages'], reverse=True
+        )
+        return ranked[:limit]
+
+    def get_stats(self):
+        """Por regla: páginas, y por campo aciertos/fallbacks y hit rate"""
+        from django.core.cache import cache
+
+        keys = {GENERIC_RULE: [self._counter_key(GENERIC_RULE, 'pages')]}
+        for name, rule in self.rules.items():
+            keys[name] = [self._counter_key(name, 'pages')] + [
+                self._counter_key(name, f"{field}:fallbacks") for field in rule.fields
+            ]
+        values = cache.get_many([key for rule_keys in keys.values() for key in rule_keys])
+
+        stats = {}
+        for name in keys:
+            pages = values.get(self._counter_key(name, 'pages'), 0)
+            fields = {}
+            for field in (self.rules[name].fields if name in self.rules else ()):
+                fallbacks = values.get(self._counter_key(name, f"{field}:fallbacks"), 0)
+                fields[field] = {
+                    'hits': pages - fallbacks,
+                    'fallbacks': fallbacks,
+                    'hit_rate': round((pages - fallbacks) / pages, 4) if pages else None,
+                }
+            total = pages * len(fields)
+            hits = sum(field['hits'] for field in fields.values())
+            stats[name] = {
+                'pages': pages,
+                'hit_rate': round(hits / total, 4) if total else None,
+                'fields': fields,
+            }
+        stats[GENERIC_RULE]['hosts'] = self.get_generic_hosts()
+        return stats
+
+
+extraction_rules = ExtractionRuleRegistry.from_settings()
+
+
+def get_extraction_rule_stats():
+    return extraction_rules.get_stats()
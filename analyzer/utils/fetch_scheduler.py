@@ -0,0 +1,350 @@
+# analyzer/utils/fetch_scheduler.py
+
+import contextvars
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.core.cache import cache
+
+from analyzer.conf import app_setting
+
+logger = logging.getLogger(__name__)
+
+ANONYMOUS_OWNER = 'anonymous'
+
+_current_owner = contextvars.ContextVar('fetch_owner', default=ANONYMOUS_OWNER)
+
+
+@contextmanager
+def fetch_owner(owner):
+    """Atribuye las descargas hechas dentro del bloque a un usuario (cola justa)"""
+    token = _current_owner.set(owner or ANONYMOUS_OWNER)
+    try:
+        yield
+    finally:
+        _current_owner.reset(token)
+
+
+def owner_for_user(user_id):
+    return f"user:{user_id}" if user_id else ANONYMOUS_OWNER
+
+
+def current_fetch_owner():
+    return _current_owner.get()
+
+
+class FetchPermit:
+    """Permiso para una descarga; al cerrarse libera su lugar en el límite global"""
+
+    def __init__(self, scheduler, host, slot, token):
+        self.host = host
+        self.slot = slot
+        self.token = token
+        self.waited = 0.0
+        self._scheduler = scheduler
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._scheduler._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class _Ticket:
+    __slots__ = ('owner', 'host', 'permit')
+
+    def __init__(self, owner, host):
+        self.owner = owner
+        self.host = host
+        self.permit = None
+
+
+class FetchScheduler:
+    """
+    Planificador de descargas delante del scraping.
+
+    - Token bucket por host (SCRAPING_HOST_RATE_PER_SECOND, ráfaga
+      SCRAPING_HOST_BURST; SCRAPING_HOST_RATE_LIMITS por dominio). Cada token
+      es un slot de tiempo de 1/rate segundos reservado con cache.add, así
+      que el ritmo es el mismo para todos los workers.
+    - Límite global de descargas simultáneas (SCRAPING_GLOBAL_CONCURRENCY):
+      leases con expiración en el cache; si un worker muere a mitad de una
+      descarga su lugar se libera solo.
+    - Cola justa: las descargas en espera se atienden por turnos entre
+      usuarios, así un lote de 25 URLs no deja esperando al análisis de otro.
+      Un host sin tokens no bloquea a las URLs de otros hosts.
+
+    La cola es por proceso; los límites (tokens y leases) son compartidos.
+    """
+
+    def __init__(self, poll_interval=0.25):
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # owner -> deque de tickets, en orden de turno
+        self._active = 0
+        self._retry_at = 0.0
+        self._dispatching = False
+        self.stats = {'granted': 0, 'delayed': 0, 'timeouts': 0, 'wait_ms': 0.0}
+
+    # --- límites ---
+
+    @staticmethod
+    def host_of(url):
+        return (urlsplit(url).hostname or '').lower().removeprefix('www.')
+
+    @staticmethod
+    def get_host_limits(host):
+        """(tokens por segundo, ráfaga) del host; el override más específico gana"""
+        rate = app_setting('SCRAPING_HOST_RATE_PER_SECOND', 2)
+        burst = app_setting('SCRAPING_HOST_BURST', 4)
+        overrides = app_setting('SCRAPING_HOST_RATE_LIMITS', {}) or {}
+        labels = host.split('.')
+        for start in range(len(labels) - 1):
+            spec = overrides.get('.'.join(labels[start:]))
+            if spec:
+                rate, burst = spec.get('rate', rate), spec.get('burst', burst)
+                break
+        return float(rate or 0), max(1, int(burst or 1))
+
+    @staticmethod
+    def get_global_limit():
+        return max(1, app_setting('SCRAPING_GLOBAL_CONCURRENCY', 16))
+
+    @staticmethod
+    def _lease_seconds():
+        # Lo que puede durar una descarga con sus reintentos
+        timeout = app_setting('SCRAPING_TIMEOUT_SECONDS', 10)
+        return int(timeout * (app_setting('SCRAPING_RETRIES', 2) + 1)) + 10
+
+    def _take_host_token(self, host, now):
+        """
+        Reserva el slot libre más antiguo entre los últimos `burst`: los slots
+        sin usar del pasado son los tokens acumulados del bucket.
+        """
+        rate, burst = self.get_host_limits(host)
+        if rate <= 0:
+            return True  # Sin límite para este host
+        slot_seconds = 1 / rate
+        current = int(now / slot_seconds)
+        ttl = math.ceil(burst * slot_seconds) + 1
+        for slot in range(current - burst + 1, current + 1):
+            if cache.add(f"fetch_bucket:{host}:{slot}", 1, ttl):
+                return True
+        return False
+
+    @classmethod
+    def _next_token_in(cls, host, now):
+        rate, _ = cls.get_host_limits(host)
+        if rate <= 0:
+            return 0
+        slot_seconds = 1 / rate
+        return slot_seconds - (now % slot_seconds)
+
+    def _acquire_global(self, pending=0):
+        """(slot, token) de un lease libre o None si se llegó al límite"""
+        limit = self.get_global_limit()
+        if self._active + pending >= limit:
+            return None  # Este proceso ya ocupa todo el límite: no hace falta ir al cache
+        token = uuid.uuid4().hex
+        lease_seconds = self._lease_seconds()
+        slots = list(range(limit))
+        random.shuffle(slots)
+        for slot in slots:
+            if cache.add(f"fetch_global:{slot}", token, lease_seconds):
+                return slot, token
+        return None
+
+    @staticmethod
+    def _release_global(slot, token):
+        key = f"fetch_global:{slot}"
+        if cache.get(key) == token:
+            cache.delete(key)
+
+    # --- cola ---
+
+    def _plan(self, rounds):
+        """
+        Reserva tokens y leases para los tickets en espera (copia de la cola,
+        owner -> lista), uno por usuario y por vuelta. Corre sin el lock: son
+        consultas al cache. Retorna ([(ticket, lease)], segundos hasta el
+        próximo intento).
+        """
+        now = time.time()
+        throttled = {}  # host -> segundos hasta su próximo token
+        grants = []
+        lease = None
+        saturated = False
+
+        while not saturated:
+            progress = False
+            for owner in list(rounds):
+                tickets = rounds[owner]
+                for ticket in tickets:
+                    if ticket.host in throttled:
+                        continue
+                    if lease is None:
+                        lease = self._acquire_global(pending=len(grants))
+                        if lease is None:
+                            saturated = True
+                            break
+                    if not self._take_host_token(ticket.host, now):
+                        throttled[ticket.host] = self._next_token_in(ticket.host, now)
+                        continue
+                    grants.append((ticket, lease))
+                    lease = None
+                    tickets.remove(ticket)
+                    if tickets:
+                        rounds.move_to_end(owner)
+                    else:
+                        del rounds[owner]
+                    progress = True
+                    break
+                if saturated:
+                    break
+            if not progress:
+                break
+
+        if lease is not None:
+            self._release_global(*lease)
+
+        # Próximo intento: cuando un host tenga token o, si el límite global
+        # lo ocupa otro worker, tras poll_interval (un release local despierta antes)
+        wait = self.poll_interval
+        if throttled and not saturated:
+            wait = min(wait, min(throttled.values()))
+        return grants, wait
+
+    def _dispatch(self):
+        """
+        Reparte permisos a los tickets en espera. Se llama con el lock
+        tomado y lo suelta mientras reserva en el cache, así los demás hilos
+        no esperan detrás de esas consultas; un solo hilo reparte a la vez.
+        """
+        self._dispatching = True
+        rounds = OrderedDict((owner, list(queue)) for owner, queue in self._queues.items())
+        self._cond.release()
+        try:
+            grants, wait = self._plan(rounds)
+        finally:
+            self._cond.acquire()
+            self._dispatching = False
+
+        unused = []
+        for ticket, lease in grants:
+            queue = self._queues.get(ticket.owner)
+            if queue is None or ticket not in queue:
+                unused.append(lease)  # Dejó de esperar mientras se reservaba
+                continue
+            ticket.permit = FetchPermit(self, ticket.host, *lease)
+            self._active += 1
+            queue.remove(ticket)
+            if queue:
+                self._queues.move_to_end(ticket.owner)
+            else:
+                del self._queues[ticket.owner]
+
+        self._retry_at = time.monotonic() + max(wait, 0.005)
+        # Siempre: quien esperaba a que terminara este reparto puede intentar el suyo
+        self._cond.notify_all()
+
+        if unused:
+            self._cond.release()
+            try:
+                for lease in unused:
+                    self._release_global(*lease)
+            finally:
+                self._cond.acquire()
+
+    def acquire(self, url, timeout=None):
+        """
+        Espera turno para descargar url. Retorna un FetchPermit (usar con
+        `with`) o None si no hubo lugar antes de SCRAPING_SCHEDULER_MAX_WAIT_SECONDS
+        (o del timeout del llamador, si es menor).
+        """
+        max_wait = app_setting('SCRAPING_SCHEDULER_MAX_WAIT_SECONDS', 10)
+        if timeout:
+            max_wait = min(max_wait, timeout)
+        started = time.monotonic()
+        deadline = started + max_wait
+        ticket = _Ticket(current_fetch_owner(), self.host_of(url))
+
+        with self._cond:
+            self._queues.setdefault(ticket.owner, deque()).append(ticket)
+            self._retry_at = 0.0  # Ticket nuevo: puede que haya tokens libres
+            try:
+                while ticket.permit is None:
+                    now = time.monotonic()
+                    if now >= self._retry_at and not self._dispatching:
+                        self._dispatch()
+                        if ticket.permit is not None:
+                            break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats['timeouts'] += 1
+                        logger.warning(f"⏳ Sin turno de descarga para {ticket.host} tras {max_wait}s")
+                        return None
+                    if self._dispatching:
+                        # Otro hilo está repartiendo: avisa al terminar
+                        pause = self.poll_interval
+                    else:
+                        pause = max(self._retry_at - time.monotonic(), 0.005)
+                    self._cond.wait(min(remaining, pause))
+            finally:
+                if ticket.permit is None:
+                    queue = self._queues.get(ticket.owner)
+                    if queue is not None and ticket in queue:
+                        queue.remove(ticket)
+                        if not queue:
+                            del self._queues[ticket.owner]
+
+            waited = time.monotonic() - started
+            ticket.permit.waited = waited
+            self.stats['granted'] += 1
+            self.stats['wait_ms'] += waited * 1000
+            if waited >= 0.05:
+                self.stats['delayed'] += 1
+        return ticket.permit
+
+    def _release(self, permit):
+        self._release_global(permit.slot, permit.token)
+        with self._cond:
+            self._active -= 1
+            self._retry_at = 0.0
+            self._cond.notify_all()
+
+    @staticmethod
+    def saturated_result():
+        return {
+            'success': False,
+            'error': 'Demasiadas descargas en curso para este sitio, intenta de nuevo en unos segundos',
+            'error_type': 'scheduler_timeout',
+            'status_code': None,
+        }
+
+    def get_stats(self):
+        with self._cond:
+            granted = self.stats['granted']
+            return {
+                'granted': granted,
+                'delayed': self.stats['delayed'],
+                'timeouts': self.stats['timeouts'],
+                'avg_wait_ms': round(self.stats['wait_ms'] / granted, 1) if granted else 0,
+                'active': self._active,
+                'queued': {owner: len(queue) for owner, queue in self._queues.items()},
+            }
+
+
+fetch_scheduler = FetchScheduler()
@@ -0,0 +1,148 @@
+# analyzer/utils/http_client.py
+
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+from analyzer.conf import app_setting
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'text/html,application/xhtml+xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'es-ES,es;q=0.9,en;q=0.8',
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+_request_deadline = threading.local()
+
+
+class DeadlineRetry(Retry):
+    """
+    Retry que respeta el presupuesto de la petición en curso: no reintenta
+    si la espera (backoff o Retry-After) más la conexión ya no caben antes
+    del deadline. Así un 429 con Retry-After largo devuelve la respuesta
+    en vez de dormir el hilo del worker.
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        new_retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        deadline = getattr(_request_deadline, 'value', None)
+        if deadline is not None:
+            wait = new_retry.get_backoff_time()
+            if response is not None and self.respect_retry_after_header:
+                wait = max(wait, new_retry.get_retry_after(response) or 0)
+            # Margen para el nuevo intento: el timeout de conexión, como mucho un segundo
+            margin = min(1.0, getattr(_request_deadline, 'connect_seconds', 0))
+            if time.monotonic() + wait + margin >= deadline:
+                reason = error or ResponseError(f"sin presupuesto para reintentar ({wait:.1f}s de espera)")
+                raise MaxRetryError(_pool, url, reason) from reason
+        return new_retry
+
+
+def _build_retry():
+    """
+    Reintentos solo para GET/HEAD (idempotentes) con backoff exponencial y
+    jitter. Los timeouts de lectura no se reintentan: una página lenta ya
+    gastó su presupuesto.
+    """
+    options = dict(
+        total=app_setting('SCRAPING_RETRIES', 2),
+        connect=app_setting('SCRAPING_RETRIES', 2),
+        read=0,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        backoff_factor=app_setting('SCRAPING_BACKOFF_SECONDS', 0.3),
+        backoff_max=app_setting('SCRAPING_BACKOFF_MAX_SECONDS', 2),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    try:
+        return DeadlineRetry(backoff_jitter=app_setting('SCRAPING_BACKOFF_SECONDS', 0.3), **options)
+    except TypeError:
+        # urllib3 < 2 no soporta backoff_jitter
+        return DeadlineRetry(**options)
+
+
+class ScrapingHttpClient:
+    """
+    Capa HTTP compartida para el scraping.
+
+    Un único HTTPAdapter (pool de conexiones por host, con tamaño acotado)
+    se monta en una Session por hilo: el pool de urllib3 es thread-safe y
+    cada hilo tiene sus propias cookies. Así los hosts repetidos (Amazon,
+    AliExpress...) reutilizan conexiones keep-alive en vez de pagar DNS,
+    TCP y TLS en cada scraping.
+    """
+
+    def __init__(self, pool_hosts=None, pool_size=None):
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_hosts or app_setting('SCRAPING_POOL_HOSTS', 20),
+            pool_maxsize=pool_size or app_setting('SCRAPING_POOL_SIZE_PER_HOST', 4),
+            max_retries=_build_retry(),
+        )
+        self._local = threading.local()
+
+    def get_session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(DEFAULT_HEADERS)
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            self._local.session = session
+        return session
+
+    @staticmethod
+    def get_timeout(timeout=None):
+        """(connect, read) a partir de SCRAPING_TIMEOUT_SECONDS"""
+        total = timeout or app_setting('SCRAPING_TIMEOUT_SECONDS', 10)
+        return (min(5, total), total)
+
+    def get(self, url, timeout=None, **kwargs):
+        """GET con reintentos acotados: esperas y reintentos no pasan del timeout total"""
+        connect_timeout, read_timeout = self.get_timeout(timeout)
+        _request_deadline.value = time.monotonic() + read_timeout
+        _request_deadline.connect_seconds = connect_timeout
+        try:
+            return self.get_session().get(url, timeout=(connect_timeout, read_timeout), **kwargs)
+        finally:
+            _request_deadline.value = None
+
+    def get_pool_stats(self):
+        """Conexiones nuevas vs. requests por host: reused = requests que no abrieron conexión"""
+        hosts = {}
+        pools = self.adapter.poolmanager.pools
+        with pools.lock:
+            items = list(pools._container.items())
+        for key, pool in items:
+            requests_count = pool.num_requests
+            hosts[f"{key.key_scheme}://{key.key_host}:{key.key_port}"] = {
+                'requests': requests_count,
+                'new_connections': pool.num_connections,
+                'reused': max(0, requests_count - pool.num_connections),
+                'idle_connections': pool.pool.qsize() if pool.pool else 0,
+            }
+        total_requests = sum(host['requests'] for host in hosts.values())
+        total_reused = sum(host['reused'] for host in hosts.values())
+        return {
+            'hosts': hosts,
+            'requests': total_requests,
+            'reused': total_reused,
+            'reuse_ratio': round(total_reused / total_requests, 4) if total_requests else 0,
+        }
+
+
+http_client = ScrapingHttpClient()
+
+
+def get_scraping_pool_stats():
+    return http_client.get_pool_stats()
@@ -0,0 +1,153 @@
+# analyzer/utils/near_cache.py
+
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from analyzer.conf import app_setting
+from .cache_tags import generation_key, get_generations, tagged_key
+
+
+class NearCache:
+    """
+    Cache en memoria del proceso (LRU acotado) delante del cache compartido.
+
+    Cada entrada local guarda la versión de la clave y la generación de sus
+    tags que había en el cache compartido al leerla. Mientras la entrada
+    tiene menos de NEAR_CACHE_MAX_STALENESS_SECONDS se sirve sin tocar la
+    red; después se comparan versión y generaciones (claves pequeñas, una
+    sola consulta) y, si no cambiaron, se renueva sin volver a traer el
+    valor. Escribir la clave o invalidar uno de sus tags las cambia, así que
+    ningún worker sirve un dato viejo más allá del límite configurado. Con
+    el límite en 0 el tier local no se usa.
+
+    Los valores se guardan serializados: quien los lee recibe una copia
+    propia, igual que con el cache compartido.
+    """
+
+    VERSION_PREFIX = 'nearcache:version'
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (valor serializado, (versión, generaciones), válido hasta)
+        self._lock = threading.Lock()
+        self.stats = {
+            'local_hits': 0, 'revalidated': 0, 'shared_hits': 0,
+            'misses': 0, 'evictions': 0,
+        }
+
+    @staticmethod
+    def get_max_staleness():
+        return app_setting('NEAR_CACHE_MAX_STALENESS_SECONDS', 5)
+
+    def _version_key(self, key):
+        return f"{self.VERSION_PREFIX}:{key}"
+
+    def _read_stamp(self, key, tags):
+        """
+        (versión de la clave, generaciones de sus tags) en una sola consulta.
+        La versión es un token nuevo en cada escritura: si la clave expira o
+        el backend la desaloja, una versión vieja nunca vuelve a coincidir.
+        """
+        version_key = self._version_key(key)
+        values = cache.get_many([version_key, *(generation_key(tag) for tag in tags)])
+        generations = get_generations(tags, known=values)
+        return (values.get(version_key), tuple(sorted(generations.items()))), generations
+
+    def get(self, key, tags=()):
+        max_staleness = self.get_max_staleness()
+        if max_staleness <= 0:
+            return cache.get(tagged_key(key, get_generations(tags)))
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(key)
+                self.stats['local_hits'] += 1
+                return pickle.loads(entry[0])
+
+        # La versión se lee antes que el valor: si alguien escribe en medio,
+        # la entrada queda con una versión vieja y se vuelve a leer después
+        stamp, generations = self._read_stamp(key, tags)
+        if entry is not None and stamp[0] is not None and entry[1] == stamp:
+            self._put(key, entry[0], stamp, now + max_staleness)
+            with self._lock:
+                self.stats['revalidated'] += 1
+            return pickle.loads(entry[0])
+
+        value = cache.get(tagged_key(key, generations))
+        if value is None:
+            with self._lock:
+                self._entries.pop(key, None)
+                self.stats['misses'] += 1
+            return None
+
+        self._put(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), stamp, now + max_staleness)
+        with self._lock:
+            self.stats['shared_hits'] += 1
+        return value
+
+    def set(self, key, value, timeout, tags=()):
+        generations = get_generations(tags)
+        cache.set(tagged_key(key, generations), value, timeout)
+        # La versión vive lo mismo que el dato: al expirar éste, la entrada local tampoco se renueva
+        version = uuid.uuid4().hex
+        cache.set(self._version_key(key), version, timeout)
+        if self.get_max_staleness() > 0:
+            stamp = (version, tuple(sorted(generations.items())))
+            self._put(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), stamp,
+                      time.monotonic() + self.get_max_staleness())
+
+    def delete(self, key, tags=()):
+        cache.delete_many([tagged_key(key, get_generations(tags)), self._version_key(key)])
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def forget_tag(self, tag):
+        """
+        Al invalidar un tag, este proceso deja de servir sus entradas al
+        instante (los demás lo notan al revalidar, dentro del límite).
+        """
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if any(name == tag for name, _ in entry[1][1])]
+            for key in stale:
+                del self._entries[key]
+
+    def _put(self, key, payload, version, expires_at):
+        with self._lock:
+            self._entries[key] = (payload, version, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            size = len(self._entries)
+        local = stats['local_hits'] + stats['revalidated']
+        lookups = local + stats['shared_hits'] + stats['misses']
+        shared_lookups = stats['shared_hits'] + stats['misses']
+        return {
+            **stats,
+            'size': size,
+            'max_entries': self.max_entries,
+            'max_staleness_seconds': self.get_max_staleness(),
+            'local_hit_ratio': round(local / lookups, 4) if lookups else 0,
+            'shared_hit_ratio': round(stats['shared_hits'] / shared_lookups, 4) if shared_lookups else 0,
+            'hit_ratio': round((local + stats['shared_hits']) / lookups, 4) if lookups else 0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+near_cache = NearCache(
+    max_entries=app_setting('NEAR_CACHE_ENTRIES', 1000),
+)
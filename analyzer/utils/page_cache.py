@@ -0,0 +1,92 @@
+# analyzer/utils/page_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+from analyzer.conf import app_setting
+from .url_normalization import normalize_product_url
+
+
+class ProductPageCache:
+    """
+    Cache LRU (acotado por número de entradas) de páginas de producto ya
+    procesadas: guarda los validadores HTTP (ETag / Last-Modified) junto a
+    los campos extraídos.
+
+    Cuando el cache fresco expira, el scraping revalida con If-None-Match /
+    If-Modified-Since; un 304 reutiliza los campos sin descargar ni parsear.
+    """
+
+    def __init__(self, max_entries=500):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # url normalizada -> entrada
+        self._lock = threading.Lock()
+        self.stats = {
+            'lookups': 0, 'revalidated': 0, 'full_downloads': 0,
+            'evictions': 0, 'stores': 0,
+        }
+
+    def get(self, url):
+        """Entrada {'etag', 'last_modified', 'data', 'validated_at'} o None"""
+        key = normalize_product_url(url)
+        with self._lock:
+            self.stats['lookups'] += 1
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def store(self, url, data, etag=None, last_modified=None):
+        """Guarda una descarga completa (solo si trae algún validador)"""
+        with self._lock:
+            self.stats['full_downloads'] += 1
+        if not etag and not last_modified:
+            return
+        self._put(url, {
+            'etag': etag,
+            'last_modified': last_modified,
+            'data': data,
+            'validated_at': time.time(),
+        })
+        with self._lock:
+            self.stats['stores'] += 1
+
+    def mark_revalidated(self, url, entry, etag=None, last_modified=None):
+        """Un 304 confirma la entrada: se renueva sin volver a parsear"""
+        self._put(url, {
+            **entry,
+            'etag': etag or entry.get('etag'),
+            'last_modified': last_modified or entry.get('last_modified'),
+            'validated_at': time.time(),
+        })
+        with self._lock:
+            self.stats['revalidated'] += 1
+
+    def _put(self, url, entry):
+        key = normalize_product_url(url)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            fetches = self.stats['revalidated'] + self.stats['full_downloads']
+            return {
+                **self.stats,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'revalidation_ratio': round(self.stats['revalidated'] / fetches, 4) if fetches else 0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+product_page_cache = ProductPageCache(
+    max_entries=app_setting('PRODUCT_PAGE_CACHE_ENTRIES', 500),
+)
@@ -1,49 +1,143 @@
 # analyzer/utils/scraping.py
 
+import codecs
+import socket
+import time
+from urllib.parse import urlsplit
+
 import requests
-from bs4 import BeautifulSoup
-import re
+from urllib3.exceptions import ReadTimeoutError
+
+from analyzer.conf import app_setting
+from .extraction import ProductMetaParser
+from .extraction_rules import extraction_rules
+from .http_client import http_client
+from .page_cache import product_page_cache
+
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def _exception_chain(exc):
+    """La excepción y sus causas (requests envuelve las de urllib3 en args/reason)"""
+    seen, pending = [], [exc]
+    while pending:
+        current = pending.pop()
+        if not isinstance(current, BaseException) or any(current is item for item in seen):
+            continue
+        seen.append(current)
+        pending.extend([current.__cause__, current.__context__, getattr(current, 'reason', None), *current.args])
+    return seen
+
+
+def classify_scrape_error(exc):
+    """timeout, dns, connection, rate_limited, http_4xx, http_5xx u other"""
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        status = exc.response.status_code
+        if status == 429:
+            return 'rate_limited'
+        return 'http_5xx' if status >= 500 else 'http_4xx'
+    chain = _exception_chain(exc)
+    if any(isinstance(item, (requests.exceptions.Timeout, ReadTimeoutError, socket.timeout)) for item in chain):
+        return 'timeout'
+    if any(isinstance(item, socket.gaierror) or type(item).__name__ == 'NameResolutionError' for item in chain):
+        return 'dns'
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        return 'connection'
+    return 'other'
+
+
+def _response_charset(response):
+    """Charset declarado en Content-Type (utf-8 si no hay o no es válido)"""
+    content_type = response.headers.get('Content-Type', '')
+    charset = 'utf-8'
+    if 'charset=' in content_type:
+        charset = content_type.split('charset=')[-1].split(';')[0].strip().strip('"\'') or charset
+    try:
+        codecs.lookup(charset)
+    except LookupError:
+        charset = 'utf-8'
+    return charset
+
+
+def _parse_streaming(response, max_bytes, rule=None, deadline=None):
+    """
+    Lee el cuerpo por fragmentos y se detiene al encontrar todos los campos,
+    al llegar a max_bytes o al pasar el deadline (time.monotonic()): con
+    stream=True el timeout de requests es por lectura, así que una página
+    que manda bytes de a poco no lo dispararía nunca.
+    Retorna (parser, bytes_leidos, deadline_agotado).
+    """
+    parser = ProductMetaParser(rule=rule)
+    decoder = codecs.getincrementaldecoder(_response_charset(response))(errors='replace')
+    bytes_read = 0
+    timed_out = False
+    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+        bytes_read += len(chunk)
+        parser.feed(decoder.decode(chunk))
+        if parser.complete or bytes_read >= max_bytes:
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            timed_out = True
+            break
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    return parser, bytes_read, timed_out
 
-def scrape_product_info(url):
+
+def scrape_product_info(url, timeout=None):
     """Extrae informacion basica del producto"""
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        product_data = {
-            'title': '',
-            'description': '',
-            'price': ''
-        }
-        
-        # Buscar titulo
-        title = soup.find('h1')
-        if title:
-            product_data['title'] = title.text.strip()
-        else:
-            meta_title = soup.find('meta', {'property': 'og:title'})
-            if meta_title:
-                product_data['title'] = meta_title.get('content', '')
-        
-        # Buscar precio
-        price_pattern = r'\$[\d,]+\.?\d*'
-        price_text = soup.find(text=re.compile(price_pattern))
-        if price_text:
-            match = re.search(price_pattern, price_text)
-            if match:
-                product_data['price'] = match.group()
-        
-        # Buscar descripcion
-        meta_desc = soup.find('meta', {'name': 'description'})
-        if meta_desc:
-            product_data['description'] = meta_desc.get('content', '')
-        
+        # Revalidación condicional: si la página no cambió el servidor responde 304 sin cuerpo
+        cached_page = product_page_cache.get(url)
+        headers = {}
+        if cached_page:
+            if cached_page.get('etag'):
+                headers['If-None-Match'] = cached_page['etag']
+            if cached_page.get('last_modified'):
+                headers['If-Modified-Since'] = cached_page['last_modified']
+
+        streaming = app_setting('SCRAPING_STREAMING', True)
+        # Presupuesto total de la página, lectura del cuerpo incluida
+        deadline = time.monotonic() + http_client.get_timeout(timeout)[1]
+        timed_out = False
+
+        # Sesión compartida: keep-alive por host, reintentos y timeout de settings
+        response = http_client.get(url, timeout=timeout, headers=headers, stream=streaming)
+        try:
+            if response.status_code == 304 and cached_page:
+                product_page_cache.mark_revalidated(
+                    url, cached_page,
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified')
+                )
+                return {
+                    'success': True,
+                    'data': dict(cached_page['data']),
+                    'revalidated': True
+                }
+            response.raise_for_status()
+
+            # Reglas del dominio (si hay) antes que las heurísticas genéricas
+            rule = extraction_rules.for_url(url)
+            if streaming:
+                # Solo lo necesario: corta al tener los campos o al llegar al tope de bytes
+                parser, bytes_read, timed_out = _parse_streaming(
+                    response, app_setting('SCRAPING_MAX_BYTES', 512 * 1024), rule, deadline
+                )
+            else:
+                parser = ProductMetaParser(rule=rule)
+                parser.feed(response.text)
+                parser.close()
+                bytes_read = len(response.content)
+        finally:
+            # Si el cuerpo no se leyó completo la conexión se descarta en vez de volver al pool
+            response.close()
+
+        product_data = parser.get_product_data()
+        if timed_out and not product_data['title']:
+            raise requests.exceptions.ReadTimeout(f"Lectura de {url} excedió el tiempo total ({bytes_read} bytes)")
+        extraction_rules.record(rule, parser.rule_hits, urlsplit(url).hostname)
+
         # Valores por defecto
         if not product_data['title']:
             product_data['title'] = 'Titulo no encontrado'
@@ -51,14 +145,28 @@ def scrape_product_info(url):
             product_data['description'] = 'Descripcion no disponible'
         if not product_data['price']:
             product_data['price'] = 'Precio no disponible'
-        
+
+        if not timed_out:
+            # Una lectura cortada por tiempo no sirve de base para revalidar con 304
+            product_page_cache.store(
+                url, product_data,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified')
+            )
+
         return {
             'success': True,
-            'data': product_data
+            'data': product_data,
+            'bytes_read': bytes_read,
+            'truncated_by_deadline': timed_out,
+            'extraction_rule': rule.name if rule else None
         }
-        
+
     except Exception as e:
+        response = getattr(e, 'response', None)
         return {
             'success': False,
-            'error': str(e)
+            'error': str(e),
+            'error_type': classify_scrape_error(e),
+            'status_code': response.status_code if response is not None else None
         }
@@ -0,0 +1,83 @@
+# analyzer/utils/timing.py
+
+import math
+import time
+from contextlib import contextmanager
+
+
+def percentile(sorted_values, fraction):
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class StageTimer:
+    """
+    Tiempo de pared por etapa de un análisis, en milisegundos.
+
+    Se crea al inicio del request y viaja por el pipeline (también a la cola
+    de jobs); cada etapa se mide con `with timer.stage('scrape'):`.
+    """
+
+    STAGES = (
+        'limit_check', 'dedupe', 'coalesced_wait', 'scrape', 'summary',
+        'prompt', 'provider', 'db_write', 'serialization',
+    )
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.stages_ms = {}
+        self.provider = None
+        self.model = None
+        self.cached = False
+        self.details = {}  # Datos extra del análisis (modo de generación, etc.)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - started)
+
+    def record(self, name, seconds):
+        """Suma segundos a una etapa (una etapa puede medirse en varios tramos)"""
+        self.stages_ms[name] = self.stages_ms.get(name, 0) + seconds * 1000
+
+    def measure_stream(self, name, iterable):
+        """
+        Recorre un generador midiendo solo el tiempo que tarda en producir
+        cada elemento: lo que tarda el consumidor (p. ej. el cliente SSE
+        leyendo) no se suma a la etapa.
+        """
+        iterator = iter(iterable)
+        while True:
+            started = time.monotonic()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.record(name, time.monotonic() - started)
+            yield item
+
+    def set_provider(self, provider=None, model=None, cached=False):
+        self.provider = provider or self.provider
+        self.model = model or self.model
+        self.cached = cached
+
+    def elapsed(self):
+        """Segundos desde el inicio del request"""
+        return time.monotonic() - self.started
+
+    def as_data(self):
+        """Desglose listo para AnalysisHistory.additional_data"""
+        return {
+            'timings_ms': {name: round(ms, 1) for name, ms in self.stages_ms.items()},
+            'total_ms': round(self.elapsed() * 1000, 1),
+            'provider': self.provider,
+            'cached': self.cached,
+            **self.details,
+        }
@@ -0,0 +1,60 @@
+# analyzer/utils/url_normalization.py
+
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Parámetros que no cambian el producto (tracking, afiliados, sesiones)
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid',
+    'ref', 'ref_', 'tag', 'linkcode', 'linkid', 'camp', 'creative', 'creativeasin',
+    'psc', 'th', 'smid', 'spm', 'scm', 'algo_pvid', 'algo_exp_id', 'aff_fcid',
+    'aff_fsk', 'aff_platform', 'aff_trace_key', 'sk', 'terminal_id', '_encoding',
+}
+TRACKING_PREFIXES = ('utm_', 'pd_rd_', 'pf_rd_', 'aff_', 'sc_')
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def normalize_product_url(url):
+    """
+    Forma canónica de una URL de producto para usar como clave de cache:
+    esquema y host en minúsculas, sin puerto por defecto, sin fragmento,
+    sin parámetros de tracking y con la query ordenada.
+    """
+    if not url:
+        return ''
+
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+
+    scheme = (parts.scheme or 'https').lower()
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+
+    netloc = host
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and DEFAULT_PORTS.get(scheme) != port:
+        netloc = f"{host}:{port}"
+
+    path = parts.path or '/'
+    if len(path) > 1 and path.endswith('/'):
+        path = path.rstrip('/')
+
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking_param(key)
+    )
+
+    return urlunsplit((scheme, netloc, path, urlencode(query), ''))
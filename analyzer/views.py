@@ -1,14 +1,135 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from .models import AnalysisHistory
 from django.core.cache import cache
-from .utils.ai_integration import detect_and_generate
+from django.urls import reverse
+from .jobs import AnalysisJobQueue
+from .cache import CacheManager
+from .conf import app_setting
+from .pipeline import (
+    DEDUPE_SECONDS, build_analysis_params, finalize_timings, get_analysis_flight,
+    get_cached_result, load_user, parse_batch_urls, prepare_prompt, release_dedupe,
+    run_analysis_pipeline, save_analysis, scrape_for_analysis, store_result,
+)
+from .response_cache import cached_response
+from .utils.ai_integration import AIProviderError, stream_and_generate
+from .utils.fetch_scheduler import fetch_owner
 from .utils.pdf_generator import generate_strategy_pdf
+from .utils.timing import StageTimer
 from uuid import UUID
 import json
 import logging
+import time
+
+# Segundos que un doble envío espera antes de reintentar (la original suele terminar antes)
+DUPLICATE_RETRY_AFTER_SECONDS = 3
+
+
+def _get_client_ip(request):
+    xff = request.META.get('HTTP_X_FORWARDED_FOR')
+    return xff.split(',')[0].strip() if xff else request.META.get('REMOTE_ADDR', '127.0.0.1')
+
+
+def _get_request_identity(request):
+    """Identidad estable del solicitante: usuario autenticado o IP"""
+    return f"user:{request.user.id}" if request.user.is_authenticated else f"ip:{_get_client_ip(request)}"
+
+
+def _check_user_limits(request):
+    """
+    Lógica de límites: anónimo -> limitado por IP (middleware); autenticado -> por plan mensual.
+    Retorna un JsonResponse si no puede analizar, o None.
+    """
+    logger = logging.getLogger(__name__)
+
+    if not request.user.is_authenticated:
+        return None
+
+    try:
+        # Crear perfil si no existe
+        from .models import UserProfile
+        profile, created = UserProfile.objects.get_or_create(
+            user=request.user,
+            defaults={
+                'plan': 'free',
+                'analyses_limit_monthly': 5,
+                'analyses_this_month': 0
+            }
+        )
+        
+        # Solo verificar, NO incrementar aún
+        if not profile.can_analyze_atomic():
+            logger.warning(f"🚫 Límite mensual alcanzado para {request.user.username}")
+            return JsonResponse({
+                'success': False,
+                'limit_reached': True,
+                'error': f'Has alcanzado tu límite mensual ({profile.analyses_limit_monthly}). ¡Upgrade para continuar!',
+                'upgrade_url': '/upgrade/',
+                'current_count': profile.analyses_this_month,
+                'limit': profile.analyses_limit_monthly,
+                'plan': profile.plan
+            }, status=429)
+            
+    except Exception as e:
+        logger.error(f"❌ Error verificando límites: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': 'Error interno verificando límites'
+        }, status=500)
+
+    return None
+
+
+def _acquire_dedupe(identity, params):
+    """
+    Idempotencia breve para evitar doble envío accidental (20s).
+    Retorna (dedupe_key, valor_existente_o_None); el valor existente indica
+    que hay una petición idéntica del mismo solicitante en curso o terminada.
+    """
+    dedupe_key = None
+    try:
+        import hashlib
+        base_string = f"{params['product_url']}|{params['platform']}|{params['target_audience']}|{params['campaign_goal']}|{params['tone']}"
+        token = hashlib.md5(base_string.encode()).hexdigest()
+        dedupe_key = f"analyze_dedupe:{identity}:{token}"
+        # Pre-marcar de forma atómica para evitar duplicación en ráfaga
+        if not cache.add(dedupe_key, True, DEDUPE_SECONDS):
+            return dedupe_key, cache.get(dedupe_key) or True
+    except Exception:
+        # Si falla, continuar sin idempotencia
+        pass
+    return dedupe_key, None
+
+
+def _duplicate_response(dedupe_key, existing):
+    """
+    Responde a un doble envío sin ocupar el worker: el mismo job si está
+    encolado, el resultado si ya terminó, o un 409 con Retry-After si la
+    petición original sigue en curso.
+    """
+    if isinstance(existing, dict) and existing.get('job_id'):
+        return JsonResponse({
+            'success': True,
+            'job_id': existing['job_id'],
+            'status': 'queued',
+            'status_url': reverse('analyzer:analysis_status', args=[existing['job_id']]),
+            'deduplicated': True,
+        }, status=202)
+    if isinstance(existing, dict) and existing.get('result'):
+        return JsonResponse({**existing['result'], 'deduplicated': True})
+
+    retry_after = DUPLICATE_RETRY_AFTER_SECONDS
+    response = JsonResponse({
+        'success': False,
+        'in_progress': True,
+        'retry_after': retry_after,
+        'error': 'Ya hay un análisis idéntico en curso. Espera unos segundos e intenta de nuevo.'
+    }, status=409)
+    response['Retry-After'] = str(retry_after)
+    return response
+
 
 @require_http_methods(["GET", "POST"])
 def home(request):
@@ -36,153 +157,262 @@ def home(request):
         return render(request, 'analyzer/index.html')
 
     # POST: procesar análisis
-    analysis_type = request.POST.get('analysis_type', 'basic')
-    product_url = request.POST.get('product_url') or request.POST.get('main_product_url')
-    platform = (request.POST.get('platform') or 'tiktok').lower()
-    target_audience = request.POST.get('target_audience', '')
-    campaign_goal = request.POST.get('campaign_goal', 'conversions')
-    tone = request.POST.get('tone', 'professional')
-    api_key = request.POST.get('api_key', '').strip()
+    timer = StageTimer()
+    params = build_analysis_params(request.POST)
+    product_url = params['product_url']
 
-    logger.info(f"🔄 Análisis solicitado: {analysis_type} - {product_url} - Usuario: {request.user.username if request.user.is_authenticated else 'Anónimo'}")
+    logger.info(f"🔄 Análisis solicitado: {params['analysis_type']} - {product_url} - Usuario: {request.user.username if request.user.is_authenticated else 'Anónimo'}")
 
-    if not product_url or not api_key:
+    if not product_url or not params['api_key']:
         return JsonResponse({
             'success': False, 
             'error': 'Faltan datos: URL del producto y API key son obligatorias.'
         }, status=400)
 
-    # Lógica de límites: anónimo -> limitado por IP (middleware); autenticado -> por plan mensual
-    if request.user.is_authenticated:
-        try:
-            # Crear perfil si no existe
-            from .models import UserProfile
-            profile, created = UserProfile.objects.get_or_create(
-                user=request.user,
-                defaults={
-                    'plan': 'free',
-                    'analyses_limit_monthly': 5,
-                    'analyses_this_month': 0
-                }
-            )
-            
-            # Solo verificar, NO incrementar aún
-            if not profile.can_analyze_atomic():
-                logger.warning(f"🚫 Límite mensual alcanzado para {request.user.username}")
-                return JsonResponse({
-                    'success': False,
-                    'limit_reached': True,
-                    'error': f'Has alcanzado tu límite mensual ({profile.analyses_limit_monthly}). ¡Upgrade para continuar!',
-                    'upgrade_url': '/upgrade/',
-                    'current_count': profile.analyses_this_month,
-                    'limit': profile.analyses_limit_monthly,
-                    'plan': profile.plan
-                }, status=429)
-                
-        except Exception as e:
-            logger.error(f"❌ Error verificando límites: {str(e)}")
-            return JsonResponse({
-                'success': False,
-                'error': 'Error interno verificando límites'
-            }, status=500)
+    with timer.stage('limit_check'):
+        limit_response = _check_user_limits(request)
+    if limit_response is not None:
+        return limit_response
 
-    # Idempotencia breve para evitar doble envío accidental (20s)
-    try:
-        import hashlib
-        def _get_client_ip(req):
-            xff = req.META.get('HTTP_X_FORWARDED_FOR')
-            return xff.split(',')[0].strip() if xff else req.META.get('REMOTE_ADDR', '127.0.0.1')
-        identity = f"user:{request.user.id}" if request.user.is_authenticated else f"ip:{_get_client_ip(request)}"
-        base_string = f"{product_url}|{platform}|{target_audience}|{campaign_goal}|{tone}"
-        token = hashlib.md5(base_string.encode()).hexdigest()
-        dedupe_key = f"analyze_dedupe:{identity}:{token}"
-        if cache.get(dedupe_key):
-            return JsonResponse({
-                'success': False,
-                'error': 'Petición duplicada detectada. Espera unos segundos e intenta de nuevo.'
-            }, status=409)
-        # Pre-marcar para evitar duplicación en ráfaga
-        cache.set(dedupe_key, True, 20)
-    except Exception:
-        # Si falla, continuar sin idempotencia
-        pass
+    identity = _get_request_identity(request)
+    with timer.stage('dedupe'):
+        dedupe_key, existing = _acquire_dedupe(identity, params)
+    if existing is not None:
+        return _duplicate_response(dedupe_key, existing)
 
-    # Construir prompt simple (puedes mejorar con más contexto)
-    prompt_parts = [
-        f"Genera una estrategia de marketing para el producto en {product_url}.",
-        f"Plataforma: {platform}.",
-        f"Audiencia objetivo: {target_audience or 'general'}.",
-        f"Objetivo: {campaign_goal}.",
-        f"Tono: {tone}.",
-    ]
-    if analysis_type == 'competitive':
-        prompt_parts.insert(0, 'Análisis competitivo: compara con competidores similares y destaca ventajas.')
-    prompt = '\n'.join(prompt_parts)
-
-    ai_result = detect_and_generate(prompt, api_key)
-    if not ai_result.get('success'):
-        logger.error(f"❌ Error IA: {ai_result.get('error')}")
+    user_id = request.user.id if request.user.is_authenticated else None
+
+    # Modo job: encolar y responder de inmediato; el cliente consulta el estado
+    if request.POST.get('mode') == 'job':
+        job_id = AnalysisJobQueue.enqueue(params, user_id=user_id, owner=identity,
+                                          dedupe_key=dedupe_key, timer=timer)
+        if dedupe_key:
+            cache.set(dedupe_key, {'job_id': job_id}, DEDUPE_SECONDS)
         return JsonResponse({
-            'success': False, 
-            'error': ai_result.get('error', 'Error generando estrategia')
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': reverse('analyzer:analysis_status', args=[job_id]),
+        }, status=202)
+
+    result = run_analysis_pipeline(params, user_id=user_id, dedupe_key=dedupe_key, timer=timer,
+                                   owner=identity)
+    status = result.pop('status', 200)
+    with timer.stage('serialization'):
+        response = JsonResponse(result, status=status)
+    finalize_timings(result, timer)
+    return response
+
+
+@require_http_methods(["GET"])
+def analysis_status(request, job_id):
+    """Estado de un análisis encolado (para polling desde index.html)"""
+    job = AnalysisJobQueue.get_job(job_id)
+    if not job or job.get('owner') != _get_request_identity(request):
+        return JsonResponse({
+            'success': False,
+            'error': 'Análisis no encontrado o expirado.'
+        }, status=404)
+
+    payload = {
+        'success': True,
+        'job_id': str(job_id),
+        'status': job['status'],
+    }
+    if 'progress' in job:
+        # Lotes: progreso y estado de cada producto mientras se procesa
+        payload['progress'] = job['progress']
+        payload['items'] = job.get('items', [])
+    if job['status'] in ('done', 'failed'):
+        result = dict(job.get('result') or {})
+        result.pop('status', None)
+        payload['result'] = result
+    return JsonResponse(payload)
+
+
+@require_http_methods(["POST"])
+def analyze_batch(request):
+    """
+    Análisis en lote: varias URLs (product_urls, una por línea o repetido)
+    con la misma configuración de campaña. Se procesa como job en segundo
+    plano y el progreso se consulta en analysis_status.
+    """
+    logger = logging.getLogger(__name__)
+
+    if not request.user.is_authenticated:
+        return JsonResponse({
+            'success': False,
+            'error': 'Inicia sesión para usar el análisis en lote.'
+        }, status=401)
+
+    params = build_analysis_params(request.POST)
+    params['analysis_type'] = 'batch'
+    product_urls = parse_batch_urls(request.POST.getlist('product_urls'))
+    max_items = app_setting('BATCH_MAX_ITEMS', 25)
+
+    if not product_urls or not params['api_key']:
+        return JsonResponse({
+            'success': False,
+            'error': 'Faltan datos: al menos una URL de producto y la API key son obligatorias.'
+        }, status=400)
+    if len(product_urls) > max_items:
+        return JsonResponse({
+            'success': False,
+            'error': f'Máximo {max_items} productos por lote (recibidos {len(product_urls)}).'
         }, status=400)
 
-    # Guardar análisis
-    try:
-        analysis = AnalysisHistory.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            product_url=product_url,
-            product_title='Producto analizado',
-            product_description=None,
-            platform=platform,
-            target_audience=target_audience,
-            campaign_goal=campaign_goal,
-            budget='medium',
-            tone=tone,
-            analysis_type=analysis_type,
-            ai_response=ai_result['response'],
-            success=True
-        )
+    limit_response = _check_user_limits(request)
+    if limit_response is not None:
+        return limit_response
 
-        # Incrementar contadores SOLO después de análisis exitoso
-        if request.user.is_authenticated and analysis.success:
-            try:
-                # Incrementar SOLO una vez por análisis exitoso
-                incremented = request.user.profile.add_analysis_count_atomic()
-                if not incremented:
-                    logger.warning(f"⚠️ Análisis creado pero contador no incrementado para {request.user.username}")
-            except Exception as e:
-                logger.error(f"❌ Error incrementando contador: {str(e)}")
+    profile = request.user.profile
+    if profile.plan != 'premium' and profile.analyses_remaining < len(product_urls):
+        return JsonResponse({
+            'success': False,
+            'limit_reached': True,
+            'error': f'El lote tiene {len(product_urls)} productos y te quedan {profile.analyses_remaining} análisis este mes.',
+            'upgrade_url': '/upgrade/',
+            'remaining': profile.analyses_remaining,
+        }, status=429)
+
+    job_id = AnalysisJobQueue.enqueue_batch(
+        params, product_urls, user_id=request.user.id, owner=_get_request_identity(request)
+    )
+    logger.info(f"📦 Lote solicitado por {request.user.username}: {len(product_urls)} productos")
+    return JsonResponse({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'total': len(product_urls),
+        'status_url': reverse('analyzer:analysis_status', args=[job_id]),
+    }, status=202)
+
+
+def _sse_event(event, data):
+    """Formatea un evento Server-Sent Events con payload JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@require_http_methods(["POST"])
+def analyze_stream(request):
+    """
+    Crea un análisis enviando el texto de la IA por SSE a medida que se genera.
+    Al terminar guarda el ai_response completo en AnalysisHistory.
+    """
+    logger = logging.getLogger(__name__)
 
+    timer = StageTimer()
+    params = build_analysis_params(request.POST)
+    if not params['product_url'] or not params['api_key']:
         return JsonResponse({
-            'success': True,
-            'analysis_id': str(analysis.id),
-            'response': analysis.ai_response,
-            'product': {
-                'title': analysis.product_title,
-                'price': analysis.product_price,
-            },
-            # Estado de contador para refrescar UI en cliente
-            **({
-                'usage': {
-                    'this_month': request.user.profile.analyses_this_month,
-                    'limit': request.user.profile.analyses_limit_monthly,
-                    'remaining': request.user.profile.analyses_remaining,
-                    'plan': request.user.profile.plan
-                }
-            } if request.user.is_authenticated and hasattr(request.user, 'profile') else {})
-        })
-    except Exception as e:
-        logger.error(f"❌ Error guardando análisis: {str(e)}")
-        # Limpiar marca de idempotencia si falló creación
+            'success': False,
+            'error': 'Faltan datos: URL del producto y API key son obligatorias.'
+        }, status=400)
+
+    with timer.stage('limit_check'):
+        limit_response = _check_user_limits(request)
+    if limit_response is not None:
+        return limit_response
+
+    identity = _get_request_identity(request)
+    with timer.stage('dedupe'):
+        dedupe_key, existing = _acquire_dedupe(identity, params)
+    if existing is not None:
+        return _duplicate_response(dedupe_key, existing)
+
+    user_id = request.user.id if request.user.is_authenticated else None
+
+    def finish(product_data, ai_response, cached):
+        result = save_analysis(params, load_user(user_id), product_data, ai_response,
+                               dedupe_key=dedupe_key, cached=cached, timer=timer)
+        result.pop('status', None)
+        with timer.stage('serialization'):
+            event = _sse_event('done' if result['success'] else 'error', result)
+        finalize_timings(result, timer)
+        return event
+
+    def event_stream():
+        # Primer byte inmediato: el cliente sabe que el análisis arrancó
+        yield _sse_event('start', {'analysis_type': params['analysis_type']})
+
+        cached_result = get_cached_result(params)
+        flight = get_analysis_flight(params)
+        deadline = time.monotonic() + flight.wait_seconds
+
+        # Single-flight: si otra petición idéntica está generando, esperar su resultado
+        while cached_result is None and not flight.acquire():
+            if time.monotonic() >= deadline:
+                break
+            yield ': esperando análisis idéntico en curso\n\n'
+            with timer.stage('coalesced_wait'):
+                cached_result = flight.wait(lambda: get_cached_result(params, record_stats=False),
+                                            min(deadline, time.monotonic() + 5))
+            if cached_result is not None:
+                CacheManager.record_analysis_cache_event('coalesced')
+
+        if cached_result is None and flight.token:
+            # El líder anterior pudo terminar justo antes de tomar el lease
+            cached_result = get_cached_result(params, record_stats=False)
+
+        if cached_result is not None:
+            flight.release()
+            timer.set_provider(cached_result['provider'], cached_result['model'], cached=True)
+            yield _sse_event('chunk', {'text': cached_result['response']})
+            yield finish(cached_result['product_data'], cached_result['response'], cached=True)
+            return
+
         try:
-            cache.delete(dedupe_key)
-        except Exception:
-            pass
-        return JsonResponse({
-            'success': False, 
-            'error': f'No se pudo guardar el análisis: {str(e)}'
-        }, status=500)
+            with timer.stage('scrape'), fetch_owner(identity):
+                product_data = scrape_for_analysis(params)
+            if product_data:
+                yield _sse_event('product', product_data)
+
+            prompt = prepare_prompt(params, product_data, timer)
+            chunks = []
+            meta = {}
+            provider_ms = timer.stages_ms.get('provider', 0)
+            try:
+                # La etapa provider mide al generador, no al cliente que consume
+                stream = timer.measure_stream('provider', stream_and_generate(prompt, params['api_key'], meta=meta))
+                for chunk in stream:
+                    chunks.append(chunk)
+                    yield _sse_event('chunk', {'text': chunk})
+            except AIProviderError as e:
+                logger.error(f"❌ Error IA (stream): {str(e)}")
+                release_dedupe(dedupe_key)
+                yield _sse_event('error', {'success': False, 'error': str(e)})
+                return
+
+            if not chunks:
+                release_dedupe(dedupe_key)
+                yield _sse_event('error', {
+                    'success': False,
+                    'error': 'No se pudo generar una respuesta. Intenta de nuevo.'
+                })
+                return
+
+            ai_response = ''.join(chunks)
+            timer.set_provider(meta.get('provider'), meta.get('model'))
+            store_result(params, product_data, ai_response, (timer.stages_ms['provider'] - provider_ms) / 1000,
+                         provider=meta.get('provider'), model=meta.get('model'))
+        except Exception as e:
+            # Sin esto la marca de doble envío queda tomada y el stream se corta sin evento final
+            logger.error(f"❌ Error en análisis (stream): {str(e)}")
+            release_dedupe(dedupe_key)
+            yield _sse_event('error', {
+                'success': False,
+                'error': 'Error interno generando el análisis. Intenta de nuevo.'
+            })
+            return
+        finally:
+            flight.release()
+
+        yield finish(product_data, ai_response, cached=False)
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Evita buffering en proxies (nginx)
+    return response
 
 
 def history(request):
@@ -200,6 +430,7 @@ def history(request):
     return render(request, 'analyzer/history.html', context)
 
 
+@cached_response(timeout=300, tags=[CacheManager.PUBLIC_HISTORY_TAG])
 def public_history(request):
     """Historial público de análisis exitosos"""
     analyses = AnalysisHistory.objects.filter(success=True, is_public=True).order_by('-created_at')[:50]
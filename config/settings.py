@@ -253,7 +253,7 @@ if REDIS_URL:
     
     CACHES = {
         'default': {
-            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'BACKEND': 'analyzer.cache_backends.InstrumentedRedisCache',  # RedisCache con métricas por prefijo
             'LOCATION': REDIS_URL,
             'OPTIONS': {
                 'socket_timeout': 5,
@@ -280,7 +280,7 @@ else:
     
     CACHES = {
         'default': {
-            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'BACKEND': 'analyzer.cache_backends.InstrumentedFileBasedCache',  # FileBasedCache con métricas por prefijo
             'LOCATION': str(BASE_DIR / 'cache'),
             'TIMEOUT': 300,
             'OPTIONS': {
@@ -293,9 +293,68 @@ else:
 AFFILIATE_STRATEGIST_SETTINGS = {
     'MAX_ANALYSES_PER_DAY': 50,  # Límite diario para usuarios gratuitos
     'AI_TIMEOUT_SECONDS': 60,   # Timeout para llamadas de IA
-    'SCRAPING_TIMEOUT_SECONDS': 30,  # Timeout para scraping
+    'SCRAPING_TIMEOUT_SECONDS': 10,  # Tiempo total por página: conexión, reintentos y lectura del cuerpo
+    'SCRAPING_POOL_HOSTS': 20,   # Hosts con pool de conexiones keep-alive
+    'SCRAPING_POOL_SIZE_PER_HOST': 4,  # Conexiones máximas guardadas por host
+    'SCRAPING_RETRIES': 2,       # Reintentos de GET ante errores de conexión/5xx/429
+    'SCRAPING_BACKOFF_SECONDS': 0.3,  # Base del backoff exponencial (con jitter)
+    'SCRAPING_BACKOFF_MAX_SECONDS': 2,  # Espera máxima entre reintentos (Retry-After incluido solo si cabe en el timeout)
+    'SCRAPING_NEGATIVE_CACHE_SECONDS': {},  # TTL de fallos por tipo (timeout, dns, http_4xx...); ver CacheManager
+    'SCRAPING_HOST_BACKOFF_THRESHOLD': 3,  # Fallos seguidos de un host antes de enfriarlo
+    'SCRAPING_HOST_BACKOFF_BASE_SECONDS': 30,  # Primer enfriamiento; se duplica con cada fallo extra
+    'SCRAPING_HOST_BACKOFF_MAX_SECONDS': 900,  # Tope del enfriamiento por host
+    'SCRAPING_HOST_BACKOFF_WINDOW_SECONDS': 600,  # Ventana en la que se cuentan los fallos
+    'SCRAPING_HOST_RATE_PER_SECOND': 2,  # Ritmo de descargas por host, compartido entre workers (0 = sin límite)
+    'SCRAPING_HOST_BURST': 4,    # Descargas seguidas que admite un host antes de aplicar el ritmo
+    'SCRAPING_HOST_RATE_LIMITS': {},  # Por dominio: {'amazon.com': {'rate': 1, 'burst': 2}}
+    'SCRAPING_GLOBAL_CONCURRENCY': 16,  # Descargas simultáneas entre todos los workers
+    'SCRAPING_SCHEDULER_MAX_WAIT_SECONDS': 10,  # Espera máxima por un turno de descarga
+    'SCRAPING_STREAMING': True,  # Lee el HTML por fragmentos y corta al tener los campos
+    'SCRAPING_MAX_BYTES': 512 * 1024,  # Tope de bytes leídos por página en modo streaming
+    'SCRAPING_EXTRACTION_RULES': {},  # Reglas por dominio extra o que reemplazan las incluidas (None desactiva)
+    'SCRAPING_GENERIC_HOSTS_TRACKED': 100,  # Dominios sin regla que se cuentan por separado (se quedan los de más páginas)
+    'PRODUCT_SNAPSHOT_FRESH_HOURS': 6,  # Snapshot de producto reutilizable por todos los usuarios (0 = siempre scrapear)
+    'PRODUCT_PAGE_CACHE_ENTRIES': 500,  # Páginas con ETag/Last-Modified guardadas para revalidar (LRU)
     'MAX_COMPETITORS': 5,        # Máximo competidores en análisis
+    'COMPETITIVE_SCRAPE_DEADLINE_SECONDS': 15,  # Presupuesto para descargar producto + competidores
+    'SCRAPING_MAX_CONCURRENCY': 8,  # Descargas simultáneas por proceso
+    'SCRAPING_PER_HOST_CONCURRENCY': 2,  # Descargas simultáneas a un mismo host
+    'NEAR_CACHE_ENTRIES': 1000,  # Entradas del cache en memoria de cada proceso (LRU)
+    'NEAR_CACHE_MAX_STALENESS_SECONDS': 5,  # Máximo que un proceso sirve de memoria sin revisar la versión (0 = desactivado)
+    'CACHE_XFETCH_BETA': 1.0,    # Recálculo anticipado de claves calientes (>1 adelanta más, 0 = desactivado)
+    'CACHE_STALE_SECONDS': 300,  # Tiempo que se sirve un valor vencido mientras otro worker lo recalcula
+    'CACHE_RECOMPUTE_WAIT_SECONDS': 10,  # Espera por el recálculo de otro worker cuando no hay valor viejo
+    'CACHE_METRICS_FLUSH_SECONDS': 10,  # Cada cuánto cada proceso suma sus métricas de cache a los contadores compartidos
+    'RESPONSE_CACHE_BROTLI': True,  # Variante brotli de las respuestas cacheadas (si el paquete está instalado)
     'CACHE_ANALYSIS_HOURS': 24,  # Horas para cachear análisis similares
+    'ANALYSIS_JOB_WORKERS': 4,   # Hilos del pool de análisis en segundo plano
+    'ANALYSIS_JOB_TTL_SECONDS': 3600,  # Tiempo que se conserva el estado de un job
+    # Acepta keys 'fake-...' (proveedor local sin red). Solo con AI_FAKE_PROVIDER_ENABLED=True explícito
+    'AI_FAKE_PROVIDER_ENABLED': os.getenv('AI_FAKE_PROVIDER_ENABLED', 'False').lower() == 'true',
+    'AI_CLIENT_POOL_SIZE': 32,   # Clientes de IA cacheados por API key (LRU)
+    'AI_CLIENT_TTL_SECONDS': 1800,  # Vida máxima de un cliente cacheado
+    'SINGLE_FLIGHT_LEASE_SECONDS': 90,  # Lease del líder; expira si el worker muere
+    'SINGLE_FLIGHT_WAIT_SECONDS': 55,   # Espera máxima por un análisis idéntico en curso
+    'AI_HEDGE_DELAY_SECONDS': None,  # Si se define, lanza el proveedor de fallback en paralelo tras N s
+    'AI_PROVIDER_THREADS': 8,    # Hilos para llamadas a proveedores con deadline
+    'AI_GENERATION_MODE': 'single',  # 'staged': resumen de producto cacheado + estrategia
+    'PRODUCT_SUMMARY_CACHE_HOURS': 72,  # Vida del resumen de producto (modo staged)
+    'BATCH_MAX_ITEMS': 25,       # Productos máximos por análisis en lote
+    'BATCH_CONCURRENCY': 4,      # Productos procesados en paralelo dentro de un lote
+    # Circuit breaker por proveedor (y por API key para errores de cuota)
+    'AI_CIRCUIT_BREAKER': {
+        'window_size': 20,               # Últimas llamadas evaluadas
+        'min_calls': 5,                  # Mínimo de llamadas antes de abrir
+        'error_rate_threshold': 0.5,     # Abre con >= 50% de errores del proveedor
+        'slow_call_seconds': 30,         # Llamada considerada lenta
+        'slow_call_rate_threshold': 0.5, # Abre con >= 50% de llamadas lentas
+        'open_seconds': 30,              # Tiempo abierto antes de half-open
+        'half_open_probes': 1,           # Llamadas de prueba en half-open
+        'timeout_percentile': 0.95,      # Timeout adaptativo = p95 × multiplicador
+        'timeout_multiplier': 1.5,
+        'min_timeout': 5,
+        'quota_cooldown_seconds': 60,    # Pausa para una key con cuota agotada
+    },
 }
 
 # ✅ CONFIGURACIÓN DE DESARROLLO